@@ -0,0 +1,82 @@
+# bench_association.py
+# Micro-benchmark: IoU matrix + greedy association, Python loops vs NumPy kernel.
+# Jalankan: python bench_association.py [--sizes 10 50 100 200 500] [--repeat 5]
+import argparse
+import time
+import numpy as np
+
+from utils import iou, iou_matrix
+from tracker import greedy_match
+
+
+def loop_iou_matrix(dets, tracks):
+    """Reference: the old per-pair Python double loop."""
+    m = np.zeros((len(dets), len(tracks)), dtype=float)
+    for d, det in enumerate(dets):
+        for t, tr in enumerate(tracks):
+            m[d, t] = iou(det[:4], tr)
+    return m
+
+
+def loop_greedy(ious, threshold):
+    """Reference: the old sort-all-pairs greedy matcher."""
+    used_d, used_t, matches = set(), set(), []
+    pairs = [(ious[d, t], d, t) for d in range(ious.shape[0]) for t in range(ious.shape[1])]
+    pairs.sort(reverse=True, key=lambda x: x[0])
+    for val, d, t in pairs:
+        if d in used_d or t in used_t:
+            continue
+        if val >= threshold:
+            used_d.add(d); used_t.add(t)
+            matches.append((d, t))
+    return matches
+
+
+def make_scene(n, rng, width=1920, height=1080):
+    """n tracks plus n detections jittered around them (a crowded frame)."""
+    xy = rng.uniform(0, [width - 80, height - 160], size=(n, 2))
+    wh = rng.uniform([30, 60], [80, 160], size=(n, 2))
+    tracks = np.hstack([xy, xy + wh])
+    dets = tracks + rng.normal(0, 4, size=tracks.shape)
+    return dets, tracks
+
+
+def best_of(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def main():
+    ap = argparse.ArgumentParser(description="IoU + greedy association micro-benchmark")
+    ap.add_argument("--sizes", type=int, nargs="+", default=[10, 25, 50, 100, 200, 400, 800])
+    ap.add_argument("--repeat", type=int, default=5)
+    ap.add_argument("--threshold", type=float, default=0.3)
+    args = ap.parse_args()
+
+    rng = np.random.default_rng(0)
+    print(f"{'boxes':>6} {'loop ms':>10} {'numpy ms':>10} {'speedup':>8}")
+    for n in args.sizes:
+        dets, tracks = make_scene(n, rng)
+
+        def run_loop():
+            loop_greedy(loop_iou_matrix(dets, tracks), args.threshold)
+
+        def run_numpy():
+            greedy_match(iou_matrix(dets, tracks), args.threshold)
+
+        # sanity: same matches as the reference implementation
+        ref = loop_greedy(loop_iou_matrix(dets, tracks), args.threshold)
+        d_idx, t_idx = greedy_match(iou_matrix(dets, tracks), args.threshold)
+        assert sorted(ref) == sorted(zip(d_idx.tolist(), t_idx.tolist()))
+
+        t_loop = best_of(run_loop, max(1, args.repeat if n <= 200 else 1))
+        t_np = best_of(run_numpy, args.repeat)
+        print(f"{n:>6} {t_loop * 1e3:>10.2f} {t_np * 1e3:>10.3f} {t_loop / max(t_np, 1e-9):>7.0f}x")
+
+
+if __name__ == "__main__":
+    main()
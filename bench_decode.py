@@ -0,0 +1,76 @@
+# bench_decode.py
+# Decode benchmark: CPU time per delivered working-size frame, OpenCV vs PyAV paths.
+# Keyframes-only delivers fewer frames, so compare its total CPU (cpu s) for the same clip.
+# Jalankan: python bench_decode.py --video video/sample.mp4 [--frames 500] [--json out.json]
+import argparse
+import json
+import time
+import cv2
+
+from capture_backends import PyAVCapture
+from config import RTSP_FRAME_WIDTH, RTSP_FRAME_HEIGHT
+
+
+def run_case(name, cap, max_frames, resize_to=None):
+    """Read up to max_frames; returns per-frame CPU/wall cost of decode (+ resize)."""
+    if not cap.isOpened():
+        return {"case": name, "error": "cannot open"}
+    n = 0
+    shape = None
+    cpu0, wall0 = time.process_time(), time.perf_counter()
+    while n < max_frames:
+        ok, frame = cap.read()
+        if not ok:
+            break
+        if resize_to is not None and (frame.shape[1], frame.shape[0]) != resize_to:
+            frame = cv2.resize(frame, resize_to)
+        shape = frame.shape
+        n += 1
+    cpu, wall = time.process_time() - cpu0, time.perf_counter() - wall0
+    cap.release()
+    return {
+        "case": name,
+        "frames": n,
+        "cpu_s_total": round(cpu, 3),
+        "cpu_ms_per_frame": round(cpu * 1000.0 / max(n, 1), 3),
+        "wall_ms_per_frame": round(wall * 1000.0 / max(n, 1), 3),
+        "out_shape": None if shape is None else list(shape),
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser(description="OpenCV vs PyAV decode cost per frame")
+    ap.add_argument("--video", required=True, help="local video file")
+    ap.add_argument("--frames", type=int, default=500)
+    ap.add_argument("--width", type=int, default=RTSP_FRAME_WIDTH)
+    ap.add_argument("--height", type=int, default=RTSP_FRAME_HEIGHT)
+    ap.add_argument("--lowres", type=int, default=1, help="lowres level for the lowres case")
+    ap.add_argument("--json", help="write results as JSON")
+    args = ap.parse_args()
+
+    size = (args.width, args.height)
+    cases = [
+        ("opencv full decode + cv2.resize", lambda: cv2.VideoCapture(args.video), size),
+        ("pyav full decode + cv2.resize", lambda: PyAVCapture(args.video), size),
+        ("pyav decode -> working size bgr", lambda: PyAVCapture(args.video, out_size=size), None),
+        (f"pyav lowres={args.lowres} -> working size", lambda: PyAVCapture(args.video, out_size=size, lowres=args.lowres), None),
+        ("pyav keyframes only -> working size", lambda: PyAVCapture(args.video, out_size=size, keyframes_only=True), None),
+    ]
+    results = [run_case(name, make(), args.frames, resize) for name, make, resize in cases]
+
+    base = results[0].get("cpu_ms_per_frame")
+    print(f"{'case':<42} {'frames':>7} {'cpu s':>7} {'cpu ms/f':>9} {'wall ms/f':>10} {'vs opencv':>9}")
+    for r in results:
+        if "error" in r:
+            print(f"{r['case']:<42} {r['error']}")
+            continue
+        rel = f"{base / r['cpu_ms_per_frame']:.2f}x" if base and r["cpu_ms_per_frame"] else "-"
+        print(f"{r['case']:<42} {r['frames']:>7} {r['cpu_s_total']:>7.2f} {r['cpu_ms_per_frame']:>9.3f} {r['wall_ms_per_frame']:>10.3f} {rel:>9}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"video": args.video, "size": list(size), "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,340 @@
+# bench_pipeline.py
+# Benchmark pipeline deteksi/tracking yang reproducible (offline, tanpa RTSP/Streamlit):
+# - Detector.detect_batch: throughput per batch size dan resolusi
+# - Tracker.update: biaya per frame terhadap jumlah objek
+# - draw_tracks: biaya per frame terhadap jumlah objek
+# - end-to-end: frame/detik untuk 1, 4, 16 kamera simulasi (CameraPipeline + shared InferenceServer)
+# Fixture: frame sintetis (seed tetap) atau video rekaman (--video). Hasil ditulis sebagai JSON.
+# Jalankan: python bench_pipeline.py [--video video/sample.mp4] [--json bench.json] [--compare lama.json]
+#           python bench_pipeline.py --quick     (ukuran kecil, untuk cek cepat)
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import tempfile
+import subprocess
+import threading
+from datetime import datetime, timezone
+import cv2
+import numpy as np
+
+from tracker import Tracker
+from render import draw_tracks
+from config import (FRAME_WIDTH, FRAME_HEIGHT, RTSP_DETECT_EVERY, DETECTOR_BACKEND,
+                    INFER_BATCH_SIZE, TRACKER_MOTION_MODEL)
+
+
+def parse_size(text):
+    w, h = text.lower().split("x")
+    return int(w), int(h)
+
+
+def synthetic_frames(n, size, n_objects=8, seed=0):
+    """n BGR frames: textured background plus person-sized boxes moving across it."""
+    rng = np.random.default_rng(seed)
+    w, h = size
+    background = cv2.GaussianBlur(rng.integers(0, 255, (h, w, 3), dtype=np.uint8), (0, 0), 3)
+    pos = rng.uniform(0, [w * 0.8, h * 0.6], size=(n_objects, 2))
+    vel = rng.uniform(-3, 3, size=(n_objects, 2))
+    wh = rng.uniform([w * 0.04, h * 0.15], [w * 0.08, h * 0.3], size=(n_objects, 2))
+    frames = []
+    for _ in range(n):
+        frame = background.copy()
+        pos = np.clip(pos + vel, 0, [w - 1, h - 1])
+        for (x, y), (bw, bh) in zip(pos.astype(int), wh.astype(int)):
+            cv2.rectangle(frame, (x, y), (x + bw, y + bh), (40, 40, 160), -1)
+        frames.append(frame)
+    return frames
+
+
+def video_frames(path, n, size):
+    """Up to n frames of a recorded video, resized to size (looped if the clip is short)."""
+    cap = cv2.VideoCapture(path)
+    if not cap.isOpened():
+        raise RuntimeError(f"Tidak dapat membuka video {path}")
+    frames = []
+    while len(frames) < n:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        frames.append(cv2.resize(frame, size))
+    cap.release()
+    if not frames:
+        raise RuntimeError(f"Video kosong: {path}")
+    return [frames[i % len(frames)] for i in range(n)]
+
+
+def load_fixture(args, size, n):
+    if args.video:
+        return video_frames(args.video, n, size)
+    return synthetic_frames(n, size, seed=args.seed)
+
+
+def moving_scene(n_objects, n_frames, seed=0, width=FRAME_WIDTH, height=FRAME_HEIGHT):
+    """Per-frame (N,5) detections of n_objects moving boxes with jitter and 5% misses."""
+    rng = np.random.default_rng(seed)
+    xy = rng.uniform(0, [width - 60, height - 120], size=(n_objects, 2))
+    wh = rng.uniform([20, 40], [60, 120], size=(n_objects, 2))
+    vel = rng.uniform(-2, 2, size=(n_objects, 2))
+    out = []
+    for _ in range(n_frames):
+        xy = np.clip(xy + vel, 0, [width - 60, height - 120])
+        boxes = np.hstack([xy, xy + wh]) + rng.normal(0, 1.5, size=(n_objects, 4))
+        keep = rng.random(n_objects) > 0.05
+        conf = rng.uniform(0.4, 0.95, size=(n_objects, 1))
+        out.append(np.hstack([boxes, conf])[keep])
+    return out
+
+
+def timed(fn, repeat):
+    """(best, median) wall seconds of fn() over repeat runs."""
+    times = []
+    for _ in range(max(1, repeat)):
+        t0 = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t0)
+    return min(times), float(np.median(times))
+
+
+def bench_detector(args):
+    """Detector.detect_batch throughput for every (resolution, batch size)."""
+    from detector import Detector
+    try:
+        detector = Detector(shared=False)
+    except Exception as e:
+        return [{"error": str(e)}]
+    results = []
+    for size in args.resolutions:
+        frames = load_fixture(args, size, max(args.batch_sizes))
+        detector.detect_batch(frames[:1])   # warm-up (model load, allocator)
+        for bs in args.batch_sizes:
+            batch = frames[:bs]
+            try:
+                best, med = timed(lambda: detector.detect_batch(batch), args.repeat)
+            except Exception as e:
+                results.append({"resolution": list(size), "batch": bs, "error": str(e)})
+                continue
+            results.append({
+                "resolution": list(size),
+                "batch": bs,
+                "ms_per_batch": round(med * 1000, 3),
+                "ms_per_frame": round(med * 1000 / bs, 3),
+                "fps": round(bs / med, 1),
+                "best_fps": round(bs / best, 1),
+            })
+    return results
+
+
+def bench_tracker(args):
+    """Tracker.update cost per frame (detection every frame) against object count."""
+    results = []
+    for n in args.objects:
+        scene = moving_scene(n, args.track_frames, seed=args.seed)
+
+        def run():
+            tracker = Tracker()
+            for dets in scene:
+                tracker.update(dets)
+
+        best, med = timed(run, args.repeat)
+        tracker = Tracker()
+        for dets in scene:
+            tracker.update(dets)
+        results.append({
+            "objects": n,
+            "frames": len(scene),
+            "motion_model": TRACKER_MOTION_MODEL,
+            "us_per_update": round(med * 1e6 / len(scene), 2),
+            "best_us_per_update": round(best * 1e6 / len(scene), 2),
+            "live_tracks": len(tracker.ids),
+        })
+    return results
+
+
+def bench_draw(args):
+    """draw_tracks cost per frame (fresh copy of a working-size frame each call)."""
+    frame = load_fixture(args, (FRAME_WIDTH, FRAME_HEIGHT), 1)[0]
+    results = []
+    for n in args.objects:
+        tracker = Tracker()
+        for dets in moving_scene(n, 5, seed=args.seed):
+            tracker.update(dets)
+        reps = 50
+        copy_s, _ = timed(lambda: [frame.copy() for _ in range(reps)], args.repeat)
+        best, med = timed(lambda: [draw_tracks(frame.copy(), tracker) for _ in range(reps)], args.repeat)
+        results.append({
+            "objects": len(tracker.ids),
+            "us_per_frame": round(max(med - copy_s, 0.0) * 1e6 / reps, 2),
+            "best_us_per_frame": round(max(best - copy_s, 0.0) * 1e6 / reps, 2),
+        })
+    return results
+
+
+def bench_end_to_end(args):
+    """
+    N simulated cameras, one thread each running CameraPipeline.process + draw_tracks
+    over the fixture frames as fast as possible; detection goes through the shared
+    batched InferenceServer exactly as in live mode. Reports aggregate frames/sec.
+    """
+    from camera_worker import CameraPipeline
+    size = (args.source_width, args.source_height)
+    fixture = load_fixture(args, size, args.e2e_frames)
+    log_dir = tempfile.mkdtemp(prefix="bench_logs_")
+    results = []
+    for n_cams in args.cameras:
+        try:
+            pipes = [CameraPipeline(1000 + i, FRAME_WIDTH, FRAME_HEIGHT, args.detect_every,
+                                    os.path.join(log_dir, f"cam{i}.csv")) for i in range(n_cams)]
+        except Exception as e:
+            results.append({"cameras": n_cams, "error": str(e)})
+            continue
+        for pipe in pipes:
+            pipe.store = None   # keep the benchmark from writing to the detection store
+        done = [0] * n_cams
+        errors = []
+        start = threading.Barrier(n_cams + 1)
+
+        def run(i):
+            pipe = pipes[i]
+            start.wait()
+            try:
+                for k in range(args.e2e_frames):
+                    # cameras start at different offsets so they do not see identical frames
+                    proc, _, _ = pipe.process(fixture[(k + i * 7) % len(fixture)])
+                    draw_tracks(proc, pipe.tracker)
+                    done[i] += 1
+            except Exception as e:
+                errors.append(str(e))
+
+        threads = [threading.Thread(target=run, args=(i,), daemon=True) for i in range(n_cams)]
+        for th in threads:
+            th.start()
+        start.wait()
+        t0 = time.perf_counter()
+        for th in threads:
+            th.join()
+        elapsed = max(time.perf_counter() - t0, 1e-9)
+        total = sum(done)
+        entry = {
+            "cameras": n_cams,
+            "frames": total,
+            "elapsed_s": round(elapsed, 3),
+            "fps_total": round(total / elapsed, 1),
+            "fps_per_camera": round(total / elapsed / n_cams, 1),
+        }
+        if errors:
+            entry["error"] = errors[0]
+        results.append(entry)
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, timeout=5, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except Exception:
+        return None
+
+
+def environment(args):
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "numpy": np.__version__,
+        "opencv": cv2.__version__,
+        "backend": DETECTOR_BACKEND,
+        "infer_batch_size": INFER_BATCH_SIZE,
+        "fixture": args.video or f"synthetic(seed={args.seed})",
+    }
+
+
+# metric compared by --compare for every section (higher is better when True)
+KEYS = {
+    "detector": (("resolution", "batch"), "fps", True),
+    "tracker": (("objects",), "us_per_update", False),
+    "draw": (("objects",), "us_per_frame", False),
+    "end_to_end": (("cameras",), "fps_total", True),
+}
+
+
+def compare(old, new):
+    """Print new vs old for the rows present in both runs."""
+    print(f"\nvs {old['env'].get('commit')} ({old['env'].get('timestamp')})")
+    for section, (key_fields, metric, higher) in KEYS.items():
+        before = {tuple(str(r.get(k)) for k in key_fields): r for r in old.get(section, [])}
+        for row in new.get(section, []):
+            ref = before.get(tuple(str(row.get(k)) for k in key_fields))
+            if not ref or metric not in row or metric not in ref or not ref[metric]:
+                continue
+            ratio = row[metric] / ref[metric] if higher else ref[metric] / max(row[metric], 1e-9)
+            key = " ".join(f"{k}={row.get(k)}" for k in key_fields)
+            print(f"  {section:<10} {key:<30} {metric:<14} {ref[metric]:>10} -> {row[metric]:>10}  {ratio:.2f}x")
+
+
+def print_table(title, rows, fields):
+    print(f"\n{title}")
+    print("  " + " ".join(f"{f:>16}" for f in fields))
+    for r in rows:
+        if "error" in r:
+            print(f"  error: {r['error']}")
+            continue
+        print("  " + " ".join(f"{str(r.get(f)):>16}" for f in fields))
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Reproducible detection/tracking pipeline benchmark")
+    ap.add_argument("--video", help="recorded video fixture (default: synthetic frames)")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--repeat", type=int, default=5)
+    ap.add_argument("--resolutions", type=parse_size, nargs="+",
+                    default=[(640, 360), (1280, 720)], help="WxH for the detector benchmark")
+    ap.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 4, 8, 16])
+    ap.add_argument("--objects", type=int, nargs="+", default=[1, 10, 50, 100, 200])
+    ap.add_argument("--track-frames", type=int, default=300)
+    ap.add_argument("--cameras", type=int, nargs="+", default=[1, 4, 16])
+    ap.add_argument("--e2e-frames", type=int, default=200, help="frames per simulated camera")
+    ap.add_argument("--detect-every", type=int, default=RTSP_DETECT_EVERY)
+    ap.add_argument("--source-width", type=int, default=1280, help="simulated camera resolution")
+    ap.add_argument("--source-height", type=int, default=720)
+    ap.add_argument("--skip", nargs="*", default=[], choices=list(KEYS), help="sections to skip")
+    ap.add_argument("--quick", action="store_true", help="small sizes for a smoke run")
+    ap.add_argument("--json", default="bench_pipeline.json", help="output file ('-' = stdout)")
+    ap.add_argument("--compare", help="earlier JSON result to compare against")
+    args = ap.parse_args()
+    if args.quick:
+        args.repeat, args.resolutions, args.batch_sizes = 2, [(640, 360)], [1, 4]
+        args.objects, args.track_frames = [1, 50], 60
+        args.cameras, args.e2e_frames = [1, 4], 30
+
+    report = {"env": environment(args), "params": {
+        k: v for k, v in vars(args).items() if k not in ("json", "compare", "skip", "quick")}}
+    sections = [("detector", bench_detector, ("resolution", "batch", "ms_per_batch", "fps")),
+                ("tracker", bench_tracker, ("objects", "us_per_update", "live_tracks")),
+                ("draw", bench_draw, ("objects", "us_per_frame")),
+                ("end_to_end", bench_end_to_end, ("cameras", "frames", "fps_total", "fps_per_camera"))]
+    for name, fn, fields in sections:
+        if name in args.skip:
+            continue
+        report[name] = fn(args)
+        print_table(name, report[name], fields)
+
+    text = json.dumps(report, indent=2, default=list)
+    if args.json == "-":
+        print(text)
+    else:
+        with open(args.json, "w", encoding="utf-8") as f:
+            f.write(text)
+        print(f"\nhasil: {args.json}", file=sys.stderr)
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            compare(json.load(f), report)
+
+
+if __name__ == "__main__":
+    main()
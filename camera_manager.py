@@ -0,0 +1,310 @@
+# camera_manager.py
+import os
+import re
+import queue
+import time
+import logging
+import threading
+
+from config import (RTSP_FRAME_WIDTH, RTSP_FRAME_HEIGHT, RTSP_DETECT_EVERY,
+                    CAMERA_WORKER_MODE, CAMERA_LIST_FILE, CAMERA_VIEW_TIMEOUT, PREVIEW_ENABLED)
+from camera_worker import rtsp_worker, init_log_file, write_log_csv, camera_policy
+from rtsp_handler import BACKPRESSURE_POLICIES
+from preview import PreviewHub
+
+_URL_RE = re.compile(r"(rtsps?|https?)://\S+", re.IGNORECASE)
+
+
+def load_camera_list(path=CAMERA_LIST_FILE):
+    """
+    Read camera URLs from a text file, one per line; returns [(name, url), ...].
+    - lines without a stream URL (headers like "rtsp publik :", blanks, # comments) are skipped
+    - text before the URL on the same line is used as the camera name
+    """
+    cams = []
+    if not os.path.exists(path):
+        logging.warning(f"[CameraManager] camera list {path} not found")
+        return cams
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            m = _URL_RE.search(line)
+            if m is None:
+                continue
+            name = line[:m.start()].strip(" :-\t")
+            cams.append((name or None, m.group(0)))
+    return cams
+
+
+class Camera:
+    """State of one registered camera (worker handle, latest frame, log file)."""
+    def __init__(self, cam_id, url, name=None):
+        self.cam_id = cam_id
+        self.url = url
+        self.name = name or f"cam{cam_id}"
+        self.log_path = f"log_rtsp_cam{cam_id}.csv"
+        self.policy = camera_policy(cam_id)   # backpressure policy of the reader
+        self.frame_queue = queue.Queue(maxsize=1)
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.running = False
+        self.last_frame = None
+
+
+class _VisibleSignal:
+    """frame_ready handed to a worker: only wakes the display while the camera is on screen."""
+    def __init__(self, manager, cam_id):
+        self._manager = manager
+        self._cam_id = cam_id
+
+    def watched(self):
+        # on the dashboard grid, or someone subscribed to its preview stream
+        if self._cam_id in self._manager.visible:
+            return True
+        preview = self._manager.preview
+        return preview is not None and preview.viewers(self._cam_id) > 0
+
+    def set(self):
+        self._manager._notify(self._cam_id)
+
+
+class _View:
+    """Cameras one display session shows and the event that wakes its loop."""
+    def __init__(self, ready):
+        self.cams = frozenset()
+        self.ready = ready
+        self.seen = time.monotonic()
+
+
+class CameraManager:
+    """
+    Registry of N RTSP cameras with pool-wide start/stop.
+    - cameras run as rtsp_worker threads, in CameraProcessPool worker processes
+      when mode == "process", or as coroutines of one StreamSupervisor when
+      mode == "async" (fixed thread count for hundreds of cameras)
+    - every display session (a browser tab of the shared dashboard) has its own view:
+      set_visible(ids, session) / wait(timeout, session). A frame only wakes the sessions
+      showing that camera, and `visible` is the union of all views (what workers draw for).
+      Views not refreshed for CAMERA_VIEW_TIMEOUT are dropped; session None is frame_ready.
+    - latest() only touches the queues asked for, so a display loop costs O(visible cameras)
+    - page(n, per_page) returns the camera ids of one page of the grid
+    - preview (PREVIEW_ENABLED): PreviewHub with one shared JPEG encoder per camera
+      for MJPEG viewers (see preview.start_preview_server)
+    """
+    def __init__(self, mode=CAMERA_WORKER_MODE, width=RTSP_FRAME_WIDTH, height=RTSP_FRAME_HEIGHT,
+                 detect_every=RTSP_DETECT_EVERY):
+        self.mode = mode
+        self.width = width
+        self.height = height
+        self.detect_every = detect_every
+        self.cameras = {}             # cam_id -> Camera, in registration order
+        self.visible = frozenset()    # union of the cameras of every view
+        self._running = set()         # ids of started cameras (no scan of the whole registry)
+        self.frame_ready = threading.Event()
+        self._views = {None: _View(self.frame_ready)}   # session key -> _View
+        self._lock = threading.Lock()
+        self._lifecycle = threading.Lock()   # start/stop check-and-set (UI and restart threads)
+        self._pool = None
+        self._supervisor = None
+        self.preview = PreviewHub(self) if PREVIEW_ENABLED else None
+        if mode == "process":
+            from camera_pool import CameraProcessPool
+            self._pool = CameraProcessPool(width=width, height=height)
+        elif mode == "async":
+            from stream_supervisor import StreamSupervisor
+            self._supervisor = StreamSupervisor()
+        elif mode != "thread":
+            raise ValueError(f"Mode worker kamera tidak dikenal: {mode} (pilihan: thread, process, async)")
+
+    # ---- registry ----
+    def add(self, url, name=None, cam_id=None):
+        """Register a camera (not started); returns its id. Re-adding a known URL returns its id."""
+        with self._lock:
+            for cam in self.cameras.values():
+                if cam.url == url:
+                    return cam.cam_id
+            if cam_id is None:
+                cam_id = max(self.cameras, default=0) + 1
+            self.cameras[cam_id] = Camera(cam_id, url, name)
+            return cam_id
+
+    def load(self, path=CAMERA_LIST_FILE):
+        """Register every camera of a list file; returns the new/known ids."""
+        return [self.add(url, name) for name, url in load_camera_list(path)]
+
+    def remove(self, cam_id):
+        self.stop(cam_id)
+        with self._lock:
+            self.cameras.pop(cam_id, None)
+            for view in self._views.values():
+                view.cams = view.cams - {cam_id}
+            self._refresh_views()
+        if self.preview is not None:
+            self.preview.remove(cam_id)
+
+    # ---- lifecycle ----
+    def start(self, cam_id):
+        with self._lifecycle:
+            self._start(cam_id)
+
+    def _start(self, cam_id):
+        cam = self.cameras.get(cam_id)
+        if cam is None or cam.running:
+            return
+        init_log_file(cam.log_path)
+        # fresh event: a previous worker still winding down keeps its own (set) one
+        cam.stop_event = threading.Event()
+        signal = _VisibleSignal(self, cam_id)
+        if self._pool is not None:
+            self._pool.start_camera(cam_id, cam.url, cam.log_path, cam.frame_queue, signal,
+                                    detect_every=self.detect_every, policy=cam.policy)
+        elif self._supervisor is not None:
+            self._supervisor.add_camera(cam_id, cam.url, cam.log_path, cam.frame_queue, signal,
+                                        width=self.width, height=self.height,
+                                        detect_every=self.detect_every, policy=cam.policy)
+        else:
+            cam.thread = threading.Thread(
+                target=rtsp_worker,
+                args=(cam.url, cam_id, cam.log_path, self.width, self.height, self.detect_every,
+                      cam.stop_event, cam.frame_queue, signal, cam.policy),
+                daemon=True,
+                name=f"cam{cam_id}",
+            )
+            cam.thread.start()
+        cam.running = True
+        self._running.add(cam_id)
+        write_log_csv(cam.log_path, "INFO", "Start requested from UI")
+
+    def stop(self, cam_id):
+        with self._lifecycle:
+            self._stop(cam_id)
+
+    def _stop(self, cam_id):
+        cam = self.cameras.get(cam_id)
+        if cam is None or not cam.running:
+            return
+        cam.stop_event.set()
+        if self._pool is not None:
+            self._pool.stop_camera(cam_id)
+        if self._supervisor is not None:
+            self._supervisor.remove_camera(cam_id)
+        cam.running = False
+        self._running.discard(cam_id)
+        cam.last_frame = None
+        write_log_csv(cam.log_path, "INFO", "Stop requested from UI")
+
+    def set_policy(self, cam_id, policy):
+        """
+        Change the backpressure policy of a camera. A running camera is restarted in a
+        background thread, so the caller (the Streamlit script) never waits for the old
+        worker to exit.
+        """
+        if policy not in BACKPRESSURE_POLICIES:
+            raise ValueError(f"Policy backpressure tidak dikenal: {policy} (pilihan: {', '.join(BACKPRESSURE_POLICIES)})")
+        cam = self.cameras.get(cam_id)
+        if cam is None or cam.policy == policy:
+            return
+        cam.policy = policy
+        if cam.running:
+            threading.Thread(target=self._restart, args=(cam_id,), daemon=True,
+                             name=f"restart-cam{cam_id}").start()
+
+    def _restart(self, cam_id):
+        cam = self.cameras.get(cam_id)
+        if cam is None:
+            return
+        thread = cam.thread
+        self.stop(cam_id)
+        if thread is not None:
+            # one reader per camera: let the old worker close its stream first
+            thread.join(timeout=5.0)
+        self.start(cam_id)
+
+    def start_all(self):
+        for cam_id in list(self.cameras):
+            self.start(cam_id)
+
+    def stop_all(self):
+        for cam_id in list(self.cameras):
+            self.stop(cam_id)
+
+    def shutdown(self):
+        self.stop_all()
+        if self.preview is not None:
+            self.preview.close()
+        if self._pool is not None:
+            self._pool.shutdown()
+        if self._supervisor is not None:
+            self._supervisor.shutdown()
+
+    # ---- display ----
+    def running_ids(self):
+        return list(self._running)
+
+    def page(self, number, per_page):
+        """Camera ids on page `number` (0-based) and the page count."""
+        ids = list(self.cameras)
+        per_page = max(1, int(per_page))
+        pages = max(1, (len(ids) + per_page - 1) // per_page)
+        number = min(max(0, int(number)), pages - 1)
+        return ids[number * per_page:(number + 1) * per_page], pages
+
+    def _view(self, session):
+        # caller holds self._lock
+        view = self._views.get(session)
+        if view is None:
+            view = self._views[session] = _View(threading.Event())
+        view.seen = time.monotonic()
+        return view
+
+    def _refresh_views(self):
+        """Drop stale session views and recompute `visible`; caller holds self._lock."""
+        now = time.monotonic()
+        for key in [k for k, v in self._views.items()
+                    if k is not None and now - v.seen > CAMERA_VIEW_TIMEOUT]:
+            del self._views[key]
+        self.visible = frozenset().union(*(v.cams for v in self._views.values()))
+
+    def set_visible(self, cam_ids, session=None):
+        """Cameras shown by one display session (also keeps the session's view alive)."""
+        with self._lock:
+            self._view(session).cams = frozenset(cam_ids)
+            self._refresh_views()
+
+    def drop_view(self, session):
+        """Forget a display session (its cameras stop counting as visible)."""
+        with self._lock:
+            if session is not None and self._views.pop(session, None) is not None:
+                self._refresh_views()
+
+    def _notify(self, cam_id):
+        # a camera published a frame: wake the sessions that show it
+        if cam_id not in self.visible:
+            return
+        for view in list(self._views.values()):
+            if cam_id in view.cams:
+                view.ready.set()
+
+    def latest(self, cam_id):
+        """Newest annotated BGR frame of a camera (None if nothing yet); non-blocking."""
+        cam = self.cameras.get(cam_id)
+        if cam is None:
+            return None
+        try:
+            cam.last_frame = cam.frame_queue.get_nowait()
+        except queue.Empty:
+            pass
+        return cam.last_frame
+
+    def wait(self, timeout=None, session=None):
+        """Block until a camera of this session's view published a frame (True) or timeout (False)."""
+        with self._lock:
+            view = self._view(session)
+            self._refresh_views()
+        ready = view.ready.wait(timeout)
+        # clear before the caller drains: a frame put after this point sets it again
+        view.ready.clear()
+        view.seen = time.monotonic()
+        return ready
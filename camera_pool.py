@@ -0,0 +1,380 @@
+# camera_pool.py
+import os
+import time
+import queue
+import logging
+import threading
+import multiprocessing as mp
+from multiprocessing import shared_memory
+import cv2
+import numpy as np
+
+from config import (RTSP_FRAME_WIDTH, RTSP_FRAME_HEIGHT, RTSP_DETECT_EVERY,
+                    CAMERA_PROCESS_GROUP_SIZE, CAMERA_PROCESS_MAX, CAMERA_PROCESS_THREADS,
+                    CAMERA_RESTART_BACKOFF_MAX, FRAME_WAIT_TIMEOUT, METRICS_PORT)
+from metrics import REGISTRY
+
+
+class SharedFrameBuffer:
+    """
+    Latest-frame mailbox in shared memory (one per camera slot).
+    - the worker process writes with put_nowait(); it has the queue.Queue methods
+      rtsp_worker uses, so rtsp_worker runs unchanged inside the process
+    - the parent waits with wait() and copies the frame out with read()
+    - the frame is guarded by a version counter (seqlock: odd while a write is in
+      progress, readers retry torn copies), not by the cross-process lock, which is
+      only taken briefly to notify; every acquire has a timeout, and renew() replaces
+      the Condition before a crashed worker is respawned
+    Created in the parent and handed to the worker process as a Process argument.
+    """
+    def __init__(self, shape, ctx):
+        self.shape = tuple(shape)
+        nbytes = int(np.prod(self.shape))
+        self._shm = shared_memory.SharedMemory(create=True, size=8 + nbytes)
+        self._owner = True
+        self.renew(ctx)
+        self._attach()
+        self._version[0] = 0
+
+    def renew(self, ctx):
+        """New Condition (a worker killed while notifying may have left the old lock held)."""
+        self._cond = ctx.Condition(ctx.Lock())
+        version = getattr(self, "_version", None)
+        if version is not None and version[0] % 2:
+            version[0] += 1            # killed mid-write: close the torn version
+
+    def _attach(self):
+        self._version = np.ndarray((1,), dtype=np.int64, buffer=self._shm.buf, offset=0)
+        self._frame = np.ndarray(self.shape, dtype=np.uint8, buffer=self._shm.buf, offset=8)
+
+    def __getstate__(self):
+        return {"name": self._shm.name, "shape": self.shape, "cond": self._cond}
+
+    def __setstate__(self, state):
+        self.shape = state["shape"]
+        self._cond = state["cond"]
+        self._shm = shared_memory.SharedMemory(name=state["name"])
+        self._owner = False
+        self._attach()
+
+    @property
+    def seq(self):
+        return int(self._version[0]) // 2
+
+    # --- writer side (worker process), queue.Queue compatible ---
+    def full(self):
+        return False
+
+    def get_nowait(self):
+        raise queue.Empty
+
+    def put_nowait(self, frame):
+        if frame.shape != self.shape:
+            frame = cv2.resize(frame, (self.shape[1], self.shape[0]))
+        self._version[0] += 1          # odd: write in progress
+        np.copyto(self._frame, frame)
+        self._version[0] += 1
+        cond = self._cond
+        if cond.acquire(timeout=FRAME_WAIT_TIMEOUT):
+            try:
+                cond.notify_all()
+            finally:
+                cond.release()
+
+    # --- reader side (parent) ---
+    def wait(self, after, timeout=None):
+        """Block until seq > after (True) or timeout (False)."""
+        if self.seq > after:
+            return True
+        cond = self._cond          # renew() may swap it while we wait
+        if not cond.acquire(timeout=FRAME_WAIT_TIMEOUT if timeout is None else timeout):
+            return False
+        try:
+            return cond.wait_for(lambda: self.seq > after, timeout)
+        finally:
+            cond.release()
+
+    def read(self, after=-1, retries=3):
+        """Return (seq, copy of the frame) if newer than `after`, else (after, None)."""
+        for _ in range(retries):
+            version = int(self._version[0])
+            if version // 2 <= after:
+                return after, None
+            if version % 2 == 0:
+                frame = self._frame.copy()
+                if int(self._version[0]) == version:
+                    return version // 2, frame
+            time.sleep(0.001)   # overwritten while copying: retry
+        return after, None
+
+    def reset(self):
+        self._version[0] = 0
+
+    def close(self):
+        self._version = self._frame = None
+        try:
+            self._shm.close()
+            if self._owner:
+                self._shm.unlink()
+        except Exception:
+            pass
+
+
+def _process_main(index, commands, stop_event, slots, threads):
+    """Entry point of a worker process: runs rtsp_worker threads for its camera group."""
+    # keep every process on few native threads, otherwise N processes oversubscribe the cores
+    if threads:
+        for var in ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS"):
+            os.environ[var] = str(threads)
+        cv2.setNumThreads(int(threads))
+    from camera_worker import rtsp_worker
+    from metrics import start_metrics_server
+    # metrics of this process's cameras: one endpoint per worker process
+    start_metrics_server(METRICS_PORT + 1 + index)
+
+    workers = {}  # slot -> (thread, stop event)
+    while not stop_event.is_set():
+        try:
+            cmd = commands.get(timeout=FRAME_WAIT_TIMEOUT)
+        except queue.Empty:
+            continue
+        op, slot = cmd[0], cmd[1]
+        if slot in workers:
+            th, ev = workers.pop(slot)
+            ev.set()
+            th.join(timeout=5.0)
+        if op == "start":
+            spec = cmd[2]
+            ev = threading.Event()
+            th = threading.Thread(
+                target=rtsp_worker,
+                args=(spec["url"], spec["cam_id"], spec["log_path"], spec["width"], spec["height"],
+                      spec["detect_every"], ev, slots[slot], None, spec.get("policy")),
+                daemon=True,
+                name=f"cam{spec['cam_id']}",
+            )
+            workers[slot] = (th, ev)
+            th.start()
+
+    for th, ev in workers.values():
+        ev.set()
+    for th, _ in workers.values():
+        th.join(timeout=5.0)
+
+
+class _WorkerProcess:
+    """Parent-side handle of one worker process and its camera slots."""
+    def __init__(self, ctx, index, group_size, shape, threads):
+        self.ctx = ctx
+        self.index = index
+        self.threads = threads
+        self.slots = [SharedFrameBuffer(shape, ctx) for _ in range(group_size)]
+        self.cams = {}          # slot -> camera spec
+        self.proc = None
+        self.commands = None
+        self.stop_event = None
+        self.restarts = 0
+        self.next_restart = 0.0
+        self.started_at = 0.0
+
+    def free_slot(self):
+        for i in range(len(self.slots)):
+            if i not in self.cams:
+                return i
+        return None
+
+    def spawn(self):
+        self.started_at = time.monotonic()
+        self.commands = self.ctx.Queue()
+        self.stop_event = self.ctx.Event()
+        self.proc = self.ctx.Process(
+            target=_process_main,
+            args=(self.index, self.commands, self.stop_event, self.slots, self.threads),
+            daemon=True,
+            name=f"camera-worker-{self.index}",
+        )
+        self.proc.start()
+        for slot, spec in self.cams.items():
+            self.commands.put(("start", slot, spec))
+
+    def alive(self):
+        return self.proc is not None and self.proc.is_alive()
+
+    def detach(self):
+        """Signal the process to stop and forget it (join it with join_process, outside locks)."""
+        proc, self.proc = self.proc, None
+        if proc is not None:
+            self.stop_event.set()
+        return proc
+
+    def stop(self, timeout=5.0):
+        join_process(self.detach(), timeout)
+
+
+def join_process(proc, timeout=5.0):
+    """Join a stopping worker process, terminate it if it does not exit in time."""
+    if proc is None:
+        return
+    proc.join(timeout=timeout)
+    if proc.is_alive():
+        proc.terminate()
+        proc.join(timeout=1.0)
+
+
+class CameraProcessPool:
+    """
+    Runs RTSP cameras in worker processes instead of threads of the UI process.
+    - each process hosts up to group_size cameras (rtsp_worker threads) and loads its
+      own detector, so decode/resize/track/draw of different groups never share a GIL
+    - annotated frames come back through SharedFrameBuffer (shared memory, no pickling);
+      a relay thread per camera copies them into the caller's frame_queue and sets
+      frame_ready, exactly like a thread-mode rtsp_worker does
+    - a supervisor thread restarts crashed processes (exponential backoff) and
+      re-sends their cameras
+    """
+    def __init__(self, group_size=CAMERA_PROCESS_GROUP_SIZE, max_processes=CAMERA_PROCESS_MAX,
+                 width=RTSP_FRAME_WIDTH, height=RTSP_FRAME_HEIGHT, threads=CAMERA_PROCESS_THREADS):
+        self.ctx = mp.get_context("spawn")
+        self.group_size = max(1, int(group_size))
+        self.max_processes = int(max_processes) or (os.cpu_count() or 1)
+        self.shape = (int(height), int(width), 3)
+        self.threads = threads
+        self._procs = []
+        self._cams = {}        # cam_id -> (worker process, slot, relay stop event)
+        self._lock = threading.Lock()
+        self._running = True
+        self.stats = {"restarts": 0, "frames": 0}
+        self._supervisor = threading.Thread(target=self._supervise, daemon=True)
+        self._supervisor.start()
+
+    def _pick_process(self):
+        for wp in self._procs:
+            slot = wp.free_slot()
+            if slot is not None:
+                return wp, slot
+        if len(self._procs) >= self.max_processes:
+            raise RuntimeError(f"Semua {self.max_processes} proses worker penuh "
+                               f"({self.group_size} kamera per proses)")
+        wp = _WorkerProcess(self.ctx, len(self._procs), self.group_size, self.shape, self.threads)
+        self._procs.append(wp)
+        return wp, 0
+
+    def start_camera(self, cam_id, url, log_path, frame_queue=None, frame_ready=None,
+                     detect_every=RTSP_DETECT_EVERY, policy=None):
+        """Start (or restart) camera cam_id in a worker process."""
+        self.stop_camera(cam_id)
+        spec = {"cam_id": cam_id, "url": url, "log_path": log_path, "width": self.shape[1],
+                "height": self.shape[0], "detect_every": detect_every, "policy": policy}
+        with self._lock:
+            wp, slot = self._pick_process()
+            wp.slots[slot].reset()
+            wp.cams[slot] = spec
+            if not wp.alive():
+                wp.spawn()
+            else:
+                wp.commands.put(("start", slot, spec))
+            relay_stop = threading.Event()
+            self._cams[cam_id] = (wp, slot, relay_stop)
+        if frame_queue is not None:
+            threading.Thread(target=self._relay,
+                             args=(wp.slots[slot], frame_queue, frame_ready, relay_stop, f"cam{cam_id}"),
+                             daemon=True).start()
+        logging.info(f"[CameraProcessPool] cam{cam_id} -> process {wp.index} slot {slot}")
+
+    def stop_camera(self, cam_id):
+        proc = None
+        with self._lock:
+            entry = self._cams.pop(cam_id, None)
+            if entry is None:
+                return
+            wp, slot, relay_stop = entry
+            relay_stop.set()
+            wp.cams.pop(slot, None)
+            if wp.alive():
+                wp.commands.put(("stop", slot))
+            if not wp.cams:
+                proc = wp.detach()
+        # joining takes up to seconds: never under the lock other cameras and the supervisor need
+        join_process(proc)
+
+    def _relay(self, buf, frame_queue, frame_ready, stop, label):
+        """Copy new frames from shared memory into the UI queue (latest only)."""
+        last = 0
+        while not stop.is_set() and self._running:
+            if not buf.wait(last, timeout=FRAME_WAIT_TIMEOUT):
+                continue
+            prev = last
+            last, frame = buf.read(last)
+            if frame is None:
+                continue
+            if prev and last - prev > 1:
+                # overwritten in shared memory before the relay copied them
+                REGISTRY.inc(label, "dropped_display", last - prev - 1)
+            try:
+                if frame_queue.full():
+                    try:
+                        frame_queue.get_nowait()
+                        REGISTRY.inc(label, "dropped_display")
+                    except queue.Empty:
+                        pass
+                frame_queue.put_nowait(frame)
+                self.stats["frames"] += 1
+                if frame_ready is not None:
+                    frame_ready.set()
+            except Exception:
+                pass
+
+    def _supervise(self):
+        while self._running:
+            time.sleep(1.0)
+            with self._lock:
+                for wp in self._procs:
+                    now = time.monotonic()
+                    if wp.alive():
+                        # a long healthy run ends the crash streak: backoff starts small again
+                        if wp.restarts and now - wp.started_at >= CAMERA_RESTART_BACKOFF_MAX:
+                            wp.restarts = 0
+                        continue
+                    if not wp.cams:
+                        continue
+                    if wp.proc is not None:
+                        # died while it still had cameras -> schedule restart with backoff
+                        logging.warning(f"[CameraProcessPool] process {wp.index} exited "
+                                        f"(code {wp.proc.exitcode}), restarting")
+                        wp.proc = None
+                        wp.next_restart = now + min(CAMERA_RESTART_BACKOFF_MAX, 2.0 ** wp.restarts)
+                    if now >= wp.next_restart:
+                        wp.restarts += 1
+                        self.stats["restarts"] += 1
+                        # the dead process may have held a slot lock: fresh ones for the new process
+                        for buf in wp.slots:
+                            buf.renew(self.ctx)
+                        try:
+                            wp.spawn()
+                        except Exception as e:
+                            logging.exception(f"[CameraProcessPool] respawn failed: {e}")
+                            wp.proc = None
+                            wp.next_restart = now + CAMERA_RESTART_BACKOFF_MAX
+
+    def cameras(self):
+        with self._lock:
+            return {cam_id: {"process": wp.index, "slot": slot, "alive": wp.alive(), "restarts": wp.restarts}
+                    for cam_id, (wp, slot, _) in self._cams.items()}
+
+    def shutdown(self):
+        """Stop every camera and worker process and free the shared memory."""
+        self._running = False
+        with self._lock:
+            for _, _, relay_stop in self._cams.values():
+                relay_stop.set()
+            self._cams.clear()
+            procs, self._procs = self._procs, []
+            for wp in procs:
+                wp.cams.clear()
+            stopping = [wp.detach() for wp in procs]
+        for proc in stopping:
+            join_process(proc)
+        for wp in procs:
+            for buf in wp.slots:
+                buf.close()
+        logging.info("[CameraProcessPool] shutdown")
@@ -0,0 +1,280 @@
+# camera_worker.py
+import time
+import queue
+import cv2
+import numpy as np
+from datetime import datetime
+
+from detector import Detector
+from tracker import Tracker
+from rtsp_handler import RTSPStream
+from scheduler import DetectionScheduler
+from motion_gate import MotionGate
+from utils import scale_boxes, redact_url
+from render import draw_tracks
+from log_writer import get_log_writer
+from detection_store import get_detection_store, assign_track_ids
+from metrics import REGISTRY
+from config import (MOTION_GATE_ENABLED, CAMERA_ROIS, TILE_ENABLED, FRAME_WAIT_TIMEOUT, RENDER_SKIP_UNWATCHED,
+                    DETECTION_STORE_ENABLED, RTSP_BACKPRESSURE_POLICY, CAMERA_BACKPRESSURE,
+                    RTSP_OVERLOAD_WINDOW, RTSP_OVERLOAD_DROP_RATIO, RTSP_OVERLOAD_AGE)
+
+# -------------------- helpers: logging --------------------
+# rows go through the background CsvLogWriter: callers never touch the disk
+def init_log_file(path):
+    get_log_writer().touch(path)
+
+def write_log_csv(path, level, message):
+    get_log_writer().write(path, [datetime.now().strftime("%Y-%m-%d %H:%M:%S"), level, message])
+
+# -------------------- utility: normalize detections --------------------
+def normalize_detections(dets):
+    """
+    Ensure detections are a numpy array with shape (N,5) where each row is [x1,y1,x2,y2,conf].
+    If dets is None or empty, return np.zeros((0,5), dtype=float).
+    """
+    if dets is None:
+        return np.zeros((0,5), dtype=float)
+    if isinstance(dets, np.ndarray):
+        if dets.size == 0:
+            return np.zeros((0,5), dtype=float)
+        return dets
+    # if list of boxes -> try convert
+    try:
+        arr = np.asarray(dets)
+        if arr.ndim == 1 and arr.size == 0:
+            return np.zeros((0,5), dtype=float)
+        # If shape (N,5) or (N,4) handle
+        if arr.ndim == 2 and arr.shape[1] >= 5:
+            return arr[:, :5].astype(float)
+        elif arr.ndim == 2 and arr.shape[1] == 4:
+            # no conf column: append conf=1.0
+            confs = np.ones((arr.shape[0],1), dtype=float)
+            return np.hstack([arr.astype(float), confs])
+        else:
+            # fallback: empty
+            return np.zeros((0,5), dtype=float)
+    except Exception:
+        return np.zeros((0,5), dtype=float)
+
+# -------------------- backpressure: per-camera policy and overload flag --------------------
+def camera_policy(cam_id):
+    """Backpressure policy of a camera (CAMERA_BACKPRESSURE override or the default)."""
+    return CAMERA_BACKPRESSURE.get(cam_id, RTSP_BACKPRESSURE_POLICY)
+
+
+class OverloadMonitor:
+    """
+    Evaluates every `window` delivered frames whether a camera keeps up:
+    overloaded when the dropped fraction exceeds drop_ratio or the p95 frame age
+    (capture -> ready for display) exceeds max_age seconds.
+    Publishes the gauges overloaded / drop_ratio and logs state changes.
+    """
+    def __init__(self, label, log_path, window=RTSP_OVERLOAD_WINDOW, drop_ratio=RTSP_OVERLOAD_DROP_RATIO,
+                 max_age=RTSP_OVERLOAD_AGE):
+        self.label = label
+        self.log_path = log_path
+        self.window = max(1, int(window))
+        self.drop_ratio = drop_ratio
+        self.max_age = max_age
+        self.overloaded = False
+        self._delivered = 0
+        self._dropped = 0
+        self._ages = []
+
+    def update(self, dropped, age=None):
+        """One delivered frame, `dropped` frames lost before it, its age in seconds."""
+        self._delivered += 1
+        self._dropped += dropped
+        if age is not None:
+            self._ages.append(age)
+        if self._delivered < self.window:
+            return self.overloaded
+        ratio = self._dropped / (self._delivered + self._dropped)
+        age_p95 = float(np.percentile(self._ages, 95)) if self._ages else 0.0
+        overloaded = ratio > self.drop_ratio or age_p95 > self.max_age
+        REGISTRY.set_gauge(self.label, "drop_ratio", round(ratio, 4))
+        REGISTRY.set_gauge(self.label, "overloaded", int(overloaded))
+        if overloaded != self.overloaded:
+            write_log_csv(self.log_path, "WARNING" if overloaded else "INFO",
+                          f"{'Overload' if overloaded else 'Recovered'}: drop {ratio:.0%}, "
+                          f"frame age p95 {age_p95 * 1000:.0f} ms")
+        self.overloaded = overloaded
+        self._delivered = self._dropped = 0
+        self._ages = []
+        return overloaded
+
+def is_watched(frame_ready):
+    """False only when the display says nobody looks at this camera (boxes need not be drawn)."""
+    if not RENDER_SKIP_UNWATCHED or frame_ready is None:
+        return True
+    watched = getattr(frame_ready, "watched", None)
+    return watched is None or watched()
+
+def publish_frame(frame_queue, frame, frame_ready=None, label=None):
+    """Put an annotated frame into the display queue, replacing an unread one (counted)."""
+    try:
+        if frame_queue.full():
+            try:
+                frame_queue.get_nowait()
+                # the display never showed it
+                if label is not None:
+                    REGISTRY.inc(label, "dropped_display")
+            except queue.Empty:
+                pass
+        frame_queue.put_nowait(frame)
+        if frame_ready is not None:
+            frame_ready.set()
+    except Exception:
+        # ignore queue errors
+        pass
+
+# -------------------- per-camera pipeline (no UI, no drawing) --------------------
+class CameraPipeline:
+    """
+    Detection + tracking state of one camera, shared by rtsp_worker and the headless runner.
+    process(frame) -> (proc, dets, tracks)
+    - proc: frame resized to (width, height), our own writable array
+    - dets: (N,5) detections in proc coordinates, or None when no detection ran
+    - tracks: Track views after the tracker update
+    Detections (with the id of the track they belong to) also go to the Parquet
+    detection store when DETECTION_STORE_ENABLED.
+    """
+    def __init__(self, cam_id, width, height, detect_every, log_path):
+        # detector submits to the shared batched InferenceServer (one model for all cameras);
+        # tracker stays per camera
+        self.cam_id = cam_id
+        self.label = f"cam{cam_id}"   # metrics label, same as the RTSPStream name
+        self.width = width
+        self.height = height
+        self.log_path = log_path
+        self.detector = Detector()
+        self.tracker = Tracker()
+        self.scheduler = DetectionScheduler(detect_every, name=f"cam{cam_id}")
+        self.gate = MotionGate(name=self.label) if MOTION_GATE_ENABLED else None
+        self.rois = CAMERA_ROIS.get(cam_id)
+        self.store = get_detection_store() if DETECTION_STORE_ENABLED else None
+        self.frame_count = 0
+
+    def process(self, frame):
+        self.frame_count += 1
+        REGISTRY.inc(self.label, "frames")
+        # resize for processing (keep BGR)
+        t0 = time.perf_counter()
+        try:
+            proc = cv2.resize(frame, (self.width, self.height))
+        except Exception:
+            proc = frame.copy()
+        REGISTRY.observe(self.label, "resize", time.perf_counter() - t0)
+
+        # detection on frames chosen by the adaptive scheduler, unless nothing moved
+        detect_now = self.scheduler.should_detect()
+        gated = detect_now and self.gate is not None and not self.gate.should_infer(proc)
+        if gated:
+            detect_now = False
+        latency = None
+        if detect_now:
+            t0 = time.monotonic()
+            try:
+                if TILE_ENABLED:
+                    # tiles of the full-resolution frame, boxes scaled back to proc size
+                    raw = scale_boxes(self.detector.detect_tiled(frame, rois=self.rois), frame.shape, proc.shape)
+                else:
+                    raw = self.detector.detect(proc, rois=self.rois)
+            except Exception as e:
+                raw = None
+                write_log_csv(self.log_path, "ERROR", f"Detect error: {str(e)}")
+            latency = time.monotonic() - t0
+            REGISTRY.observe(self.label, "detect", latency)
+            dets = normalize_detections(raw)
+            write_log_csv(self.log_path, "DETECTION", f"Frame {self.frame_count} - {len(dets)} objek")
+        else:
+            # no detection on this frame: tracker predicts track motion
+            dets = None
+
+        t0 = time.perf_counter()
+        try:
+            tracks = self.tracker.update(dets, {"img_shape": proc.shape, "img_size": proc.shape[:2]})
+        except Exception as e:
+            tracks = []
+            write_log_csv(self.log_path, "ERROR", f"Tracker update error: {e}")
+        REGISTRY.observe(self.label, "track", time.perf_counter() - t0)
+
+        if self.store is not None and dets is not None and len(dets):
+            track_ids = assign_track_ids(dets, self.tracker.ids, self.tracker.boxes)
+            self.store.add(self.cam_id, self.frame_count, dets, track_ids)
+
+        if detect_now or gated:
+            self.scheduler.report(latency, self.tracker, motion=self.gate.level if self.gate else None)
+        if self.gate is not None and self.frame_count % 1000 == 0:
+            write_log_csv(self.log_path, "MOTION", f"Gate metrics: {self.gate.metrics()}")
+        return proc, dets, tracks
+
+    def close(self):
+        self.scheduler.close()
+
+
+# -------------------- RTSP worker (no Streamlit calls inside) --------------------
+def rtsp_worker(rtsp_url, cam_id, log_path, width, height, detect_every, stop_event, frame_queue,
+                frame_ready=None, policy=None):
+    """
+    Background worker for RTSP camera (runs in separate thread).
+    Does NOT call any st.* functions — only writes logs and puts frames into frame_queue.
+    Blocks until the reader publishes a new frame; sets frame_ready after each put.
+    policy: backpressure policy of the reader (None = camera_policy(cam_id)).
+    """
+    pipeline = CameraPipeline(cam_id, width, height, detect_every, log_path)
+    policy = policy or camera_policy(cam_id)
+
+    # create RTSP reader (uses your rtsp_handler)
+    try:
+        rtsp = RTSPStream(rtsp_url, name=pipeline.label, policy=policy)
+    except Exception as e:
+        write_log_csv(log_path, "ERROR", f"Failed to create RTSPStream: {e}")
+        return
+
+    last_seq = 0
+    monitor = OverloadMonitor(pipeline.label, log_path)
+    if hasattr(frame_queue, "qsize"):
+        REGISTRY.register_gauge(pipeline.label, "queue_depth", frame_queue.qsize)
+
+    # init log file and write start info
+    init_log_file(log_path)
+    write_log_csv(log_path, "INFO",
+                  f"RTSP worker started for cam{cam_id}: {redact_url(rtsp_url)} (backpressure {policy})")
+
+    while not stop_event.is_set():
+        # wait for the next decoded frame, then borrow it (read-only, pinned, no copy)
+        with rtsp.borrow(after=last_seq, timeout=FRAME_WAIT_TIMEOUT) as (seq, frame):
+            if frame is None:
+                # timeout (no frame / disconnect): re-check stop_event
+                continue
+            # frames the reader decoded but this worker never saw (counted by the stream)
+            dropped = seq - last_seq - 1 if last_seq else 0
+            last_seq = seq
+            captured = rtsp.captured_at(seq)
+            proc, _, _ = pipeline.process(frame)
+
+        # off screen: publish the bare frame (logs/tracks still run), draw when watched
+        annotated = proc
+        if is_watched(frame_ready):
+            with REGISTRY.timer(pipeline.label, "draw"):
+                annotated = draw_tracks(proc, pipeline.tracker)
+
+        # put latest annotated frame into queue (replace old if full)
+        publish_frame(frame_queue, annotated, frame_ready, pipeline.label)
+
+        # end-to-end age: capture -> annotated frame ready for display
+        age = time.monotonic() - captured if captured is not None else None
+        if age is not None:
+            REGISTRY.observe(pipeline.label, "frame_age", age)
+        monitor.update(dropped, age)
+
+    # cleanup
+    REGISTRY.unregister(pipeline.label)
+    pipeline.close()
+    try:
+        rtsp.stop()
+    except Exception:
+        pass
+    write_log_csv(log_path, "INFO", f"RTSP worker stopped for cam{cam_id}")
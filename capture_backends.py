@@ -0,0 +1,97 @@
+# capture_backends.py
+import logging
+import cv2
+import numpy as np
+
+from config import (RTSP_CAPTURE_BACKEND, RTSP_DECODE_TO_WORKING_SIZE, RTSP_DECODE_KEYFRAMES_ONLY,
+                    RTSP_DECODE_LOWRES, RTSP_PYAV_OPTIONS, RTSP_FRAME_WIDTH, RTSP_FRAME_HEIGHT,
+                    RTSP_OPEN_TIMEOUT, RTSP_READ_TIMEOUT)
+
+
+class PyAVCapture:
+    """
+    FFmpeg capture through PyAV with the cv2.VideoCapture surface used by RTSPStream
+    (isOpened / read(buf) / release).
+    - out_size=(w,h): swscale converts straight into the working size and BGR,
+      instead of a full-resolution BGR frame that is resized later
+    - keyframes_only: the decoder skips every non-key frame
+    - lowres: decoder-side 1/2^lowres downscale (only codecs that support it, e.g. MJPEG)
+    - timeout: seconds, or (open, read) seconds; a stalled open/read fails instead of blocking
+    """
+    def __init__(self, url, out_size=None, keyframes_only=False, lowres=0, options=None, timeout=None):
+        import av
+        self._av = av
+        self.url = url
+        self.out_size = out_size
+        self.container = None
+        self._frames = None
+        self.last_keyframe = False   # key flag of the frame returned by the last read()
+        try:
+            self.container = av.open(url, options=dict(options or {}), timeout=timeout)
+            stream = self.container.streams.video[0]
+            stream.thread_type = "AUTO"
+            # decoder is opened lazily on the first packet, so these still apply
+            if lowres:
+                stream.codec_context.options = {"lowres": str(int(lowres))}
+            if keyframes_only:
+                stream.codec_context.skip_frame = "NONKEY"
+            self._frames = self.container.decode(stream)
+        except Exception as e:
+            logging.warning(f"[PyAVCapture] cannot open {url}: {e}")
+            self.release()
+
+    def isOpened(self):
+        return self._frames is not None
+
+    def read(self, image=None):
+        """Return (ok, BGR frame); decodes into `image` when its shape matches."""
+        if self._frames is None:
+            return False, None
+        try:
+            frame = next(self._frames)
+        except (StopIteration, self._av.error.FFmpegError, OSError):
+            return False, None
+        self.last_keyframe = bool(frame.key_frame)
+        if self.out_size is not None:
+            frame = frame.reformat(width=self.out_size[0], height=self.out_size[1], format="bgr24")
+            arr = frame.to_ndarray()
+        else:
+            arr = frame.to_ndarray(format="bgr24")
+        if image is not None and image.shape == arr.shape:
+            np.copyto(image, arr)
+            return True, image
+        return True, arr
+
+    def release(self):
+        if self.container is not None:
+            try:
+                self.container.close()
+            except Exception:
+                pass
+        self.container = None
+        self._frames = None
+
+
+def open_capture(url, backend=RTSP_CAPTURE_BACKEND):
+    """
+    Open a capture with the configured backend ("opencv" or "pyav").
+    Network sources get RTSP_OPEN_TIMEOUT / RTSP_READ_TIMEOUT, so a dead or stalled
+    camera returns a failed open/read instead of blocking the reader thread.
+    """
+    network = "://" in url
+    if backend == "pyav":
+        out_size = (RTSP_FRAME_WIDTH, RTSP_FRAME_HEIGHT) if RTSP_DECODE_TO_WORKING_SIZE else None
+        return PyAVCapture(url, out_size=out_size,
+                           keyframes_only=RTSP_DECODE_KEYFRAMES_ONLY,
+                           lowres=RTSP_DECODE_LOWRES,
+                           options=RTSP_PYAV_OPTIONS if url.startswith("rtsp") else None,
+                           timeout=(RTSP_OPEN_TIMEOUT, RTSP_READ_TIMEOUT) if network else None)
+    if backend != "opencv":
+        raise ValueError(f"Capture backend tidak dikenal: {backend} (pilihan: opencv, pyav)")
+    if network and hasattr(cv2, "CAP_PROP_READ_TIMEOUT_MSEC"):
+        # FFmpeg backend timeouts (OpenCV >= 4.5.2)
+        return cv2.VideoCapture(url, cv2.CAP_FFMPEG, [
+            cv2.CAP_PROP_OPEN_TIMEOUT_MSEC, int(RTSP_OPEN_TIMEOUT * 1000),
+            cv2.CAP_PROP_READ_TIMEOUT_MSEC, int(RTSP_READ_TIMEOUT * 1000),
+        ])
+    return cv2.VideoCapture(url)
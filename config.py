@@ -26,7 +26,144 @@ UPLOAD_DETECT_EVERY = 8
 # RTSP reconnect/backoff
 RTSP_MAX_RETRIES = 10
 RTSP_RETRY_INTERVAL = 2.0  # detik, base interval (bertambah tiap retry)
+RTSP_RETRY_BACKOFF_MAX = 30.0     # detik, batas backoff antar percobaan koneksi
+RTSP_RETRY_JITTER = 0.5           # backoff dikali acak 1 +/- jitter, agar kamera tidak reconnect serentak
+RTSP_DEAD_RETRY_INTERVAL = 120.0  # setelah RTSP_MAX_RETRIES gagal berturut-turut: status dead, dicoba lagi tiap N detik
+RTSP_OPEN_TIMEOUT = 10.0          # detik, batas waktu membuka stream
+RTSP_READ_TIMEOUT = 5.0           # detik, read() yang macet selama ini dianggap gagal (socket stall)
 
 # Logging files
 LOG_RTSP = "log_rtsp.csv"
 LOG_UPLOAD = "log_upload.csv"
+
+# Shared batched inference: satu model untuk semua kamera/upload/webcam
+INFER_SHARED = True
+INFER_BATCH_SIZE = 8       # maksimal frame per predict()
+INFER_MAX_WAIT_MS = 15     # waktu tunggu maksimal untuk mengisi batch
+
+# Tracker motion model: "cv" (Kalman constant-velocity, prediksi di frame tanpa deteksi) atau "none"
+TRACKER_MOTION_MODEL = "cv"
+
+# Adaptive detection scheduler (interval deteksi per stream berubah saat runtime)
+SCHED_ENABLED = True
+SCHED_MIN_INTERVAL = 1     # frame, saat scene ramai
+SCHED_MAX_INTERVAL = 15    # frame, saat scene statis
+SCHED_CAMERA_BUDGET = 0.5  # maksimal fraksi 1 core untuk inference per kamera
+SCHED_TOTAL_BUDGET = 2.0   # total core untuk inference semua kamera
+SCHED_BUSY_SPEED = 0.05    # kecepatan track (x tinggi box per frame) dianggap ramai
+SCHED_BUSY_TRACKS = 10     # jumlah track dianggap ramai
+
+# Motion gate: lewati YOLO jika frame (downscaled) tidak berubah
+MOTION_GATE_ENABLED = True
+MOTION_GATE_WIDTH = 160      # lebar frame kecil untuk frame differencing
+MOTION_PIXEL_DELTA = 15      # selisih intensitas minimal agar pixel dianggap berubah
+MOTION_THRESHOLD = 0.002     # fraksi pixel berubah minimal untuk menjalankan deteksi
+MOTION_BUSY_SCORE = 0.05     # fraksi pixel berubah yang dianggap scene ramai (level 1.0)
+MOTION_MAX_SKIP = 50         # paksa deteksi setelah N skip berturut-turut
+MOTION_LEARN_RATE = 0.05     # kecepatan update background
+
+# ROI per kamera: {cam_id: [[x1, y1, x2, y2], ...]} dalam koordinat normal (0..1); kosong = full frame
+CAMERA_ROIS = {}
+
+# Tiled inference: potongan frame resolusi asli dijalankan sebagai satu batch
+TILE_ENABLED = False
+TILE_SIZE = 640            # pixel, sisi tile
+TILE_OVERLAP = 0.2         # fraksi overlap antar tile
+TILE_NMS_IOU = 0.5         # threshold NMS (intersection over smaller box) untuk gabung box di sambungan tile
+
+# Backend inference: "ultralytics" (PyTorch) atau "onnx" (onnxruntime CPU)
+DETECTOR_BACKEND = "ultralytics"
+NMS_IOU = 0.7                 # IoU NMS (sama dengan default ultralytics)
+ONNX_MODEL_PATH = "yolov8n.onnx"
+MODEL_PRECISION = "fp32"      # "int8" = model hasil quantize.py (hanya backend onnx)
+ONNX_INT8_MODEL_PATH = "yolov8n.int8.onnx"
+ONNX_INPUT_SIZE = 640
+ONNX_INTRA_OP_THREADS = 0     # 0 = default onnxruntime (semua core)
+
+# Jumlah buffer frame (ring) per RTSPStream; read() tidak menyalin frame
+RTSP_FRAME_RING = 4
+
+# Capture backend RTSP: "opencv" (cv2.VideoCapture) atau "pyav" (FFmpeg via PyAV)
+RTSP_CAPTURE_BACKEND = "opencv"
+RTSP_DECODE_TO_WORKING_SIZE = True   # pyav: konversi langsung ke RTSP_FRAME_WIDTH x RTSP_FRAME_HEIGHT BGR
+RTSP_DECODE_KEYFRAMES_ONLY = False   # pyav: decode keyframe saja (fps rendah, CPU sangat kecil)
+RTSP_DECODE_LOWRES = 0               # pyav: downscale di decoder 1/2^N (hanya codec tertentu, mis. MJPEG)
+RTSP_PYAV_OPTIONS = {"rtsp_transport": "tcp"}
+
+# Batas tunggu frame baru (detik) di worker/display; hanya agar stop tetap responsif, bukan polling
+FRAME_WAIT_TIMEOUT = 0.5
+
+# Mode worker kamera RTSP: "thread" (thread di proses Streamlit), "process" (proses terpisah, tanpa GIL bersama)
+# atau "async" (satu event loop asyncio untuk semua kamera, jumlah thread tetap)
+CAMERA_WORKER_MODE = "thread"
+CAMERA_PROCESS_GROUP_SIZE = 2      # kamera per proses worker
+CAMERA_PROCESS_MAX = 0             # 0 = os.cpu_count()
+CAMERA_PROCESS_THREADS = 1         # thread OpenCV/BLAS per proses worker
+CAMERA_RESTART_BACKOFF_MAX = 30.0  # detik, batas backoff restart proses yang crash
+CAMERA_ASYNC_OPEN_WORKERS = 4      # mode async: thread untuk membuka stream (open bisa memblok s/d RTSP_OPEN_TIMEOUT)
+CAMERA_ASYNC_DECODE_WORKERS = 8    # mode async: thread decode (read) bersama semua kamera yang live
+CAMERA_ASYNC_RECOVERY_WORKERS = 4  # mode async: thread read/release kamera yang connecting/degraded/dead (bisa macet)
+CAMERA_ASYNC_PROCESS_WORKERS = 4   # mode async: thread deteksi + tracking + gambar bersama semua kamera
+
+# Registry kamera: daftar URL (satu per baris, teks sebelum URL = nama kamera) dan grid dashboard
+CAMERA_LIST_FILE = "kumpulan_rtsp.txt"
+CAMERA_GRID_COLUMNS = 4
+CAMERA_PAGE_SIZE = 8    # kamera per halaman grid
+CAMERA_VIEW_TIMEOUT = 30.0   # detik, tampilan sesi dashboard yang tidak aktif selama ini dilupakan
+
+# Analisis video offline (tanpa jeda real-time)
+OFFLINE_DETECT_EVERY = 1     # deteksi setiap N frame (1 = semua frame)
+OFFLINE_CHUNK = 16           # frame per chunk yang dikirim sekaligus ke model
+OFFLINE_WORKERS = 2          # jumlah file yang diproses paralel
+OFFLINE_DECODE_QUEUE = 64    # frame hasil decode yang boleh menunggu
+
+# Log CSV asinkron: baris ditulis thread terpisah secara batch, file dirotasi
+LOG_FLUSH_ROWS = 200              # tulis batch jika sudah sebanyak ini baris
+LOG_FLUSH_INTERVAL = 1.0          # detik, batas tunggu sebelum batch ditulis
+LOG_QUEUE_MAX = 100000            # baris di antrian; lebih dari ini dibuang (dihitung)
+LOG_ROTATE_BYTES = 50 * 1024 * 1024  # rotasi jika file > ukuran ini (0 = nonaktif)
+LOG_ROTATE_DAILY = True           # rotasi saat hari berganti
+LOG_ROTATE_KEEP = 14              # jumlah file rotasi lama yang disimpan
+
+# Detection store (Parquet): satu baris per deteksi, partisi camera=<id>/hour=<YYYYMMDDHH UTC>
+DETECTION_STORE_ENABLED = True
+DETECTION_STORE_DIR = "detections"
+DETECTION_STORE_FLUSH_ROWS = 50000    # tulis part file jika buffer partisi sebanyak ini
+DETECTION_STORE_FLUSH_SECONDS = 60.0  # atau jika baris tertua sudah selama ini (detik)
+DETECTION_STORE_COMPRESSION = "zstd"
+
+# Metrics per tahap pipeline (format Prometheus di http://127.0.0.1:METRICS_PORT/metrics)
+METRICS_ENABLED = True
+METRICS_PORT = 9108         # mode process: worker ke-i memakai METRICS_PORT + 1 + i
+METRICS_WINDOW = 1024       # sampel terakhir untuk p50/p95/p99
+METRICS_BUCKETS = [0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5]  # detik
+
+# Backpressure capture -> worker per kamera (jika deteksi lebih lambat dari stream):
+#   "latest"   = selalu frame terbaru, frame yang terlewat dibuang (latency minimal)
+#   "fifo"     = antrian RTSP_BACKPRESSURE_DEPTH frame diproses berurutan, frame tertua dibuang jika penuh
+#   "keyframe" = seperti fifo, tapi frame non-key dibuang lebih dulu (keyframe hanya dikenali capture pyav)
+RTSP_BACKPRESSURE_POLICY = "latest"
+RTSP_BACKPRESSURE_DEPTH = 8
+CAMERA_BACKPRESSURE = {}          # {cam_id: policy}, override per kamera
+RTSP_OVERLOAD_WINDOW = 100        # frame per evaluasi overload
+RTSP_OVERLOAD_DROP_RATIO = 0.5    # overload jika fraksi frame terbuang di window melebihi ini
+RTSP_OVERLOAD_AGE = 1.0           # atau jika umur frame p95 (capture -> siap tampil) melebihi ini (detik)
+
+# Render box: label "ID n" dirasterisasi sekali per track id dan disimpan di cache
+RENDER_LABEL_CACHE = 1024         # jumlah label track id di cache
+RENDER_SKIP_UNWATCHED = True      # kamera yang tidak tampil di layar tidak digambar
+
+# Preview MJPEG ke browser: tiap kamera di-encode JPEG sekali (thread latar), semua penonton berbagi hasilnya
+# http://<host>:PREVIEW_PORT/cam/<id>.mjpg (stream) dan /cam/<id>.jpg (snapshot)
+PREVIEW_ENABLED = True            # False = dashboard kembali ke st.image per frame
+# feed preview TANPA autentikasi: default hanya localhost. Untuk operator di mesin lain set
+# PREVIEW_HOST = "0.0.0.0" secara sadar (sebaiknya di belakang reverse proxy dengan login).
+# Browser yang tidak bisa menjangkau server preview (host loopback, PREVIEW_PUBLIC_URL kosong,
+# dashboard dibuka dari mesin lain) otomatis memakai st.image per frame
+PREVIEW_HOST = "127.0.0.1"        # alamat listen server preview
+PREVIEW_PORT = 8090
+PREVIEW_PUBLIC_URL = ""           # URL dasar untuk browser, mis. "http://nvr.local:8090"; kosong = host dashboard
+PREVIEW_WIDTH = 640               # lebar preview (tinggi mengikuti rasio aspek); 0 = ukuran frame asli
+PREVIEW_JPEG_QUALITY = 70         # kualitas JPEG 1..100
+PREVIEW_FPS = 10.0                # frame rate preview maksimum per kamera
+PREVIEW_IDLE_TIMEOUT = 5.0        # encoder kamera berhenti jika tidak ada penonton selama ini (detik)
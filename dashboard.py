@@ -4,39 +4,37 @@ import tempfile
 import cv2
 import os
 import time
-import csv
+import uuid
+import ipaddress
 import threading
-import queue
 import numpy as np
-from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
 from streamlit_webrtc import webrtc_streamer, VideoTransformerBase
 
 from detector import Detector
 from tracker import Tracker
-from rtsp_handler import RTSPStream
-from utils import draw_boxes
+from scheduler import DetectionScheduler
+from render import draw_tracks
+from utils import redact_url
+from camera_worker import init_log_file, write_log_csv, normalize_detections
+from camera_manager import CameraManager
+from rtsp_handler import BACKPRESSURE_POLICIES, HEALTH_STATES
+from log_writer import get_log_writer
+from metrics import REGISTRY, start_metrics_server
+from preview import start_preview_server
+from offline import process_videos
 from config import (
     FRAME_WIDTH, FRAME_HEIGHT,
     RTSP_FRAME_WIDTH, RTSP_FRAME_HEIGHT,
-    RTSP_DETECT_EVERY, UPLOAD_DETECT_EVERY,
-    LOG_RTSP, LOG_UPLOAD
+    UPLOAD_DETECT_EVERY,
+    LOG_RTSP, LOG_UPLOAD, FRAME_WAIT_TIMEOUT,
+    CAMERA_LIST_FILE, CAMERA_GRID_COLUMNS, CAMERA_PAGE_SIZE, METRICS_PORT,
+    PREVIEW_HOST, PREVIEW_PORT, PREVIEW_PUBLIC_URL
 )
 
 # extra log for webcam
 LOG_WEBRTC = "log_webrtc.csv"
 
-# -------------------- helpers: logging --------------------
-def init_log_file(path):
-    if not os.path.exists(path):
-        with open(path, "w", newline="", encoding="utf-8") as f:
-            writer = csv.writer(f)
-            writer.writerow(["timestamp", "event_type", "message"])
-
-def write_log_csv(path, level, message):
-    with open(path, "a", newline="", encoding="utf-8") as f:
-        writer = csv.writer(f)
-        writer.writerow([datetime.now().strftime("%Y-%m-%d %H:%M:%S"), level, message])
-
 # -------------------- initial setup --------------------
 st.set_page_config(page_title="CCTV AI Multi-Mode", layout="wide")
 st.title("📹 CCTV AI Pipeline :  RTSP Real-time Detection & Tracking.")
@@ -46,288 +44,195 @@ st.markdown(
 )
 
 
+# Prometheus metrics endpoint (started once per process)
+start_metrics_server(METRICS_PORT)
+
 # prepare shared logs
 init_log_file(LOG_UPLOAD)
 init_log_file(LOG_WEBRTC)
 
-# ---------------- session state defaults --------------------
-if "rtsp_thread_1" not in st.session_state:
-    st.session_state.rtsp_thread_1 = None
-if "rtsp_thread_2" not in st.session_state:
-    st.session_state.rtsp_thread_2 = None
-
-if "rtsp_running_1" not in st.session_state:
-    st.session_state.rtsp_running_1 = False
-if "rtsp_running_2" not in st.session_state:
-    st.session_state.rtsp_running_2 = False
-
-# create stop events (threading.Event) persisted in session_state
-if "rtsp_stop_event_1" not in st.session_state:
-    st.session_state.rtsp_stop_event_1 = threading.Event()
-if "rtsp_stop_event_2" not in st.session_state:
-    st.session_state.rtsp_stop_event_2 = threading.Event()
-
-# frame queues (one-slot) per cam -> worker puts latest annotated BGR frame, main thread reads
-if "frame_queue_1" not in st.session_state:
-    st.session_state.frame_queue_1 = queue.Queue(maxsize=1)
-if "frame_queue_2" not in st.session_state:
-    st.session_state.frame_queue_2 = queue.Queue(maxsize=1)
-
-# -------------------- utility: normalize detections --------------------
-def normalize_detections(dets):
-    """
-    Ensure detections are a numpy array with shape (N,5) where each row is [x1,y1,x2,y2,conf].
-    If dets is None or empty, return np.zeros((0,5), dtype=float).
-    """
-    if dets is None:
-        return np.zeros((0,5), dtype=float)
-    if isinstance(dets, np.ndarray):
-        if dets.size == 0:
-            return np.zeros((0,5), dtype=float)
-        return dets
-    # if list of boxes -> try convert
+# ---------------- shared camera registry --------------------
+# one registry per server process (persisted across reruns and shared by every browser session,
+# so N operators do not run N copies of each camera); cameras from CAMERA_LIST_FILE are registered, not started
+@st.cache_resource
+def get_camera_manager():
+    manager = CameraManager()
+    manager.load()
+    if manager.preview is not None:
+        # MJPEG previews: each camera encoded once, whatever the number of viewers
+        start_preview_server(manager.preview, PREVIEW_PORT, host=PREVIEW_HOST)
+    return manager
+
+
+def _is_loopback(host):
+    host = host.strip("[]")
     try:
-        arr = np.asarray(dets)
-        if arr.ndim == 1 and arr.size == 0:
-            return np.zeros((0,5), dtype=float)
-        # If shape (N,5) or (N,4) handle
-        if arr.ndim == 2 and arr.shape[1] >= 5:
-            return arr[:, :5].astype(float)
-        elif arr.ndim == 2 and arr.shape[1] == 4:
-            # no conf column: append conf=1.0
-            confs = np.ones((arr.shape[0],1), dtype=float)
-            return np.hstack([arr.astype(float), confs])
-        else:
-            # fallback: empty
-            return np.zeros((0,5), dtype=float)
-    except Exception:
-        return np.zeros((0,5), dtype=float)
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return host == "localhost"
 
-# -------------------- RTSP worker (no Streamlit calls inside) --------------------
-def rtsp_worker(rtsp_url, cam_id, log_path, width, height, detect_every, stop_event, frame_queue):
+
+def preview_url(cam_id):
     """
-    Background worker for RTSP camera (runs in separate thread).
-    Does NOT call any st.* functions — only writes logs and puts frames into frame_queue.
+    MJPEG URL of a camera as seen from the operator's browser, or None when this browser
+    cannot reach the preview server (loopback-only server, browser on another machine).
     """
-    # instantiate per-thread detector & tracker to avoid shared-model thread-safety issues
-    detector_local = Detector()
-    tracker_local = Tracker()
-
-    # create RTSP reader (uses your rtsp_handler)
-    try:
-        rtsp = RTSPStream(rtsp_url)
-    except Exception as e:
-        write_log_csv(log_path, "ERROR", f"Failed to create RTSPStream: {e}")
-        return
-
-    frame_count = 0
-    last_detections = np.zeros((0,5), dtype=float)
-
-    # init log file and write start info
-    init_log_file(log_path)
-    write_log_csv(log_path, "INFO", f"RTSP worker started for cam{cam_id}: {rtsp_url}")
-
-    while not stop_event.is_set():
-        frame = rtsp.read()
-        if frame is None:
-            # wait briefly then retry (handles short disconnects)
-            time.sleep(0.1)
-            continue
-
-        frame_count += 1
-        # resize for processing (keep BGR)
-        try:
-            proc = cv2.resize(frame, (width, height))
-        except Exception:
-            proc = frame
-
-        # detection with frame skipping
-        if frame_count % detect_every == 0:
-            try:
-                raw = detector_local.detect(proc)
-            except Exception as e:
-                raw = None
-                write_log_csv(log_path, "ERROR", f"Detect error: {str(e)}")
-            dets = normalize_detections(raw)
-            last_detections = dets
-            write_log_csv(log_path, "DETECTION", f"Frame {frame_count} - {len(dets)} objek")
-        else:
-            dets = last_detections
-
-        # tracker update (use per-thread tracker_local)
-        try:
-            tracks = tracker_local.update(dets, {"img_shape": proc.shape, "img_size": proc.shape[:2]})
-        except Exception as e:
-            tracks = []
-            write_log_csv(log_path, "ERROR", f"Tracker update error: {e}")
-
-        annotated = draw_boxes(proc, tracks)
-
-        # put latest annotated frame into queue (replace old if full)
-        try:
-            if frame_queue.full():
-                try:
-                    frame_queue.get_nowait()
-                except queue.Empty:
-                    pass
-            frame_queue.put_nowait(annotated)
-        except Exception:
-            # ignore queue errors
-            pass
-
-        # small throttle
-        time.sleep(0.01)
-
-    # cleanup
-    try:
-        rtsp.stop()
-    except Exception:
-        pass
-    write_log_csv(log_path, "INFO", f"RTSP worker stopped for cam{cam_id}")
+    base = PREVIEW_PUBLIC_URL
+    if not base:
+        # same host the browser used to reach the dashboard
+        headers = getattr(getattr(st, "context", None), "headers", None) or {}
+        host = (headers.get("Host") or "localhost").rsplit(":", 1)[0]
+        if _is_loopback(PREVIEW_HOST) and not _is_loopback(host):
+            return None
+        base = f"http://{host}:{PREVIEW_PORT}"
+    return f"{base.rstrip('/')}/cam/{cam_id}.mjpg"
 
 # -------------------- UI: mode selector --------------------
 mode = st.radio("Pilih sumber video:", ("Live RTSP Stream", "Upload Video", "Live Webcam"))
 
 # -------------------- Multi-RTSP UI --------------------
 if mode == "Live RTSP Stream":
-    st.subheader("🎥 Live RTSP Stream (multi 2 cameras)")
-
-    # two-column inputs (left: cam1, right: cam2)
-    col1, col2 = st.columns(2)
-    with col1:
-        rtsp_url_1 = st.text_input("RTSP URL Kamera 1", key="rtsp_input_1")
-        start_1 = st.button("▶ Mulai Kamera 1")
-        stop_1 = st.button("⏹ Hentikan Kamera 1")
-        download_log_1 = st.button("📥 Download Log Kamera 1")
-    with col2:
-        rtsp_url_2 = st.text_input("RTSP URL Kamera 2", key="rtsp_input_2")
-        start_2 = st.button("▶ Mulai Kamera 2")
-        stop_2 = st.button("⏹ Hentikan Kamera 2")
-        download_log_2 = st.button("📥 Download Log Kamera 2")
-
-    # prepare per-cam log file names
-    log_cam1 = "log_rtsp_cam1.csv"
-    log_cam2 = "log_rtsp_cam2.csv"
-    init_log_file(log_cam1)
-    init_log_file(log_cam2)
-
-    # start cam1
-    if start_1 and rtsp_url_1:
-        if not st.session_state.rtsp_running_1:
-            st.session_state.rtsp_stop_event_1.clear()
-            st.session_state.rtsp_running_1 = True
-            th = threading.Thread(
-                target=rtsp_worker,
-                args=(
-                    rtsp_url_1, 1, log_cam1,
-                    RTSP_FRAME_WIDTH, RTSP_FRAME_HEIGHT, RTSP_DETECT_EVERY,
-                    st.session_state.rtsp_stop_event_1, st.session_state.frame_queue_1
-                ),
-                daemon=True,
-            )
-            st.session_state.rtsp_thread_1 = th
-            th.start()
-            write_log_csv(log_cam1, "INFO", "Start requested from UI")
-
-    # stop cam1
-    if stop_1:
-        if st.session_state.rtsp_running_1:
-            st.session_state.rtsp_stop_event_1.set()
-            st.session_state.rtsp_running_1 = False
-            write_log_csv(log_cam1, "INFO", "Stop requested from UI")
-
-    # start cam2
-    if start_2 and rtsp_url_2:
-        if not st.session_state.rtsp_running_2:
-            st.session_state.rtsp_stop_event_2.clear()
-            st.session_state.rtsp_running_2 = True
-            th = threading.Thread(
-                target=rtsp_worker,
-                args=(
-                    rtsp_url_2, 2, log_cam2,
-                    RTSP_FRAME_WIDTH, RTSP_FRAME_HEIGHT, RTSP_DETECT_EVERY,
-                    st.session_state.rtsp_stop_event_2, st.session_state.frame_queue_2
-                ),
-                daemon=True,
-            )
-            st.session_state.rtsp_thread_2 = th
-            th.start()
-            write_log_csv(log_cam2, "INFO", "Start requested from UI")
-
-    # stop cam2
-    if stop_2:
-        if st.session_state.rtsp_running_2:
-            st.session_state.rtsp_stop_event_2.set()
-            st.session_state.rtsp_running_2 = False
-            write_log_csv(log_cam2, "INFO", "Stop requested from UI")
+    manager = get_camera_manager()
+    st.subheader(f"🎥 Live RTSP Stream ({len(manager.cameras)} kamera)")
+
+    # register a new camera / pool-wide controls
+    col_url, col_add = st.columns([4, 1])
+    with col_url:
+        new_url = st.text_input("RTSP URL kamera baru", key="rtsp_new_url")
+    with col_add:
+        add_cam = st.button("➕ Tambah Kamera")
+    if add_cam and new_url:
+        manager.add(new_url.strip())
+
+    col_start, col_stop, col_reload = st.columns(3)
+    start_all = col_start.button("▶ Mulai Semua")
+    stop_all = col_stop.button("⏹ Hentikan Semua")
+    reload_list = col_reload.button(f"🔄 Muat {CAMERA_LIST_FILE}")
+    if reload_list:
+        manager.load()
+    if start_all:
+        manager.start_all()
+    if stop_all:
+        manager.stop_all()
+
+    # only the cameras of the current page are drawn (and wake the display loop)
+    _, n_pages = manager.page(0, CAMERA_PAGE_SIZE)
+    page_no = st.number_input(f"Halaman (1-{n_pages})", min_value=1, max_value=n_pages, value=1, step=1) - 1
+    visible, _ = manager.page(page_no, CAMERA_PAGE_SIZE)
+    # the manager is shared by every browser session: visibility and wake-ups are per session
+    view_id = st.session_state.setdefault("camera_view", uuid.uuid4().hex)
+    manager.set_visible(visible, session=view_id)
 
     # download helpers
     def download_file_button(path, label):
+        get_log_writer().flush()
         if os.path.exists(path) and os.path.getsize(path) > 0:
             with open(path, "rb") as f:
                 st.download_button(label=label, data=f, file_name=os.path.basename(path), mime="text/csv")
         else:
             st.info("Log file belum tersedia.")
 
-    if download_log_1:
-        download_file_button(log_cam1, f"Download log cam1 ({log_cam1})")
-    if download_log_2:
-        download_file_button(log_cam2, f"Download log cam2 ({log_cam2})")
-
-    # display area (two columns)
-    disp1, disp2 = st.columns(2)
-    img1_placeholder = disp1.empty()
-    fps1_placeholder = disp1.empty()
-    img2_placeholder = disp2.empty()
-    fps2_placeholder = disp2.empty()
-
-    # main loop: poll frame queues and update UI
+    # grid: per-camera controls + image/status placeholders
+    placeholders = {}
+    for row in range(0, len(visible), CAMERA_GRID_COLUMNS):
+        cols = st.columns(CAMERA_GRID_COLUMNS)
+        for col, cid in zip(cols, visible[row:row + CAMERA_GRID_COLUMNS]):
+            cam = manager.cameras[cid]
+            with col:
+                st.caption(f"{cam.name}: {redact_url(cam.url)}")
+                b_start, b_stop, b_log = st.columns(3)
+                if b_start.button("▶", key=f"start_cam_{cid}"):
+                    manager.start(cid)
+                if b_stop.button("⏹", key=f"stop_cam_{cid}"):
+                    manager.stop(cid)
+                if b_log.button("📥", key=f"log_cam_{cid}"):
+                    download_file_button(cam.log_path, f"Download log {cam.name} ({cam.log_path})")
+                # latency vs completeness when the camera cannot keep up (restarts a running camera);
+                # applied only when this session changes it, and shows changes made by other sessions
+                policy_key = f"policy_cam_{cid}"
+                st.session_state[policy_key] = cam.policy
+                st.selectbox("Backpressure", BACKPRESSURE_POLICIES, key=policy_key,
+                             on_change=lambda cid=cid, key=policy_key: manager.set_policy(cid, st.session_state[key]))
+                placeholders[cid] = (st.empty(), st.empty())
+
+    # MJPEG only when this browser can reach the preview server, else frames via st.image
+    use_preview = manager.preview is not None and preview_url(0) is not None
+    black = np.zeros((RTSP_FRAME_HEIGHT, RTSP_FRAME_WIDTH, 3), dtype=np.uint8)
+    shown = {}
+    for cid, (img_ph, status_ph) in placeholders.items():
+        running = manager.cameras[cid].running
+        if running and use_preview:
+            # the browser pulls the shared MJPEG stream itself; no frames go through the websocket
+            img_ph.markdown(f'<img src="{preview_url(cid)}" style="width:100%">', unsafe_allow_html=True)
+        else:
+            img_ph.image(black, use_container_width=True)
+        status_ph.markdown(f"**{manager.cameras[cid].name} {'running' if running else 'idle'}**")
+
+    def status_line(cid):
+        s = REGISTRY.summary(f"cam{cid}")
+        # connection health of the reader (thread mode; process-mode workers report on their own port)
+        state = HEALTH_STATES[int(s["stream_state"])] if "stream_state" in s else "running"
+        parts = [f"**{manager.cameras[cid].name} {state}**"]
+        for stage in ("capture", "detect", "frame_age", "encode", "display"):
+            if stage in s:
+                parts.append(f"{stage} p95 {s[stage]['p95'] * 1000:.0f} ms")
+        drops = [f"{k[8:]} {s[k]}" for k in ("dropped_capture", "dropped_display") if s.get(k)]
+        if drops:
+            parts.append("drop " + "/".join(drops))
+        if s.get("overloaded"):
+            parts.append("⚠️ **OVERLOAD**")
+        return " · ".join(parts)
+
+    # main loop: sleep until a visible camera publishes a frame, then update only visible cameras
+    # (preview mode: frames go to the browser as MJPEG, the loop only refreshes status lines)
+    last_status = 0.0
     try:
-        while st.session_state.rtsp_running_1 or st.session_state.rtsp_running_2:
-            # cam1
-            if st.session_state.rtsp_running_1:
-                try:
-                    frame = st.session_state.frame_queue_1.get_nowait()
-                    # frame is BGR
-                    img1_placeholder.image(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB), use_container_width=True)
-                    fps1_placeholder.markdown("**Cam1 running**")
-                except queue.Empty:
-                    fps1_placeholder.markdown("**Cam1 running**")
-            else:
-                black = np.zeros((RTSP_FRAME_HEIGHT, RTSP_FRAME_WIDTH, 3), dtype=np.uint8)
-                img1_placeholder.image(black, use_container_width=True)
-                fps1_placeholder.markdown("**Cam1 idle**")
-
-            # cam2
-            if st.session_state.rtsp_running_2:
-                try:
-                    frame = st.session_state.frame_queue_2.get_nowait()
-                    img2_placeholder.image(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB), use_container_width=True)
-                    fps2_placeholder.markdown("**Cam2 running**")
-                except queue.Empty:
-                    fps2_placeholder.markdown("**Cam2 running**")
-            else:
-                black = np.zeros((RTSP_FRAME_HEIGHT, RTSP_FRAME_WIDTH, 3), dtype=np.uint8)
-                img2_placeholder.image(black, use_container_width=True)
-                fps2_placeholder.markdown("**Cam2 idle**")
-
-            # small sleep to reduce CPU
-            time.sleep(0.05)
+        while manager.running_ids():
+            if use_preview:
+                for cid in visible:
+                    if manager.cameras[cid].running:
+                        placeholders[cid][1].markdown(status_line(cid))
+                manager.set_visible(visible, session=view_id)   # keeps this session's view alive
+                time.sleep(1.0)
+                continue
+            manager.wait(timeout=FRAME_WAIT_TIMEOUT, session=view_id)
+            refresh_status = time.monotonic() - last_status >= 1.0
+            if refresh_status:
+                last_status = time.monotonic()
+            for cid in visible:
+                frame = manager.latest(cid)
+                if frame is not None and shown.get(cid) is not frame:
+                    shown[cid] = frame
+                    label = f"cam{cid}"
+                    # frame is BGR; st.image does its own image encoding, timed as "display"
+                    with REGISTRY.timer(label, "encode"):
+                        rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+                    with REGISTRY.timer(label, "display"):
+                        placeholders[cid][0].image(rgb, use_container_width=True)
+                if refresh_status and manager.cameras[cid].running:
+                    placeholders[cid][1].markdown(status_line(cid))
     except Exception as e:
         st.error(f"Display loop stopped: {e}")
+    finally:
+        manager.drop_view(view_id)
 
 # -------------------- Upload Video Mode --------------------
 elif mode == "Upload Video":
     st.subheader("📁 Upload Video")
     init_log_file(LOG_UPLOAD)
 
-    uploaded_file = st.file_uploader("Upload video (mp4, mov, avi)", type=["mp4", "mov", "avi"])
+    offline_mode = st.checkbox("⚡ Analisis offline (secepat mungkin, tanpa preview, beberapa file sekaligus)")
+    uploaded_file = st.file_uploader("Upload video (mp4, mov, avi)", type=["mp4", "mov", "avi"],
+                                     accept_multiple_files=offline_mode)
+    if offline_mode:
+        annotate_offline = st.checkbox("Simpan video beranotasi", value=False)
     start_upload = st.button("▶ Mulai Pemutaran")
     stop_upload = st.button("⏹ Hentikan Pemutaran")
     download_upload_log = st.button("📥 Download Log Upload")
 
     # download helper (reused)
     def download_file(path, label):
+        get_log_writer().flush()
         if os.path.exists(path) and os.path.getsize(path) > 0:
             with open(path, "rb") as f:
                 st.download_button(label=label, data=f, file_name=os.path.basename(path), mime="text/csv")
@@ -337,10 +242,71 @@ elif mode == "Upload Video":
     if download_upload_log:
         download_file(LOG_UPLOAD, "Download Log Upload")
 
-    if uploaded_file and start_upload:
+    # Stop reruns the script: tell a still running offline analysis to finish early
+    if stop_upload and "offline_stop" in st.session_state:
+        st.session_state.offline_stop.set()
+
+    if offline_mode and uploaded_file and start_upload:
+        # offline batch analysis: no real-time pacing, no st.image per frame
+        tmp_dir = tempfile.mkdtemp(prefix="offline_")
+        paths = []
+        for i, up in enumerate(uploaded_file):
+            # one folder per upload: files with the same name must not overwrite each other
+            up_dir = os.path.join(tmp_dir, str(i))
+            os.makedirs(up_dir)
+            path = os.path.join(up_dir, os.path.basename(up.name))
+            with open(path, "wb") as f:
+                f.write(up.read())
+            paths.append(path)
+        out_dir = os.path.join(tmp_dir, "output")
+        write_log_csv(LOG_UPLOAD, "INFO", f"Analisis offline dimulai: {len(paths)} file")
+
+        progress = {}
+        stop_offline = st.session_state.offline_stop = threading.Event()
+        bars = {p: st.progress(0.0, text=os.path.basename(p)) for p in paths}
+        with ThreadPoolExecutor(max_workers=1) as ex:
+            fut = ex.submit(process_videos, paths, out_dir, progress=progress, stop_event=stop_offline,
+                            annotate=annotate_offline)
+            try:
+                # progress bars are refreshed from this (script) thread; workers only update the dict
+                while not fut.done():
+                    for p, bar in bars.items():
+                        done, total = progress.get(p, (0, 0))
+                        bar.progress(min(1.0, done / total) if total else 0.0,
+                                     text=f"{os.path.basename(p)}: {done}/{total or '?'} frame")
+                    time.sleep(0.5)
+            finally:
+                # script interrupted (rerun / Stop): do not leave the workers running
+                if not fut.done():
+                    stop_offline.set()
+            results = fut.result()
+
+        for res in results:
+            name = os.path.basename(res["video"])
+            if "error" in res:
+                st.error(f"{name}: {res['error']}")
+                write_log_csv(LOG_UPLOAD, "ERROR", f"Analisis offline gagal {name}: {res['error']}")
+                continue
+            summary = (f"{name}: {res['frames']} frame dalam {res['elapsed_s']} s "
+                       f"({res['fps']} fps, {res['realtime_factor']}x real-time)")
+            if res["stopped"]:
+                st.warning(summary + " (dihentikan)")
+            else:
+                bars[res["video"]].progress(1.0, text=f"{name}: selesai")
+                st.success(summary)
+            write_log_csv(LOG_UPLOAD, "INFO", f"Analisis offline selesai {name}: {res}")
+            for suffix, out_path in res["outputs"].items():
+                mime = "video/mp4" if suffix.endswith(".mp4") else "text/csv"
+                if os.path.exists(out_path):
+                    with open(out_path, "rb") as f:
+                        st.download_button(label=f"Download {os.path.basename(out_path)}", data=f,
+                                           file_name=os.path.basename(out_path), mime=mime, key=out_path)
+
+    if not offline_mode and uploaded_file and start_upload:
         # create local detector/tracker instances (per-run)
         detector_u = Detector()
         tracker_u = Tracker()
+        scheduler_u = DetectionScheduler(UPLOAD_DETECT_EVERY, name="upload")
 
         tfile = tempfile.NamedTemporaryFile(delete=False)
         tfile.write(uploaded_file.read())
@@ -353,7 +319,6 @@ elif mode == "Upload Video":
         fps_display = st.empty()
 
         frame_count = 0
-        last_detections = np.zeros((0,5), dtype=float)
 
         fps_val = cap.get(cv2.CAP_PROP_FPS)
         delay = 1.0 / fps_val if fps_val > 0 else 0.03
@@ -367,40 +332,59 @@ elif mode == "Upload Video":
                 break
 
             start_time = time.time()
-            ret, frame = cap.read()
+            with REGISTRY.timer("upload", "capture"):
+                ret, frame = cap.read()
             if not ret:
                 break
 
             frame_count += 1
-            frame_proc = cv2.resize(frame, (FRAME_WIDTH, FRAME_HEIGHT))
+            with REGISTRY.timer("upload", "resize"):
+                frame_proc = cv2.resize(frame, (FRAME_WIDTH, FRAME_HEIGHT))
 
-            if frame_count % UPLOAD_DETECT_EVERY == 0:
+            detect_now = scheduler_u.should_detect()
+            latency = None
+            if detect_now:
+                t0 = time.monotonic()
                 try:
                     raw = detector_u.detect(frame_proc)
                 except Exception as e:
                     raw = None
                     write_log_csv(LOG_UPLOAD, "ERROR", f"Detect error: {e}")
+                latency = time.monotonic() - t0
+                REGISTRY.observe("upload", "detect", latency)
                 detections = normalize_detections(raw)
-                last_detections = detections
                 write_log_csv(LOG_UPLOAD, "DETECTION", f"Frame {frame_count} - {len(detections)} objek")
             else:
-                detections = last_detections
+                detections = None
 
+            t0 = time.perf_counter()
             try:
-                tracks = tracker_u.update(detections, {"img_shape": frame_proc.shape, "img_size": frame_proc.shape[:2]})
+                tracker_u.update(detections, {"img_shape": frame_proc.shape, "img_size": frame_proc.shape[:2]})
             except Exception as e:
-                tracks = []
                 write_log_csv(LOG_UPLOAD, "ERROR", f"Tracker error: {e}")
+            REGISTRY.observe("upload", "track", time.perf_counter() - t0)
 
-            annotated = draw_boxes(frame_proc, tracks)
+            if detect_now:
+                scheduler_u.report(latency, tracker_u)
 
-            stframe.image(cv2.cvtColor(annotated, cv2.COLOR_BGR2RGB), channels="RGB", use_container_width=True)
-            fps_display.markdown(f"**FPS: {1.0 / (time.time() - start_time + 1e-5):.2f}**")
+            with REGISTRY.timer("upload", "draw"):
+                annotated = draw_tracks(frame_proc, tracker_u)
+            # processing FPS excludes the UI: conversion and st.image are timed separately
+            proc_time = time.time() - start_time
+
+            t0 = time.perf_counter()
+            with REGISTRY.timer("upload", "encode"):
+                rgb = cv2.cvtColor(annotated, cv2.COLOR_BGR2RGB)
+            with REGISTRY.timer("upload", "display"):
+                stframe.image(rgb, channels="RGB", use_container_width=True)
+            ui_ms = (time.perf_counter() - t0) * 1000.0
+            fps_display.markdown(f"**FPS proses: {1.0 / (proc_time + 1e-5):.2f}** · tampilan {ui_ms:.0f} ms")
 
             if delay - (time.time() - start_time) > 0:
                 time.sleep(delay - (time.time() - start_time))
 
         cap.release()
+        scheduler_u.close()
         try:
             os.remove(video_path)
         except Exception:
@@ -414,6 +398,7 @@ elif mode == "Live Webcam":
 
     download_webcam_log = st.button("📥 Download Log Webcam")
     if download_webcam_log:
+        get_log_writer().flush()
         if os.path.exists(LOG_WEBRTC) and os.path.getsize(LOG_WEBRTC) > 0:
             with open(LOG_WEBRTC, "rb") as f:
                 st.download_button(label="Download Log Webcam", data=f, file_name=os.path.basename(LOG_WEBRTC), mime="text/csv")
@@ -425,32 +410,37 @@ elif mode == "Live Webcam":
             # create local detector/tracker for this processor
             self.detector = Detector()
             self.tracker = Tracker()
+            self.scheduler = DetectionScheduler(5, name="webcam")
             self.frame_count = 0
-            self.last_detections = np.zeros((0,5), dtype=float)
 
         def transform(self, frame):
             img = frame.to_ndarray(format="bgr24")
             self.frame_count += 1
 
-            if self.frame_count % 5 == 0:
+            detect_now = self.scheduler.should_detect()
+            latency = None
+            if detect_now:
+                t0 = time.monotonic()
                 try:
                     raw = self.detector.detect(img)
                 except Exception as e:
                     raw = None
                     write_log_csv(LOG_WEBRTC, "ERROR", f"Detect error: {e}")
+                latency = time.monotonic() - t0
                 detections = normalize_detections(raw)
-                self.last_detections = detections
                 write_log_csv(LOG_WEBRTC, "DETECTION", f"Frame {self.frame_count} - {len(detections)} objek")
             else:
-                detections = self.last_detections
+                detections = None
 
             try:
-                tracks = self.tracker.update(detections, {"img_shape": img.shape, "img_size": img.shape[:2]})
+                self.tracker.update(detections, {"img_shape": img.shape, "img_size": img.shape[:2]})
             except Exception as e:
-                tracks = []
                 write_log_csv(LOG_WEBRTC, "ERROR", f"Tracker error: {e}")
 
-            annotated = draw_boxes(img, tracks)
+            if detect_now:
+                self.scheduler.report(latency, self.tracker)
+
+            annotated = draw_tracks(img, self.tracker)
             return annotated
 
     webrtc_streamer(
@@ -0,0 +1,270 @@
+# detection_store.py
+# Penyimpanan deteksi kolumnar (Parquet), dipartisi per kamera dan per jam:
+#   <root>/camera=<id>/hour=<YYYYMMDDHH>/part-*.parquet
+#
+#   python detection_store.py query --camera 1 --start "2026-01-01 08:00" --end "2026-01-01 09:00"
+#   python detection_store.py compact
+import os
+import sys
+import time
+import uuid
+import atexit
+import argparse
+import logging
+import threading
+from datetime import datetime, timezone
+import numpy as np
+
+from config import (DETECTION_STORE_DIR, DETECTION_STORE_FLUSH_ROWS,
+                    DETECTION_STORE_FLUSH_SECONDS, DETECTION_STORE_COMPRESSION)
+from utils import iou_matrix
+
+COLUMNS = ("frame", "ts", "track_id", "x1", "y1", "x2", "y2", "conf")
+
+
+def _import_pyarrow():
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        import pyarrow.dataset as ds
+    except ImportError as e:
+        raise RuntimeError(f"pyarrow belum terpasang: {e}")
+    return pa, pq, ds
+
+
+def _schema(pa):
+    return pa.schema([
+        ("frame", pa.int64()),
+        ("ts", pa.timestamp("ms", tz="UTC")),
+        ("track_id", pa.int32()),
+        ("x1", pa.float32()), ("y1", pa.float32()),
+        ("x2", pa.float32()), ("y2", pa.float32()),
+        ("conf", pa.float32()),
+    ])
+
+
+def hour_key(ts):
+    """Partition value for a unix timestamp: YYYYMMDDHH (UTC) as int."""
+    return int(datetime.fromtimestamp(ts, timezone.utc).strftime("%Y%m%d%H"))
+
+
+def assign_track_ids(dets, track_ids, track_boxes, min_iou=0.5):
+    """Track id of the best-overlapping track for each detection (-1 if none >= min_iou)."""
+    out = np.full(len(dets), -1, dtype=np.int32)
+    if len(dets) == 0 or len(track_ids) == 0:
+        return out
+    ious = iou_matrix(np.asarray(dets)[:, :4], np.asarray(track_boxes))
+    best = ious.argmax(axis=1)
+    hit = ious[np.arange(len(dets)), best] >= min_iou
+    out[hit] = np.asarray(track_ids)[best[hit]]
+    return out
+
+
+class DetectionStore:
+    """
+    Buffered writer of one row per detection:
+    camera, frame, ts, track_id, x1, y1, x2, y2, conf.
+    - add() only appends to an in-memory buffer of the (camera, hour) partition
+    - a background thread writes a partition as one Parquet part file when it holds
+      flush_rows rows or its oldest row is flush_seconds old
+    - compact() merges the part files of finished hours into one file per partition
+    """
+    def __init__(self, root=DETECTION_STORE_DIR, flush_rows=DETECTION_STORE_FLUSH_ROWS,
+                 flush_seconds=DETECTION_STORE_FLUSH_SECONDS, compression=DETECTION_STORE_COMPRESSION):
+        self.pa, self.pq, _ = _import_pyarrow()
+        self.schema = _schema(self.pa)
+        self.root = root
+        self.flush_rows = max(1, int(flush_rows))
+        self.flush_seconds = float(flush_seconds)
+        self.compression = compression
+        self._buffers = {}      # (camera, hour) -> {"chunks": [...], "rows": n, "since": t}
+        self._lock = threading.Lock()
+        self._running = True
+        self.stats = {"rows": 0, "files": 0, "errors": 0}
+        self._thread = threading.Thread(target=self._loop, name="detection-store", daemon=True)
+        self._thread.start()
+
+    def add(self, camera, frame_idx, dets, track_ids=None, ts=None):
+        """Buffer the (N,5) detections of one frame (track_ids: (N,) or None -> -1)."""
+        if dets is None or len(dets) == 0:
+            return
+        dets = np.asarray(dets, dtype=np.float32)
+        ts = time.time() if ts is None else ts
+        n = len(dets)
+        chunk = {
+            "frame": np.full(n, frame_idx, dtype=np.int64),
+            "ts": np.full(n, int(ts * 1000), dtype=np.int64),
+            "track_id": (np.full(n, -1, dtype=np.int32) if track_ids is None
+                         else np.asarray(track_ids, dtype=np.int32)),
+            "x1": dets[:, 0], "y1": dets[:, 1], "x2": dets[:, 2], "y2": dets[:, 3],
+            "conf": dets[:, 4],
+        }
+        key = (int(camera), hour_key(ts))
+        with self._lock:
+            buf = self._buffers.get(key)
+            if buf is None:
+                buf = self._buffers[key] = {"chunks": [], "rows": 0, "since": time.monotonic()}
+            buf["chunks"].append(chunk)
+            buf["rows"] += n
+
+    def _partition_dir(self, camera, hour):
+        return os.path.join(self.root, f"camera={camera}", f"hour={hour}")
+
+    def _write(self, key, chunks):
+        cols = {c: np.concatenate([ch[c] for ch in chunks]) for c in COLUMNS}
+        arrays = [self.pa.array(cols[c], type=self.schema.field(c).type) if c != "ts"
+                  else self.pa.array(cols[c], type=self.pa.int64()).cast(self.schema.field(c).type)
+                  for c in COLUMNS]
+        table = self.pa.Table.from_arrays(arrays, schema=self.schema)
+        part_dir = self._partition_dir(*key)
+        os.makedirs(part_dir, exist_ok=True)
+        path = os.path.join(part_dir, f"part-{int(time.time())}-{uuid.uuid4().hex[:8]}.parquet")
+        self.pq.write_table(table, path, compression=self.compression)
+        self.stats["files"] += 1
+        self.stats["rows"] += table.num_rows
+
+    def flush(self, force=True):
+        """Write buffered partitions (all of them when force, else only due ones)."""
+        now = time.monotonic()
+        with self._lock:
+            due = [k for k, b in self._buffers.items()
+                   if force or b["rows"] >= self.flush_rows or now - b["since"] >= self.flush_seconds]
+            taken = [(k, self._buffers.pop(k)["chunks"]) for k in due]
+        for key, chunks in taken:
+            try:
+                self._write(key, chunks)
+            except Exception as e:
+                self.stats["errors"] += 1
+                logging.exception(f"[DetectionStore] write {key} failed: {e}")
+
+    def _loop(self):
+        while self._running:
+            time.sleep(min(1.0, self.flush_seconds))
+            self.flush(force=False)
+
+    def compact(self, before_hour=None):
+        """Merge part files of every partition older than before_hour (default: current hour)."""
+        before_hour = hour_key(time.time()) if before_hour is None else before_hour
+        merged = 0
+        if not os.path.isdir(self.root):
+            return merged
+        for cam_dir in sorted(os.listdir(self.root)):
+            cam_path = os.path.join(self.root, cam_dir)
+            if not cam_dir.startswith("camera=") or not os.path.isdir(cam_path):
+                continue
+            for hour_dir in sorted(os.listdir(cam_path)):
+                if not hour_dir.startswith("hour=") or int(hour_dir[5:]) >= before_hour:
+                    continue
+                part_path = os.path.join(cam_path, hour_dir)
+                parts = sorted(f for f in os.listdir(part_path) if f.endswith(".parquet"))
+                if len(parts) < 2:
+                    continue
+                table = self.pa.concat_tables(
+                    [self.pq.read_table(os.path.join(part_path, f), schema=self.schema) for f in parts])
+                table = table.sort_by([("ts", "ascending")])
+                tmp = os.path.join(part_path, "compacted.parquet.tmp")
+                self.pq.write_table(table, tmp, compression=self.compression)
+                for f in parts:
+                    os.remove(os.path.join(part_path, f))
+                os.replace(tmp, os.path.join(part_path, "part-compacted.parquet"))
+                merged += 1
+        return merged
+
+    def close(self):
+        if not self._running:
+            return
+        self._running = False
+        self.flush(force=True)
+
+
+def read_detections(root=DETECTION_STORE_DIR, cameras=None, start=None, end=None,
+                    min_conf=None, track_id=None, columns=None):
+    """
+    Query the store as a pyarrow Table. Camera/hour filters prune whole partitions,
+    ts/conf/track_id filters are pushed down to the Parquet row groups.
+    start/end: datetime (naive = local time) or None.
+    """
+    pa, _, ds = _import_pyarrow()
+    if not os.path.isdir(root):
+        return _schema(pa).empty_table()
+    dataset = ds.dataset(root, format="parquet", partitioning="hive", schema=_schema(pa).append(
+        pa.field("camera", pa.int32())).append(pa.field("hour", pa.int64())))
+    cond = None
+
+    def _and(expr):
+        return expr if cond is None else cond & expr
+
+    if cameras:
+        cond = _and(ds.field("camera").isin([int(c) for c in cameras]))
+    if start is not None:
+        cond = _and(ds.field("hour") >= hour_key(start.timestamp()))
+        cond = cond & (ds.field("ts") >= pa.scalar(start.astimezone(timezone.utc), type=pa.timestamp("ms", tz="UTC")))
+    if end is not None:
+        cond = _and(ds.field("hour") <= hour_key(end.timestamp()))
+        cond = cond & (ds.field("ts") < pa.scalar(end.astimezone(timezone.utc), type=pa.timestamp("ms", tz="UTC")))
+    if min_conf is not None:
+        cond = _and(ds.field("conf") >= float(min_conf))
+    if track_id is not None:
+        cond = _and(ds.field("track_id") == int(track_id))
+    return dataset.to_table(filter=cond, columns=columns)
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_detection_store():
+    """Process-wide DetectionStore, or None when pyarrow is not installed."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            try:
+                _store = DetectionStore()
+            except RuntimeError as e:
+                logging.warning(f"[DetectionStore] disabled: {e}")
+                _store = False
+            else:
+                atexit.register(_store.close)
+        return _store or None
+
+
+def _parse_time(text):
+    return datetime.strptime(text, "%Y-%m-%d %H:%M") if text else None
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Query / compact the Parquet detection store")
+    ap.add_argument("--root", default=DETECTION_STORE_DIR)
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    q = sub.add_parser("query", help="filter detections and print a summary (or write CSV)")
+    q.add_argument("--camera", type=int, action="append", help="repeatable")
+    q.add_argument("--start", help='"YYYY-MM-DD HH:MM" (local time)')
+    q.add_argument("--end", help='"YYYY-MM-DD HH:MM" (local time)')
+    q.add_argument("--min-conf", type=float)
+    q.add_argument("--track-id", type=int)
+    q.add_argument("--csv", help="write matching rows to this CSV file")
+    sub.add_parser("compact", help="merge part files of finished hours")
+    args = ap.parse_args()
+
+    if args.cmd == "compact":
+        store = DetectionStore(root=args.root)
+        print(f"{store.compact()} partisi digabung")
+        store.close()
+        return
+
+    t0 = time.perf_counter()
+    table = read_detections(args.root, cameras=args.camera, start=_parse_time(args.start),
+                            end=_parse_time(args.end), min_conf=args.min_conf, track_id=args.track_id)
+    elapsed = time.perf_counter() - t0
+    print(f"{table.num_rows} baris dalam {elapsed * 1000:.1f} ms", file=sys.stderr)
+    if args.csv:
+        import pyarrow.csv as pacsv
+        pacsv.write_csv(table, args.csv)
+    elif table.num_rows:
+        per_cam = table.group_by("camera").aggregate([("frame", "count"), ("track_id", "count_distinct")])
+        for row in per_cam.to_pylist():
+            print(f"camera {row['camera']}: {row['frame_count']} deteksi, {row['track_id_count_distinct']} track id")
+
+
+if __name__ == "__main__":
+    main()
@@ -28,34 +28,161 @@
 #         return np.array(detections)
 
 # detector.py
-from ultralytics import YOLO
+import threading
 import numpy as np
-from config import MODEL_PATH, CONF_THRESH, TARGET_CLASS
+from config import (DETECTOR_BACKEND, INFER_SHARED, INFER_BATCH_SIZE,
+                    INFER_MAX_WAIT_MS, TILE_SIZE, TILE_OVERLAP, TILE_NMS_IOU)
+from inference_server import InferenceServer
+from detector_backends import make_backend
+from utils import nms
+
+_shared_server = None
+_shared_lock = threading.Lock()
+
+def get_shared_server():
+    """
+    Return the process-wide InferenceServer (created on first use).
+    All shared Detector instances submit into it, so the model is loaded once.
+    """
+    global _shared_server
+    with _shared_lock:
+        if _shared_server is None:
+            engine = Detector(shared=False)
+            _shared_server = InferenceServer(engine.detect_batch,
+                                             batch_size=INFER_BATCH_SIZE,
+                                             max_wait_ms=INFER_MAX_WAIT_MS)
+        return _shared_server
+
+def roi_windows(shape, rois):
+    """Normalized [x1,y1,x2,y2] ROIs (0..1) -> clipped pixel windows; empty ones dropped."""
+    h, w = shape[:2]
+    windows = []
+    for rx1, ry1, rx2, ry2 in rois:
+        x1, x2 = int(round(max(0.0, rx1) * w)), int(round(min(1.0, rx2) * w))
+        y1, y2 = int(round(max(0.0, ry1) * h)), int(round(min(1.0, ry2) * h))
+        if x2 - x1 >= 8 and y2 - y1 >= 8:
+            windows.append((x1, y1, x2, y2))
+    return windows
+
+def _tile_starts(lo, hi, size, step):
+    if hi - lo <= size:
+        return [lo]
+    starts = list(range(lo, hi - size, step))
+    starts.append(hi - size)  # last tile flush with the edge
+    return starts
+
+def tile_windows(region, tile_size=TILE_SIZE, overlap=TILE_OVERLAP):
+    """Split a pixel window (x1,y1,x2,y2) into tile_size squares overlapping by `overlap`."""
+    x1, y1, x2, y2 = region
+    step = max(1, int(tile_size * (1.0 - overlap)))
+    return [(tx, ty, min(tx + tile_size, x2), min(ty + tile_size, y2))
+            for ty in _tile_starts(y1, y2, tile_size, step)
+            for tx in _tile_starts(x1, x2, tile_size, step)]
+
+def _seam_mask(dets, window, region, margin=2):
+    """Boxes touching a window edge that lies inside the region (cut by a tile seam)."""
+    wx1, wy1, wx2, wy2 = window
+    rx1, ry1, rx2, ry2 = region
+    mask = np.zeros(len(dets), dtype=bool)
+    if wx1 > rx1:
+        mask |= dets[:, 0] <= wx1 + margin
+    if wy1 > ry1:
+        mask |= dets[:, 1] <= wy1 + margin
+    if wx2 < rx2:
+        mask |= dets[:, 2] >= wx2 - margin
+    if wy2 < ry2:
+        mask |= dets[:, 3] >= wy2 - margin
+    return mask
 
 class Detector:
-    def __init__(self):
-        try:
-            self.model = YOLO(MODEL_PATH)
-        except Exception as e:
-            raise RuntimeError(f"Gagal memuat model dari {MODEL_PATH}. Error: {str(e)}")
+    """
+    YOLO person detector.
+    - shared=True (default from config): frames go through the shared InferenceServer,
+      which batches requests from every camera/upload/webcam pipeline into one predict call.
+    - shared=False: this instance loads and owns its own engine.
+    backend: engine name from detector_backends ("ultralytics" or "onnx").
+    """
+    def __init__(self, shared=INFER_SHARED, backend=DETECTOR_BACKEND):
+        self.engine = None
+        self.server = None
+        if shared:
+            self.server = get_shared_server()
+            return
+        self.engine = make_backend(backend)
 
-    def detect(self, frame):
+    def detect(self, frame, rois=None):
         """
         frame: BGR numpy array (OpenCV)
+        rois: optional list of normalized [x1,y1,x2,y2]; only these crops are inferred
         returns numpy array shape (N,5): [x1,y1,x2,y2,conf]
         """
+        if rois:
+            windows = roi_windows(frame.shape, rois)
+            return self._detect_windows(frame, [(win, win) for win in windows])
+        if self.server is not None:
+            try:
+                return self.server.submit(frame)
+            except Exception as e:
+                raise RuntimeError(f"Deteksi gagal. Error: {str(e)}")
+        return self.detect_batch([frame])[0]
+
+    def detect_tiled(self, frame, rois=None, tile_size=TILE_SIZE, overlap=TILE_OVERLAP):
+        """
+        Run overlapping tile_size slices of a (high-resolution) frame as one batch and
+        merge boxes across tile seams. With rois, only the ROI areas are tiled.
+        returns (N,5) in frame coordinates
+        """
+        regions = roi_windows(frame.shape, rois) if rois else [(0, 0, frame.shape[1], frame.shape[0])]
+        pairs = [(win, region) for region in regions for win in tile_windows(region, tile_size, overlap)]
+        return self._detect_windows(frame, pairs)
+
+    def _detect_windows(self, frame, pairs):
+        """
+        pairs: list of (window, region) pixel rects. Each window crop is inferred in one
+        batch; boxes are shifted back to frame coordinates and merged with NMS
+        (intersection over smaller box), preferring boxes not cut by a seam. Only boxes
+        of different windows suppress each other: each window's output stays as the
+        model returned it (a small person inside a larger box is kept).
+        """
+        if not pairs:
+            return np.zeros((0,5))
+        crops = [frame[y1:y2, x1:x2] for (x1, y1, x2, y2), _ in pairs]
+        results = self.detect_batch(crops)
+
+        merged, cut, source = [], [], []
+        for index, ((window, region), det) in enumerate(zip(pairs, results)):
+            if len(det) == 0:
+                continue
+            det = np.array(det, dtype=float)
+            det[:, [0, 2]] += window[0]
+            det[:, [1, 3]] += window[1]
+            merged.append(det)
+            cut.append(_seam_mask(det, window, region))
+            source.append(np.full(len(det), index))
+        if not merged:
+            return np.zeros((0,5))
+        dets = np.vstack(merged)
+        if len(pairs) == 1:
+            return dets
+        cut = np.concatenate(cut)
+        order = np.lexsort((-dets[:, 4], cut))  # uncut boxes first, then by confidence
+        keep = nms(dets, TILE_NMS_IOU, metric="ios", order=order, groups=np.concatenate(source))
+        return dets[keep]
+
+    def detect_batch(self, frames):
+        """
+        frames: list of BGR numpy arrays
+        returns list of (N,5) arrays, one per frame
+        """
+        if self.server is not None:
+            try:
+                futures = [self.server.submit_async(f) for f in frames]
+                return [fut.result() for fut in futures]
+            except Exception as e:
+                raise RuntimeError(f"Deteksi gagal. Error: {str(e)}")
+        if len(frames) == 0:
+            return []
         try:
-            results = self.model.predict(source=frame, conf=CONF_THRESH, verbose=False)[0]
+            return self.engine.predict_batch(frames)
         except Exception as e:
             raise RuntimeError(f"Deteksi gagal. Error: {str(e)}")
-
-        detections = []
-        for box in results.boxes:
-            cls_id = int(box.cls[0])
-            if cls_id == TARGET_CLASS:
-                x1, y1, x2, y2 = map(int, box.xyxy[0].tolist())
-                conf = float(box.conf[0])
-                detections.append([x1, y1, x2, y2, conf])
-        if len(detections) == 0:
-            return np.zeros((0,5))
-        return np.array(detections)
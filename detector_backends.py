@@ -0,0 +1,153 @@
+# detector_backends.py
+import os
+import logging
+import cv2
+import numpy as np
+
+from config import (MODEL_PATH, CONF_THRESH, TARGET_CLASS, NMS_IOU, MODEL_PRECISION,
+                    ONNX_MODEL_PATH, ONNX_INT8_MODEL_PATH, ONNX_INPUT_SIZE,
+                    ONNX_INTRA_OP_THREADS)
+from utils import nms
+
+
+class UltralyticsBackend:
+    """PyTorch engine through ultralytics YOLO (imported lazily)."""
+    name = "ultralytics"
+
+    def __init__(self, model_path=MODEL_PATH):
+        try:
+            from ultralytics import YOLO
+            self.model = YOLO(model_path)
+        except Exception as e:
+            raise RuntimeError(f"Gagal memuat model dari {model_path}. Error: {str(e)}")
+
+    @staticmethod
+    def _parse_result(result):
+        """Convert one ultralytics result into (N,5) [x1,y1,x2,y2,conf] for TARGET_CLASS."""
+        boxes = result.boxes
+        if boxes is None or len(boxes) == 0:
+            return np.zeros((0,5))
+        cls_ids = boxes.cls.cpu().numpy().astype(int)
+        keep = cls_ids == TARGET_CLASS
+        if not keep.any():
+            return np.zeros((0,5))
+        xyxy = boxes.xyxy.cpu().numpy()[keep].astype(int)
+        conf = boxes.conf.cpu().numpy()[keep]
+        return np.hstack([xyxy.astype(float), conf[:, None].astype(float)])
+
+    def predict_batch(self, frames):
+        results = self.model.predict(source=list(frames), conf=CONF_THRESH, iou=NMS_IOU, verbose=False)
+        return [self._parse_result(r) for r in results]
+
+
+def letterbox(frame, size):
+    """
+    Resize keeping aspect ratio and pad to (size,size) with gray 114 (ultralytics style).
+    returns padded BGR image, gain, (pad_x, pad_y)
+    """
+    h, w = frame.shape[:2]
+    gain = min(size / float(h), size / float(w))
+    new_w, new_h = int(round(w * gain)), int(round(h * gain))
+    dw, dh = (size - new_w) / 2.0, (size - new_h) / 2.0
+    if (new_w, new_h) != (w, h):
+        frame = cv2.resize(frame, (new_w, new_h), interpolation=cv2.INTER_LINEAR)
+    top, bottom = int(round(dh - 0.1)), int(round(dh + 0.1))
+    left, right = int(round(dw - 0.1)), int(round(dw + 0.1))
+    padded = cv2.copyMakeBorder(frame, top, bottom, left, right, cv2.BORDER_CONSTANT,
+                                value=(114, 114, 114))
+    return padded, gain, (left, top)
+
+
+class OnnxBackend:
+    """
+    ONNX Runtime CPU engine for an exported YOLOv8 model.
+    - own letterbox preprocessing (BGR -> RGB, /255, NCHW)
+    - TARGET_CLASS filtering and NumPy NMS inside the engine
+    - intra_op threads configurable (0 = onnxruntime default)
+    - conf_thresh: score cut before NMS (CONF_THRESH; evaluation runs use a low one)
+    model_path defaults to the FP32 or statically quantized INT8 export of MODEL_PATH,
+    depending on MODEL_PRECISION.
+    """
+    name = "onnx"
+
+    def __init__(self, model_path=None, input_size=ONNX_INPUT_SIZE,
+                 threads=ONNX_INTRA_OP_THREADS, precision=MODEL_PRECISION, conf_thresh=CONF_THRESH):
+        self.conf_thresh = float(conf_thresh)
+        if model_path is None:
+            model_path = ONNX_INT8_MODEL_PATH if precision == "int8" else ONNX_MODEL_PATH
+        try:
+            import onnxruntime as ort
+        except ImportError as e:
+            raise RuntimeError(f"onnxruntime belum terpasang: {e}")
+        if not os.path.exists(model_path):
+            hint = "python quantize.py calibrate --video <file>" if precision == "int8" else "python download.py"
+            raise RuntimeError(f"Model ONNX {model_path} tidak ditemukan. Jalankan: {hint}")
+        opts = ort.SessionOptions()
+        opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            opts.intra_op_num_threads = int(threads)
+        opts.inter_op_num_threads = 1
+        self.session = ort.InferenceSession(model_path, sess_options=opts,
+                                            providers=["CPUExecutionProvider"])
+        inp = self.session.get_inputs()[0]
+        self.input_name = inp.name
+        self.input_dtype = np.float16 if "float16" in inp.type else np.float32
+        self.input_size = int(input_size)
+        # fixed batch dimension (default export) -> run frames one by one
+        self.dynamic_batch = not isinstance(inp.shape[0], int)
+        logging.info(f"[OnnxBackend] loaded {model_path} (dynamic batch: {self.dynamic_batch})")
+
+    def _preprocess(self, frame):
+        img, gain, pad = letterbox(frame, self.input_size)
+        blob = cv2.cvtColor(img, cv2.COLOR_BGR2RGB).transpose(2, 0, 1)
+        return blob, gain, pad
+
+    def _postprocess(self, pred, gain, pad, shape):
+        """pred: (4+nc, A) raw YOLOv8 head output for one image."""
+        pred = pred.T
+        scores = pred[:, 4:]
+        cand = np.flatnonzero(scores[:, TARGET_CLASS] >= self.conf_thresh)
+        if len(cand) == 0:
+            return np.zeros((0,5))
+        # like ultralytics: a box counts as TARGET_CLASS only if it is its best class
+        cand = cand[scores[cand].argmax(axis=1) == TARGET_CLASS]
+        if len(cand) == 0:
+            return np.zeros((0,5))
+        cx, cy, w, h = pred[cand, 0], pred[cand, 1], pred[cand, 2], pred[cand, 3]
+        boxes = np.stack([cx - w / 2, cy - h / 2, cx + w / 2, cy + h / 2], axis=1)
+        boxes[:, [0, 2]] = (boxes[:, [0, 2]] - pad[0]) / gain
+        boxes[:, [1, 3]] = (boxes[:, [1, 3]] - pad[1]) / gain
+        boxes[:, [0, 2]] = boxes[:, [0, 2]].clip(0, shape[1])
+        boxes[:, [1, 3]] = boxes[:, [1, 3]].clip(0, shape[0])
+        dets = np.hstack([boxes, scores[cand, TARGET_CLASS][:, None]]).astype(float)
+        dets = dets[nms(dets, NMS_IOU)]
+        dets[:, :4] = dets[:, :4].astype(int)
+        return dets
+
+    def _run(self, blobs):
+        x = np.ascontiguousarray(np.stack(blobs), dtype=self.input_dtype) / self.input_dtype(255.0)
+        return self.session.run(None, {self.input_name: x})[0]
+
+    def predict_batch(self, frames):
+        prepped = [self._preprocess(f) for f in frames]
+        if self.dynamic_batch:
+            outputs = self._run([p[0] for p in prepped])
+        else:
+            outputs = [self._run([p[0]])[0] for p in prepped]
+        return [self._postprocess(np.asarray(out, dtype=np.float32), gain, pad, f.shape)
+                for out, (_, gain, pad), f in zip(outputs, prepped, frames)]
+
+
+BACKENDS = {
+    "ultralytics": UltralyticsBackend,
+    "onnx": OnnxBackend,
+}
+
+
+def make_backend(name, **kwargs):
+    """Create a detection engine by name ("ultralytics" or "onnx")."""
+    if name not in BACKENDS:
+        raise ValueError(f"Backend detector tidak dikenal: {name} (pilihan: {', '.join(BACKENDS)})")
+    if name == "ultralytics" and MODEL_PRECISION == "int8":
+        raise ValueError('MODEL_PRECISION = "int8" membutuhkan DETECTOR_BACKEND = "onnx"')
+    return BACKENDS[name](**kwargs)
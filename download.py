@@ -1,2 +1,7 @@
 from ultralytics import YOLO
-YOLO('yolov8n.pt')  # Ini otomatis mengunduh model asli jika belum ada
+from config import MODEL_PATH, ONNX_INPUT_SIZE
+
+model = YOLO(MODEL_PATH)  # Ini otomatis mengunduh model asli jika belum ada
+
+# Export ke ONNX (batch dinamis) untuk DETECTOR_BACKEND = "onnx"
+model.export(format="onnx", imgsz=ONNX_INPUT_SIZE, dynamic=True, simplify=True)
@@ -0,0 +1,207 @@
+# headless.py
+# Pipeline tanpa UI: Detector + Tracker (+ RTSPStream untuk stream live), hasil ke sink.
+#
+#   python headless.py rtsp://host/stream video/a.mp4 --sink jsonl --out hasil.jsonl
+#   python headless.py --list kumpulan_rtsp.txt --sink csv --out hasil.csv
+#
+# Stream (rtsp/http) diproses frame terbaru saja; file video diproses setiap frame secepat mungkin.
+import os
+import csv
+import sys
+import json
+import time
+import signal
+import argparse
+import logging
+import threading
+
+from camera_worker import CameraPipeline, init_log_file, write_log_csv, camera_policy
+from camera_manager import load_camera_list
+from capture_backends import open_capture
+from detector import get_shared_server
+from rtsp_handler import RTSPStream
+from utils import redact_url
+from metrics import REGISTRY, start_metrics_server
+from config import (RTSP_FRAME_WIDTH, RTSP_FRAME_HEIGHT, RTSP_DETECT_EVERY, FRAME_WAIT_TIMEOUT,
+                    INFER_SHARED, METRICS_PORT)
+
+
+def is_stream(source):
+    return source.split("://", 1)[0].lower() in ("rtsp", "rtsps", "http", "https")
+
+
+def track_rows(tracker):
+    """[[track_id, x1, y1, x2, y2], ...] from the tracker's struct-of-arrays columns."""
+    ids, boxes = tracker.ids, tracker.boxes
+    return [[int(i)] + [round(float(v), 1) for v in b] for i, b in zip(ids, boxes)]
+
+
+class NullSink:
+    """Discard results (throughput measurement)."""
+    def write(self, record):
+        pass
+
+    def close(self):
+        pass
+
+
+class JsonlSink:
+    """One JSON object per processed frame."""
+    def __init__(self, path=None):
+        self._f = open(path, "w", encoding="utf-8") if path else sys.stdout
+        self._lock = threading.Lock()
+
+    def write(self, record):
+        line = json.dumps(record, separators=(",", ":"))
+        with self._lock:
+            self._f.write(line + "\n")
+
+    def close(self):
+        if self._f is not sys.stdout:
+            self._f.close()
+        else:
+            self._f.flush()
+
+
+class CsvSink:
+    """One row per detection / track: timestamp,cam_id,frame,kind,id,x1,y1,x2,y2,conf."""
+    def __init__(self, path=None):
+        self._f = open(path, "w", newline="", encoding="utf-8") if path else sys.stdout
+        self._w = csv.writer(self._f)
+        self._w.writerow(["timestamp", "cam_id", "frame", "kind", "id", "x1", "y1", "x2", "y2", "conf"])
+        self._lock = threading.Lock()
+
+    def write(self, record):
+        ts, cam, n = record["ts"], record["cam_id"], record["frame"]
+        rows = [[ts, cam, n, "det", "", *d[:4], d[4]] for d in record["detections"] or []]
+        rows += [[ts, cam, n, "track", t[0], *t[1:5], ""] for t in record["tracks"]]
+        if rows:
+            with self._lock:
+                self._w.writerows(rows)
+
+    def close(self):
+        if self._f is not sys.stdout:
+            self._f.close()
+        else:
+            self._f.flush()
+
+
+SINKS = {"jsonl": JsonlSink, "csv": CsvSink, "null": NullSink}
+
+
+def make_sink(name, path=None):
+    if name not in SINKS:
+        raise ValueError(f"Sink tidak dikenal: {name} (pilihan: {', '.join(SINKS)})")
+    return SINKS[name]() if name == "null" else SINKS[name](path)
+
+
+def _emit(sink, pipeline, source, dets):
+    sink.write({
+        "ts": round(time.time(), 3),
+        "cam_id": pipeline.cam_id,
+        "source": source,
+        "frame": pipeline.frame_count,
+        "detections": None if dets is None else [[round(float(v), 3) for v in d[:5]] for d in dets],
+        "tracks": track_rows(pipeline.tracker),
+    })
+
+
+def run_source(cam_id, source, sink, stop_event, args, stats):
+    """Process one stream or file until it ends, max_frames is reached or stop_event is set."""
+    log_path = os.path.join(args.log_dir, f"log_headless_cam{cam_id}.csv")
+    init_log_file(log_path)
+    write_log_csv(log_path, "INFO", f"Headless worker started for cam{cam_id}: {redact_url(source)}")
+    pipeline = CameraPipeline(cam_id, args.width, args.height, args.detect_every, log_path)
+    t0 = time.monotonic()
+    try:
+        if is_stream(source):
+            rtsp = RTSPStream(source, name=pipeline.label, policy=camera_policy(cam_id))
+            last_seq = 0
+            try:
+                while not stop_event.is_set() and pipeline.frame_count < args.max_frames:
+                    with rtsp.borrow(after=last_seq, timeout=FRAME_WAIT_TIMEOUT) as (seq, frame):
+                        if frame is None:
+                            continue
+                        last_seq = seq
+                        captured = rtsp.captured_at(seq)
+                        _, dets, _ = pipeline.process(frame)
+                    # None once the ring was rebuilt (resolution change after a reconnect)
+                    if captured is not None:
+                        REGISTRY.observe(pipeline.label, "frame_age", time.monotonic() - captured)
+                    _emit(sink, pipeline, source, dets)
+            finally:
+                rtsp.stop()
+        else:
+            cap = open_capture(source)
+            if not cap.isOpened():
+                raise RuntimeError(f"Tidak dapat membuka sumber {source}")
+            try:
+                while not stop_event.is_set() and pipeline.frame_count < args.max_frames:
+                    ret, frame = cap.read()
+                    if not ret:
+                        break
+                    _, dets, _ = pipeline.process(frame)
+                    _emit(sink, pipeline, source, dets)
+            finally:
+                cap.release()
+    except Exception as e:
+        logging.exception(f"[headless] cam{cam_id} {source}: {e}")
+        write_log_csv(log_path, "ERROR", f"Headless worker error: {e}")
+    finally:
+        pipeline.close()
+    elapsed = max(time.monotonic() - t0, 1e-6)
+    stats[cam_id] = {"source": source, "frames": pipeline.frame_count,
+                     "fps": round(pipeline.frame_count / elapsed, 2)}
+    write_log_csv(log_path, "INFO", f"Headless worker stopped for cam{cam_id}")
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Headless detection + tracking pipeline (no UI, no drawing)")
+    ap.add_argument("sources", nargs="*", help="RTSP/HTTP URLs or video files")
+    ap.add_argument("--list", help="camera list file (one URL per line, like kumpulan_rtsp.txt)")
+    ap.add_argument("--sink", default="jsonl", choices=sorted(SINKS))
+    ap.add_argument("--out", help="output file for the sink (default: stdout)")
+    ap.add_argument("--width", type=int, default=RTSP_FRAME_WIDTH)
+    ap.add_argument("--height", type=int, default=RTSP_FRAME_HEIGHT)
+    ap.add_argument("--detect-every", type=int, default=RTSP_DETECT_EVERY)
+    ap.add_argument("--max-frames", type=int, default=sys.maxsize, help="per source")
+    ap.add_argument("--duration", type=float, default=0, help="stop after N seconds (0 = until sources end)")
+    ap.add_argument("--log-dir", default=".")
+    ap.add_argument("--metrics-port", type=int, default=METRICS_PORT, help="0 = no metrics endpoint")
+    args = ap.parse_args()
+
+    sources = list(args.sources)
+    if args.list:
+        sources += [url for _, url in load_camera_list(args.list)]
+    if not sources:
+        ap.error("tidak ada sumber: berikan URL/file atau --list")
+
+    sink = make_sink(args.sink, args.out)
+    if args.metrics_port:
+        start_metrics_server(args.metrics_port)
+    stop_event = threading.Event()
+    signal.signal(signal.SIGINT, lambda *_: stop_event.set())
+    signal.signal(signal.SIGTERM, lambda *_: stop_event.set())
+
+    stats = {}
+    threads = [threading.Thread(target=run_source, args=(i, src, sink, stop_event, args, stats),
+                                daemon=True, name=f"cam{i}")
+               for i, src in enumerate(sources, start=1)]
+    t0 = time.monotonic()
+    for th in threads:
+        th.start()
+    while any(th.is_alive() for th in threads):
+        if args.duration and time.monotonic() - t0 >= args.duration:
+            stop_event.set()
+        for th in threads:
+            th.join(timeout=0.5)
+    sink.close()
+
+    summary = {"elapsed_s": round(time.monotonic() - t0, 2), "sources": stats}
+    if INFER_SHARED:
+        summary["inference"] = dict(get_shared_server().stats)
+    print(json.dumps(summary, indent=2), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
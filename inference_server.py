@@ -0,0 +1,102 @@
+# inference_server.py
+import threading
+import queue
+import time
+import logging
+from concurrent.futures import Future
+
+from metrics import REGISTRY
+
+
+class InferenceServer:
+    """
+    Shared batching front-end for one detection model.
+    - submit() queues a frame from any thread and blocks until its (N,5) result is ready.
+    - a single background thread packs up to batch_size pending frames (waiting at most
+      max_wait_ms for the batch to fill) into one batch_fn call.
+    batch_fn: callable(list of BGR frames) -> list of (N,5) arrays, same order.
+    """
+    def __init__(self, batch_fn, batch_size=8, max_wait_ms=15.0, name="infer"):
+        self.batch_fn = batch_fn
+        self.batch_size = max(1, int(batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self.name = name
+        self._queue = queue.Queue()
+        self._running = True
+        self._lock = threading.Lock()
+        self.stats = {"batches": 0, "frames": 0, "errors": 0}
+        REGISTRY.register_gauge(name, "queue_depth", self._queue.qsize)
+        self._thread = threading.Thread(target=self._loop, name=f"{name}-server", daemon=True)
+        self._thread.start()
+
+    def submit_async(self, frame):
+        """Queue a frame; returns a Future resolving to its (N,5) detections."""
+        if not self._running:
+            raise RuntimeError(f"[InferenceServer] {self.name} sudah dihentikan")
+        fut = Future()
+        self._queue.put((frame, fut))
+        return fut
+
+    def submit(self, frame, timeout=None):
+        """Queue a frame and wait for its (N,5) detections."""
+        return self.submit_async(frame).result(timeout=timeout)
+
+    def _collect(self):
+        # block for the first request, then fill the batch until full or deadline
+        try:
+            first = self._queue.get(timeout=0.5)
+        except queue.Empty:
+            return []
+        if first is None:
+            return []
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self._queue.get_nowait() if remaining <= 0 else self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is None:
+                break
+            batch.append(item)
+        return batch
+
+    def _loop(self):
+        while self._running:
+            batch = self._collect()
+            if not batch:
+                continue
+            frames = [frame for frame, _ in batch]
+            t0 = time.perf_counter()
+            try:
+                results = self.batch_fn(frames)
+            except Exception as e:
+                logging.exception("[InferenceServer] batch of %d failed: %s", len(frames), e)
+                with self._lock:
+                    self.stats["errors"] += 1
+                for _, fut in batch:
+                    fut.set_exception(e)
+                continue
+            REGISTRY.observe(self.name, "infer_batch", time.perf_counter() - t0)
+            REGISTRY.inc(self.name, "inferred_frames", len(frames))
+            with self._lock:
+                self.stats["batches"] += 1
+                self.stats["frames"] += len(frames)
+            for (_, fut), res in zip(batch, results):
+                fut.set_result(res)
+
+    def stop(self):
+        """Stop the batching thread; pending requests are failed."""
+        self._running = False
+        self._queue.put(None)
+        if self._thread.is_alive():
+            self._thread.join(timeout=1.0)
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not None:
+                item[1].set_exception(RuntimeError("InferenceServer stopped"))
+        logging.info(f"[InferenceServer] stopped {self.name}")
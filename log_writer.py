@@ -0,0 +1,227 @@
+# log_writer.py
+import os
+import csv
+import glob
+import time
+import queue
+import atexit
+import logging
+import threading
+from datetime import datetime
+try:
+    import fcntl          # POSIX: file locks shared with other processes
+except ImportError:
+    fcntl = None
+
+from config import (LOG_FLUSH_ROWS, LOG_FLUSH_INTERVAL, LOG_QUEUE_MAX, LOG_ROTATE_BYTES,
+                    LOG_ROTATE_DAILY, LOG_ROTATE_KEEP)
+
+LOG_HEADER = ["timestamp", "event_type", "message"]
+
+
+class _OpenLog:
+    def __init__(self, path, header):
+        self.f = open(path, "a", newline="", encoding="utf-8")
+        self.writer = csv.writer(self.f)
+        self.header = header
+        # day of the rows already in the file (last write), so rows left from before a
+        # restart on a new day are still rotated under their own date
+        st = os.fstat(self.f.fileno())
+        self.day = datetime.fromtimestamp(st.st_mtime).date() if st.st_size else datetime.now().date()
+
+    def write_header(self):
+        # under the lock, so two processes creating the file write one header
+        if self.header and os.fstat(self.f.fileno()).st_size == 0:
+            self.writer.writerow(self.header)
+            self.f.flush()
+
+    def lock(self):
+        if fcntl is not None:
+            fcntl.flock(self.f.fileno(), fcntl.LOCK_EX)
+
+    def unlock(self):
+        if fcntl is not None:
+            fcntl.flock(self.f.fileno(), fcntl.LOCK_UN)
+
+    def is_current(self, path):
+        """False once another process rotated (renamed) the file this handle writes to."""
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            return False
+        own = os.fstat(self.f.fileno())
+        return (st.st_dev, st.st_ino) == (own.st_dev, own.st_ino)
+
+
+class CsvLogWriter:
+    """
+    Background CSV writer: callers only enqueue rows, one thread does all file I/O.
+    - rows are written in batches when flush_rows are pending or flush_interval elapsed
+    - files stay open between batches; one writer thread per process, so rows of
+      different threads never interleave inside a line
+    - several processes may write the same file (camera worker processes and the UI
+      both log to log_rtsp_cam<id>.csv): each batch is appended under an exclusive
+      flock, a handle whose file another process rotated away is reopened, and the
+      rotation size is the file's real size (POSIX; without fcntl, one process per file)
+    - rotation: current file renamed to <name>.<stamp>.csv when it grows past rotate_bytes
+      or (rotate_daily) on the first row of a new day; only rotate_keep old files are kept
+    - write() never blocks: when the queue is full the row is dropped and counted
+    """
+    def __init__(self, flush_rows=LOG_FLUSH_ROWS, flush_interval=LOG_FLUSH_INTERVAL,
+                 max_queue=LOG_QUEUE_MAX, rotate_bytes=LOG_ROTATE_BYTES,
+                 rotate_daily=LOG_ROTATE_DAILY, rotate_keep=LOG_ROTATE_KEEP, header=LOG_HEADER):
+        self.flush_rows = max(1, int(flush_rows))
+        self.flush_interval = float(flush_interval)
+        self.rotate_bytes = int(rotate_bytes)
+        self.rotate_daily = bool(rotate_daily)
+        self.rotate_keep = int(rotate_keep)
+        self.header = header
+        self._queue = queue.Queue(maxsize=int(max_queue))
+        self._files = {}            # path -> _OpenLog
+        self._io_lock = threading.Lock()
+        self._running = True
+        self.stats = {"rows": 0, "batches": 0, "dropped": 0, "rotations": 0, "errors": 0}
+        self._thread = threading.Thread(target=self._loop, name="csv-log-writer", daemon=True)
+        self._thread.start()
+
+    def write(self, path, row):
+        """Queue one row for path (non-blocking)."""
+        try:
+            self._queue.put_nowait((path, row))
+        except queue.Full:
+            self.stats["dropped"] += 1
+
+    def touch(self, path):
+        """Create path with its header now (synchronous, for UI download buttons)."""
+        with self._io_lock:
+            self._acquire(path).unlock()
+
+    def flush(self, timeout=5.0):
+        """Wait until every row queued so far is on disk."""
+        done = threading.Event()
+        try:
+            self._queue.put((None, done), timeout=timeout)
+        except queue.Full:
+            return False
+        return done.wait(timeout)
+
+    def _open(self, path):
+        log = self._files.get(path)
+        if log is None:
+            log = self._files[path] = _OpenLog(path, self.header)
+        return log
+
+    def _close(self, path, log):
+        log.f.close()          # also releases the flock
+        self._files.pop(path, None)
+
+    def _acquire(self, path):
+        """Open log of path, locked, that is still the file at path (caller must unlock/close)."""
+        while True:
+            log = self._open(path)
+            log.lock()
+            if log.is_current(path):
+                log.write_header()
+                return log
+            # rotated by another process while we held the old handle
+            self._close(path, log)
+
+    def _rotate(self, path, log, stamp):
+        # caller holds log's lock: rename first, then closing the handle releases it
+        base, ext = os.path.splitext(path)
+        target = f"{base}.{stamp}{ext}"
+        n = 1
+        while os.path.exists(target):
+            target = f"{base}.{stamp}-{n}{ext}"
+            n += 1
+        try:
+            os.replace(path, target)
+        finally:
+            self._close(path, log)
+        self.stats["rotations"] += 1
+        if self.rotate_keep > 0:
+            old = sorted(glob.glob(f"{glob.escape(base)}.*{ext}"), key=os.path.getmtime)
+            for p in old[:-self.rotate_keep]:
+                try:
+                    os.remove(p)
+                except OSError:
+                    pass
+
+    def _write_batch(self, batch):
+        by_path = {}
+        waiters = []
+        for path, row in batch:
+            if path is None:
+                waiters.append(row)
+            else:
+                by_path.setdefault(path, []).append(row)
+        with self._io_lock:
+            for path, rows in by_path.items():
+                try:
+                    log = self._acquire(path)
+                    if self.rotate_daily and log.day != datetime.now().date():
+                        self._rotate(path, log, log.day.isoformat())
+                        log = self._acquire(path)
+                    try:
+                        log.writer.writerows(rows)
+                        log.f.flush()
+                        # real size: other processes append to the same file
+                        if self.rotate_bytes > 0 and os.fstat(log.f.fileno()).st_size >= self.rotate_bytes:
+                            self._rotate(path, log, datetime.now().strftime("%Y%m%d-%H%M%S"))
+                    finally:
+                        if not log.f.closed:
+                            log.unlock()
+                    self.stats["rows"] += len(rows)
+                except Exception as e:
+                    self.stats["errors"] += 1
+                    logging.exception(f"[CsvLogWriter] write to {path} failed: {e}")
+            self.stats["batches"] += 1
+        for done in waiters:
+            done.set()
+
+    def _loop(self):
+        batch = []
+        deadline = time.monotonic() + self.flush_interval
+        while self._running or not self._queue.empty():
+            try:
+                item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                batch.append(item)
+            except queue.Empty:
+                pass
+            # a flush() marker forces the batch out immediately
+            marker = batch and batch[-1][0] is None
+            if batch and (marker or len(batch) >= self.flush_rows or time.monotonic() >= deadline):
+                self._write_batch(batch)
+                batch = []
+            if time.monotonic() >= deadline:
+                deadline = time.monotonic() + self.flush_interval
+        if batch:
+            self._write_batch(batch)
+
+    def close(self):
+        """Write everything pending and close the files."""
+        if not self._running:
+            return
+        self._running = False
+        self._thread.join(timeout=5.0)
+        with self._io_lock:
+            for log in self._files.values():
+                try:
+                    log.f.close()
+                except Exception:
+                    pass
+            self._files.clear()
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_log_writer():
+    """Process-wide CsvLogWriter (started on first use, flushed at exit)."""
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = CsvLogWriter()
+            atexit.register(_writer.close)
+        return _writer
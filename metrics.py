@@ -0,0 +1,198 @@
+# metrics.py
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import numpy as np
+
+from config import METRICS_ENABLED, METRICS_WINDOW, METRICS_BUCKETS
+
+PREFIX = "cctv"
+
+
+class LatencyHistogram:
+    """
+    Cumulative Prometheus histogram (fixed buckets, seconds) plus a ring of the last
+    `window` samples for p50/p95/p99.
+    """
+    def __init__(self, buckets=METRICS_BUCKETS, window=METRICS_WINDOW):
+        self.buckets = np.asarray(buckets, dtype=float)
+        self.counts = np.zeros(len(self.buckets) + 1, dtype=np.int64)   # last = +Inf
+        self.sum = 0.0
+        self.count = 0
+        self._ring = np.zeros(max(1, int(window)), dtype=float)
+        self._pos = 0
+
+    def observe(self, seconds):
+        self.counts[np.searchsorted(self.buckets, seconds)] += 1
+        self.sum += seconds
+        self.count += 1
+        self._ring[self._pos % len(self._ring)] = seconds
+        self._pos += 1
+
+    def quantiles(self, qs=(0.5, 0.95, 0.99)):
+        n = min(self._pos, len(self._ring))
+        if n == 0:
+            return {q: float("nan") for q in qs}
+        vals = np.percentile(self._ring[:n], [q * 100 for q in qs])
+        return dict(zip(qs, vals))
+
+
+class MetricsRegistry:
+    """
+    Per-camera pipeline metrics.
+    - observe(camera, stage, seconds) / timer(camera, stage): stage latency histograms
+      (capture, resize, detect, track, draw, encode, display, ...)
+    - inc(camera, name): counters (frames, dropped_frames, reconnects, ...)
+    - set_gauge / register_gauge(camera, name, fn): gauges, fn() evaluated at scrape
+      time (queue depth)
+    - render(): Prometheus text exposition format
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._hist = {}       # (camera, stage) -> LatencyHistogram
+        self._counters = {}   # (camera, name) -> int
+        self._gauges = {}     # (camera, name) -> value or callable
+
+    def observe(self, camera, stage, seconds):
+        key = (str(camera), stage)
+        with self._lock:
+            hist = self._hist.get(key)
+            if hist is None:
+                hist = self._hist[key] = LatencyHistogram()
+            hist.observe(seconds)
+
+    @contextmanager
+    def timer(self, camera, stage):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(camera, stage, time.perf_counter() - t0)
+
+    def inc(self, camera, name, n=1):
+        key = (str(camera), name)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + n
+
+    def set_gauge(self, camera, name, value):
+        with self._lock:
+            self._gauges[(str(camera), name)] = value
+
+    def register_gauge(self, camera, name, fn):
+        self.set_gauge(camera, name, fn)
+
+    def unregister(self, camera):
+        """Drop the gauges of a stopped camera (histograms and counters are kept)."""
+        camera = str(camera)
+        with self._lock:
+            for key in [k for k in self._gauges if k[0] == camera]:
+                del self._gauges[key]
+
+    def summary(self, camera):
+        """{stage: {"p50","p95","p99","count"}} + counters and set gauges, for UI status lines."""
+        camera = str(camera)
+        with self._lock:
+            out = {stage: dict(zip(("p50", "p95", "p99"), h.quantiles().values()), count=h.count)
+                   for (cam, stage), h in self._hist.items() if cam == camera}
+            out.update({name: v for (cam, name), v in self._counters.items() if cam == camera})
+            out.update({name: v for (cam, name), v in self._gauges.items()
+                        if cam == camera and not callable(v)})
+        return out
+
+    def render(self):
+        lines = []
+        with self._lock:
+            hists = sorted(self._hist.items())
+            counters = sorted(self._counters.items())
+            gauges = sorted(self._gauges.items(), key=lambda kv: kv[0])
+
+            lines.append(f"# HELP {PREFIX}_stage_latency_seconds Pipeline stage latency per camera.")
+            lines.append(f"# TYPE {PREFIX}_stage_latency_seconds histogram")
+            for (cam, stage), h in hists:
+                labels = f'camera="{cam}",stage="{stage}"'
+                cum = np.cumsum(h.counts)
+                for le, c in zip(h.buckets, cum[:-1]):
+                    lines.append(f'{PREFIX}_stage_latency_seconds_bucket{{{labels},le="{le:g}"}} {int(c)}')
+                lines.append(f'{PREFIX}_stage_latency_seconds_bucket{{{labels},le="+Inf"}} {int(cum[-1])}')
+                lines.append(f"{PREFIX}_stage_latency_seconds_sum{{{labels}}} {h.sum:.6f}")
+                lines.append(f"{PREFIX}_stage_latency_seconds_count{{{labels}}} {h.count}")
+
+            lines.append(f"# HELP {PREFIX}_stage_latency_quantile_seconds Recent-window latency quantiles.")
+            lines.append(f"# TYPE {PREFIX}_stage_latency_quantile_seconds gauge")
+            for (cam, stage), h in hists:
+                for q, v in h.quantiles().items():
+                    lines.append(f'{PREFIX}_stage_latency_quantile_seconds'
+                                 f'{{camera="{cam}",stage="{stage}",quantile="{q:g}"}} {v:.6f}')
+
+            for name in sorted({n for (_, n), _ in counters}):
+                lines.append(f"# TYPE {PREFIX}_{name}_total counter")
+                for (cam, n), v in counters:
+                    if n == name:
+                        lines.append(f'{PREFIX}_{name}_total{{camera="{cam}"}} {v}')
+
+            for name in sorted({n for (_, n), _ in gauges}):
+                lines.append(f"# TYPE {PREFIX}_{name} gauge")
+                for (cam, n), v in gauges:
+                    if n != name:
+                        continue
+                    try:
+                        val = float(v() if callable(v) else v)
+                    except Exception:
+                        continue
+                    lines.append(f'{PREFIX}_{name}{{camera="{cam}"}} {val:g}')
+        return "\n".join(lines) + "\n"
+
+
+class _NullRegistry(MetricsRegistry):
+    """METRICS_ENABLED = False: every hook is a no-op."""
+    def observe(self, camera, stage, seconds):
+        pass
+
+    def inc(self, camera, name, n=1):
+        pass
+
+    def set_gauge(self, camera, name, value):
+        pass
+
+
+REGISTRY = MetricsRegistry() if METRICS_ENABLED else _NullRegistry()
+
+_servers = {}
+_servers_lock = threading.Lock()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?", 1)[0] not in ("/metrics", "/"):
+            self.send_error(404)
+            return
+        body = REGISTRY.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, fmt, *args):
+        pass
+
+
+def start_metrics_server(port, host="127.0.0.1"):
+    """Serve REGISTRY on http://host:port/metrics (once per port per process)."""
+    if not METRICS_ENABLED:
+        return None
+    with _servers_lock:
+        if port in _servers:
+            return _servers[port]
+        try:
+            server = ThreadingHTTPServer((host, int(port)), _Handler)
+        except OSError as e:
+            logging.warning(f"[metrics] cannot listen on {host}:{port}: {e}")
+            return None
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, name=f"metrics-{port}", daemon=True).start()
+        _servers[port] = server
+        logging.info(f"[metrics] serving http://{host}:{port}/metrics")
+        return server
@@ -0,0 +1,103 @@
+# motion_gate.py
+import threading
+import cv2
+import numpy as np
+
+from metrics import REGISTRY
+from config import (MOTION_GATE_WIDTH, MOTION_PIXEL_DELTA, MOTION_THRESHOLD,
+                    MOTION_BUSY_SCORE, MOTION_MAX_SKIP, MOTION_LEARN_RATE)
+
+
+class MotionGate:
+    """
+    Cheap pre-filter in front of Detector.detect.
+    - score(): fraction of pixels of a downscaled, blurred grayscale frame that differ
+      by more than pixel_delta from a running-average background.
+    - should_infer(): False when the score is below threshold (nothing moved), except
+      every max_skip consecutive skips, which force a refresh detection.
+    - level: last score mapped to [0,1] (busy_score -> 1.0), for the DetectionScheduler.
+    - metrics(): counters and thresholds for monitoring. With a `name` (camera label) the
+      decisions also go to the metrics REGISTRY: motion_checked / motion_skipped /
+      motion_forced counters and motion_threshold / motion_score / motion_level gauges.
+    """
+    def __init__(self, threshold=MOTION_THRESHOLD, pixel_delta=MOTION_PIXEL_DELTA,
+                 width=MOTION_GATE_WIDTH, busy_score=MOTION_BUSY_SCORE,
+                 max_skip=MOTION_MAX_SKIP, learn_rate=MOTION_LEARN_RATE, name=None):
+        self.threshold = float(threshold)
+        self.pixel_delta = float(pixel_delta)
+        self.width = int(width)
+        self.busy_score = float(busy_score)
+        self.max_skip = int(max_skip)
+        self.learn_rate = float(learn_rate)
+        self._bg = None
+        self._skips_in_row = 0
+        self._lock = threading.Lock()
+        self.last_score = 0.0
+        self.counters = {"checked": 0, "inferred": 0, "skipped": 0, "forced": 0}
+        self.name = name
+        if name is not None:
+            # evaluated at scrape time, so a retuned threshold shows up immediately
+            REGISTRY.register_gauge(name, "motion_threshold", lambda: self.threshold)
+            REGISTRY.register_gauge(name, "motion_score", lambda: self.last_score)
+            REGISTRY.register_gauge(name, "motion_level", lambda: self.level)
+
+    def _count(self, key):
+        # caller holds self._lock
+        self.counters[key] += 1
+        if self.name is not None and key != "inferred":
+            REGISTRY.inc(self.name, f"motion_{key}")
+
+    def _prepare(self, frame):
+        h, w = frame.shape[:2]
+        small_h = max(1, int(round(h * self.width / float(w))))
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+        small = cv2.resize(gray, (self.width, small_h), interpolation=cv2.INTER_AREA)
+        return cv2.GaussianBlur(small, (5, 5), 0)
+
+    def score(self, frame):
+        """Changed-pixel fraction vs background (updates the background)."""
+        small = self._prepare(frame)
+        if self._bg is None or self._bg.shape != small.shape:
+            self._bg = small.astype(np.float32)
+            return 1.0
+        diff = cv2.absdiff(small, cv2.convertScaleAbs(self._bg))
+        changed = float(np.count_nonzero(diff > self.pixel_delta)) / diff.size
+        cv2.accumulateWeighted(small, self._bg, self.learn_rate)
+        return changed
+
+    @property
+    def level(self):
+        return float(min(1.0, self.last_score / max(self.busy_score, 1e-6)))
+
+    def should_infer(self, frame):
+        """Decide whether this frame is worth running the detector on."""
+        with self._lock:
+            s = self.score(frame)
+            self.last_score = s
+            self._count("checked")
+            if s >= self.threshold:
+                self._skips_in_row = 0
+                self._count("inferred")
+                return True
+            if self._skips_in_row >= self.max_skip:
+                self._skips_in_row = 0
+                self._count("inferred")
+                self._count("forced")
+                return True
+            self._skips_in_row += 1
+            self._count("skipped")
+            return False
+
+    def metrics(self):
+        with self._lock:
+            out = dict(self.counters)
+        out.update({
+            "last_score": round(self.last_score, 5),
+            "level": round(self.level, 3),
+            "threshold": self.threshold,
+            "pixel_delta": self.pixel_delta,
+            "max_skip": self.max_skip,
+        })
+        checked = max(out["checked"], 1)
+        out["skip_ratio"] = round(out["skipped"] / checked, 3)
+        return out
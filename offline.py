@@ -0,0 +1,211 @@
+# offline.py
+# Analisis video offline secepat hardware: decode dan deteksi berjalan paralel (pipeline),
+# frame dikirim ke model dalam batch, beberapa file diproses bersamaan.
+#
+#   python offline.py video/a.mp4 video/b.mp4 --out-dir hasil [--workers 2] [--annotate]
+#
+# Output per video: <nama>_detections.csv, <nama>_tracks.csv, opsional <nama>_annotated.mp4
+# (nama file yang sama dari folder berbeda diberi akhiran _2, _3, ...)
+import os
+import csv
+import sys
+import json
+import time
+import queue
+import argparse
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import cv2
+
+from detector import Detector
+from tracker import Tracker
+from motion_gate import MotionGate
+from camera_worker import normalize_detections
+from render import draw_tracks
+from config import (FRAME_WIDTH, FRAME_HEIGHT, OFFLINE_DETECT_EVERY, OFFLINE_CHUNK,
+                    OFFLINE_WORKERS, OFFLINE_DECODE_QUEUE)
+
+_END = object()
+
+
+def _decode(path, size, out_q, stop_event):
+    """Decoder thread: read + resize every frame into out_q, then _END."""
+    cap = cv2.VideoCapture(path)
+    try:
+        while cap.isOpened() and not stop_event.is_set():
+            ret, frame = cap.read()
+            if not ret:
+                break
+            if (frame.shape[1], frame.shape[0]) != size:
+                frame = cv2.resize(frame, size)
+            out_q.put(frame)
+    finally:
+        cap.release()
+        out_q.put(_END)
+
+
+def output_stems(paths):
+    """Output name per input: the file name without extension, made unique with _2, _3, ..."""
+    stems, seen = [], set()
+    for path in paths:
+        base = stem = os.path.splitext(os.path.basename(path))[0]
+        n = 1
+        while stem in seen:
+            n += 1
+            stem = f"{base}_{n}"
+        seen.add(stem)
+        stems.append(stem)
+    return stems
+
+
+def process_video(path, out_dir, detector=None, detect_every=OFFLINE_DETECT_EVERY,
+                  size=(FRAME_WIDTH, FRAME_HEIGHT), chunk=OFFLINE_CHUNK, annotate=False,
+                  motion_gate=False, progress=None, stop_event=None, stem=None):
+    """
+    Analyse one video file without real-time pacing; returns a summary dict.
+    - a decoder thread keeps up to OFFLINE_DECODE_QUEUE resized frames ready
+    - every detect_every-th frame (that passes the motion gate, if enabled) of a chunk
+      is submitted at once, so the model sees full batches
+    - the tracker then runs over the chunk in frame order
+    progress: optional dict updated with {path: (frames_done, frames_total)}
+    stem: output file name prefix (default: the video file name without extension)
+    """
+    detector = detector or Detector()
+    stop_event = stop_event or threading.Event()
+    os.makedirs(out_dir, exist_ok=True)
+    stem = stem or output_stems([path])[0]
+
+    cap = cv2.VideoCapture(path)
+    if not cap.isOpened():
+        raise RuntimeError(f"Tidak dapat membuka video {path}")
+    fps = cap.get(cv2.CAP_PROP_FPS) or 25.0
+    total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT)) or 0
+    cap.release()
+
+    frames_q = queue.Queue(maxsize=OFFLINE_DECODE_QUEUE)
+    halt = threading.Event()
+    decoder = threading.Thread(target=_decode, args=(path, size, frames_q, halt), daemon=True)
+    decoder.start()
+
+    tracker = Tracker()
+    gate = MotionGate() if motion_gate else None
+    writer = None
+    files = {suffix: os.path.join(out_dir, stem + suffix) for suffix in ("_detections.csv", "_tracks.csv")}
+    if annotate:
+        files["_annotated.mp4"] = os.path.join(out_dir, f"{stem}_annotated.mp4")
+        writer = cv2.VideoWriter(files["_annotated.mp4"], cv2.VideoWriter_fourcc(*"mp4v"), fps, size)
+    det_f = open(files["_detections.csv"], "w", newline="", encoding="utf-8")
+    trk_f = open(files["_tracks.csv"], "w", newline="", encoding="utf-8")
+    det_w, trk_w = csv.writer(det_f), csv.writer(trk_f)
+    det_w.writerow(["frame", "time_s", "x1", "y1", "x2", "y2", "conf"])
+    trk_w.writerow(["frame", "time_s", "track_id", "x1", "y1", "x2", "y2"])
+
+    idx = 0
+    n_detected = 0
+    t0 = time.monotonic()
+    finished = False
+    try:
+        while not finished and not stop_event.is_set():
+            # gather a chunk; the decoder keeps filling the queue meanwhile
+            frames = []
+            while len(frames) < chunk:
+                item = frames_q.get()
+                if item is _END:
+                    finished = True
+                    break
+                frames.append(item)
+            if not frames:
+                break
+
+            picks = [i for i in range(len(frames)) if (idx + i) % detect_every == 0]
+            if gate is not None:
+                picks = [i for i in picks if gate.should_infer(frames[i])]
+            results = dict(zip(picks, detector.detect_batch([frames[i] for i in picks])))
+            n_detected += len(picks)
+
+            for i, frame in enumerate(frames):
+                n = idx + i
+                t = round(n / fps, 3)
+                dets = normalize_detections(results[i]) if i in results else None
+                if dets is not None:
+                    det_w.writerows([n, t, *map(int, d[:4]), round(float(d[4]), 4)] for d in dets)
+                tracker.update(dets, {"img_shape": frame.shape, "img_size": frame.shape[:2]})
+                trk_w.writerows([n, t, int(tid), *map(int, box)]
+                                for tid, box in zip(tracker.ids, tracker.boxes))
+                if writer is not None:
+                    writer.write(draw_tracks(frame, tracker))
+            idx += len(frames)
+            if progress is not None:
+                progress[path] = (idx, total)
+    finally:
+        halt.set()
+        # unblock the decoder if it waits on a full queue
+        while decoder.is_alive():
+            try:
+                frames_q.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        det_f.close()
+        trk_f.close()
+        if writer is not None:
+            writer.release()
+
+    elapsed = max(time.monotonic() - t0, 1e-6)
+    return {
+        "video": path,
+        "frames": idx,
+        "detected_frames": n_detected,
+        "elapsed_s": round(elapsed, 2),
+        "fps": round(idx / elapsed, 1),
+        "realtime_factor": round(idx / fps / elapsed, 1),
+        "stopped": stop_event.is_set(),
+        "outputs": files,
+    }
+
+
+def process_videos(paths, out_dir, workers=OFFLINE_WORKERS, progress=None, stop_event=None, **kwargs):
+    """
+    Process several files in parallel; all of them share one Detector, so with
+    INFER_SHARED their frames are packed into the same inference batches.
+    Returns the summaries in input order (errors as {"video", "error"}).
+    """
+    detector = Detector()
+
+    def run(path, stem):
+        try:
+            return process_video(path, out_dir, detector=detector, progress=progress,
+                                 stop_event=stop_event, stem=stem, **kwargs)
+        except Exception as e:
+            logging.exception(f"[offline] {path}: {e}")
+            return {"video": path, "error": str(e)}
+
+    # inputs with the same file name (a/cam.mp4, b/cam.mp4) must not share output files
+    with ThreadPoolExecutor(max_workers=max(1, int(workers))) as pool:
+        return list(pool.map(run, paths, output_stems(paths)))
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Offline batch video analysis (faster than real time)")
+    ap.add_argument("videos", nargs="+")
+    ap.add_argument("--out-dir", default="offline_output")
+    ap.add_argument("--workers", type=int, default=OFFLINE_WORKERS, help="files processed in parallel")
+    ap.add_argument("--detect-every", type=int, default=OFFLINE_DETECT_EVERY)
+    ap.add_argument("--chunk", type=int, default=OFFLINE_CHUNK, help="frames per detection chunk")
+    ap.add_argument("--width", type=int, default=FRAME_WIDTH)
+    ap.add_argument("--height", type=int, default=FRAME_HEIGHT)
+    ap.add_argument("--annotate", action="store_true", help="also write <name>_annotated.mp4")
+    ap.add_argument("--motion-gate", action="store_true", help="skip detection on static frames")
+    args = ap.parse_args()
+
+    results = process_videos(args.videos, args.out_dir, workers=args.workers,
+                             detect_every=max(1, args.detect_every), chunk=max(1, args.chunk),
+                             size=(args.width, args.height), annotate=args.annotate,
+                             motion_gate=args.motion_gate)
+    print(json.dumps(results, indent=2))
+    if any("error" in r for r in results):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
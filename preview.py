@@ -0,0 +1,237 @@
+# preview.py
+import re
+import time
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import cv2
+
+from metrics import REGISTRY
+from config import (PREVIEW_WIDTH, PREVIEW_JPEG_QUALITY, PREVIEW_FPS, PREVIEW_IDLE_TIMEOUT,
+                    FRAME_WAIT_TIMEOUT)
+
+BOUNDARY = "frame"
+
+
+class PreviewStream:
+    """
+    JPEG preview of one camera, encoded once for every viewer.
+    - one encoder thread, started by the first subscribe() and stopped after
+      idle_timeout seconds without viewers; frames are only encoded while someone watches
+    - the encoder polls source() at most `fps` times per second and skips frames it
+      already encoded, downscales to `width` (aspect kept) and stores the JPEG bytes
+    - viewers block in wait(after) and get the newest JPEG; a slow viewer skips
+      frames instead of holding anyone else back
+    """
+    def __init__(self, label, source, width=PREVIEW_WIDTH, quality=PREVIEW_JPEG_QUALITY,
+                 fps=PREVIEW_FPS, idle_timeout=PREVIEW_IDLE_TIMEOUT):
+        self.label = label
+        self.source = source            # () -> newest BGR frame or None
+        self.width = int(width)
+        self.quality = int(quality)
+        if fps <= 0:
+            raise ValueError(f"PREVIEW_FPS harus > 0 (sekarang {fps})")
+        self.interval = 1.0 / fps
+        self.idle_timeout = idle_timeout
+        self._cond = threading.Condition()
+        self._jpeg = None
+        self._seq = 0
+        self._viewers = 0
+        self._thread = None
+        self._closed = False
+        REGISTRY.register_gauge(label, "preview_viewers", lambda: self._viewers)
+
+    @property
+    def viewers(self):
+        return self._viewers
+
+    def subscribe(self):
+        with self._cond:
+            if self._closed:
+                raise RuntimeError(f"Preview {self.label} sudah ditutup")
+            self._viewers += 1
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True, name=f"preview-{self.label}")
+                self._thread.start()
+
+    def unsubscribe(self):
+        with self._cond:
+            self._viewers = max(0, self._viewers - 1)
+
+    def wait(self, after, timeout=None):
+        """(seq, jpeg bytes) newer than `after`, or (after, None) on timeout/close."""
+        with self._cond:
+            self._cond.wait_for(lambda: self._seq > after or self._closed, timeout)
+            if self._seq <= after:
+                return after, None
+            return self._seq, self._jpeg
+
+    @property
+    def closed(self):
+        return self._closed
+
+    def encode(self, frame):
+        """BGR frame -> JPEG bytes at the preview width and quality."""
+        h, w = frame.shape[:2]
+        if 0 < self.width < w:
+            size = (self.width, max(1, round(h * self.width / w)))
+            frame = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+        ok, buf = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+        return buf.tobytes() if ok else None
+
+    def _run(self):
+        last = None
+        idle_since = None
+        while not self._closed:
+            t0 = time.monotonic()
+            with self._cond:
+                if self._viewers == 0:
+                    if idle_since is None:
+                        idle_since = t0
+                    elif t0 - idle_since >= self.idle_timeout:
+                        self._thread = None
+                        return
+                else:
+                    idle_since = None
+                watched = self._viewers > 0
+            if watched:
+                frame = self.source()
+                # workers publish a new array per frame: same object = already encoded
+                if frame is not None and frame is not last:
+                    last = frame
+                    try:
+                        with REGISTRY.timer(self.label, "encode"):
+                            data = self.encode(frame)
+                    except Exception as e:
+                        logging.warning(f"[PreviewStream] {self.label}: encode failed: {e}")
+                        data = None
+                    if data is not None:
+                        with self._cond:
+                            self._jpeg = data
+                            self._seq += 1
+                            self._cond.notify_all()
+            time.sleep(max(0.0, self.interval - (time.monotonic() - t0)))
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._viewers = 0
+            self._cond.notify_all()
+
+
+class PreviewHub:
+    """
+    Preview streams of the cameras of a CameraManager, created on first use.
+    Frames come from manager.latest(cam_id), so every worker mode (thread, process,
+    async) is served the same way.
+    """
+    def __init__(self, manager, **stream_kwargs):
+        self.manager = manager
+        self.stream_kwargs = stream_kwargs
+        self._streams = {}       # cam_id -> PreviewStream
+        self._lock = threading.Lock()
+
+    def stream(self, cam_id):
+        """PreviewStream of a registered camera (None for unknown ids)."""
+        with self._lock:
+            stream = self._streams.get(cam_id)
+            if stream is None:
+                if cam_id not in self.manager.cameras:
+                    return None
+                stream = self._streams[cam_id] = PreviewStream(
+                    f"cam{cam_id}", lambda: self.manager.latest(cam_id), **self.stream_kwargs)
+            return stream
+
+    def viewers(self, cam_id):
+        stream = self._streams.get(cam_id)
+        return stream.viewers if stream is not None else 0
+
+    def remove(self, cam_id):
+        with self._lock:
+            stream = self._streams.pop(cam_id, None)
+        if stream is not None:
+            stream.close()
+
+    def close(self):
+        with self._lock:
+            streams, self._streams = list(self._streams.values()), {}
+        for stream in streams:
+            stream.close()
+
+
+_CAM_PATH = re.compile(r"^/cam/(\d+)\.(mjpg|jpg)$")
+
+
+class _PreviewHandler(BaseHTTPRequestHandler):
+    hub = None   # set per server
+
+    def do_GET(self):
+        m = _CAM_PATH.match(self.path.split("?", 1)[0])
+        stream = self.hub.stream(int(m.group(1))) if m else None
+        if stream is None:
+            self.send_error(404)
+            return
+        try:
+            stream.subscribe()
+        except RuntimeError:
+            self.send_error(404)
+            return
+        try:
+            if m.group(2) == "jpg":
+                self._snapshot(stream)
+            else:
+                self._mjpeg(stream)
+        except (BrokenPipeError, ConnectionResetError):
+            pass    # viewer went away
+        finally:
+            stream.unsubscribe()
+
+    def _snapshot(self, stream):
+        _, data = stream.wait(0, timeout=2.0)
+        if data is None:
+            self.send_error(503, "no frame yet")
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "image/jpeg")
+        self.send_header("Content-Length", str(len(data)))
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _mjpeg(self, stream):
+        self.send_response(200)
+        self.send_header("Content-Type", f"multipart/x-mixed-replace; boundary={BOUNDARY}")
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+        seq = 0
+        while not stream.closed:
+            seq, data = stream.wait(seq, timeout=FRAME_WAIT_TIMEOUT)
+            if data is None:
+                continue
+            self.wfile.write(f"--{BOUNDARY}\r\nContent-Type: image/jpeg\r\n"
+                             f"Content-Length: {len(data)}\r\n\r\n".encode("ascii") + data + b"\r\n")
+
+    def log_message(self, fmt, *args):
+        pass
+
+
+_servers = {}
+_servers_lock = threading.Lock()
+
+
+def start_preview_server(hub, port, host="127.0.0.1"):
+    """Serve hub on http://host:port/cam/<id>.mjpg and /cam/<id>.jpg (once per port per process)."""
+    with _servers_lock:
+        if port in _servers:
+            return _servers[port]
+        handler = type("PreviewHandler", (_PreviewHandler,), {"hub": hub})
+        try:
+            server = ThreadingHTTPServer((host, int(port)), handler)
+        except OSError as e:
+            logging.warning(f"[preview] cannot listen on {host}:{port}: {e}")
+            return None
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, name=f"preview-{port}", daemon=True).start()
+        _servers[port] = server
+        logging.info(f"[preview] serving http://{host}:{port}/cam/<id>.mjpg")
+        return server
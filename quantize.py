@@ -0,0 +1,233 @@
+# quantize.py
+# INT8 static quantization of the ONNX export + accuracy/latency comparison.
+#
+#   python quantize.py calibrate --video video/sample.mp4 [--frames 200]
+#   python quantize.py compare --video clip.mp4 [--labels clip_labels.csv]
+#
+# Latency diukur pada CONF_THRESH (seperti produksi); mAP dihitung dari pass terpisah dengan
+# ambang rendah (--eval-conf), karena ambang produksi memotong kurva precision-recall.
+#
+# Label CSV (satu baris per orang): frame,x1,y1,x2,y2  (frame mulai 0, pixel frame asli)
+# Tanpa --labels, deteksi model FP32 dipakai sebagai referensi.
+import argparse
+import csv
+import json
+import os
+import time
+import cv2
+import numpy as np
+
+from config import ONNX_MODEL_PATH, ONNX_INT8_MODEL_PATH, ONNX_INPUT_SIZE, ONNX_INTRA_OP_THREADS
+from detector_backends import OnnxBackend, letterbox
+from utils import iou_matrix
+
+# decode math at the end of the YOLOv8 head loses box precision in INT8
+HEAD_PREFIX = "/model.22/"
+HEAD_FLOAT_OPS = ("Concat", "Split", "Sigmoid", "Softmax", "Mul", "Add", "Sub", "Div",
+                  "Reshape", "Transpose", "Slice")
+
+
+def read_frames(video, max_frames=None, stride=1):
+    """Yield (index, BGR frame) from a local video file."""
+    cap = cv2.VideoCapture(video)
+    if not cap.isOpened():
+        raise RuntimeError(f"Tidak dapat membuka video {video}")
+    idx = 0
+    yielded = 0
+    try:
+        while max_frames is None or yielded < max_frames:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            if idx % stride == 0:
+                yield idx, frame
+                yielded += 1
+            idx += 1
+    finally:
+        cap.release()
+
+
+class VideoCalibrationReader:
+    """onnxruntime CalibrationDataReader feeding letterboxed frames of a video."""
+    def __init__(self, video, input_name, input_size=ONNX_INPUT_SIZE, frames=200):
+        cap = cv2.VideoCapture(video)
+        total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT)) or frames
+        cap.release()
+        stride = max(1, total // frames)
+        self._frames = (f for _, f in read_frames(video, max_frames=frames, stride=stride))
+        self.input_name = input_name
+        self.input_size = input_size
+
+    def get_next(self):
+        frame = next(self._frames, None)
+        if frame is None:
+            return None
+        img, _, _ = letterbox(frame, self.input_size)
+        blob = cv2.cvtColor(img, cv2.COLOR_BGR2RGB).transpose(2, 0, 1)[None].astype(np.float32) / 255.0
+        return {self.input_name: blob}
+
+
+def calibrate(args):
+    import onnx
+    from onnxruntime.quantization import (quantize_static, QuantFormat, QuantType,
+                                          CalibrationMethod)
+    from onnxruntime.quantization.shape_inference import quant_pre_process
+
+    prepped = os.path.splitext(args.out)[0] + ".prep.onnx"
+    quant_pre_process(args.fp32, prepped)
+
+    model = onnx.load(prepped)
+    input_name = model.graph.input[0].name
+    exclude = [] if args.quantize_head else [
+        n.name for n in model.graph.node
+        if n.name.startswith(HEAD_PREFIX) and n.op_type in HEAD_FLOAT_OPS]
+
+    reader = VideoCalibrationReader(args.video, input_name, frames=args.frames)
+    quantize_static(prepped, args.out, reader,
+                    quant_format=QuantFormat.QDQ,
+                    activation_type=QuantType.QUInt8,
+                    weight_type=QuantType.QInt8,
+                    per_channel=True,
+                    calibrate_method=CalibrationMethod.MinMax,
+                    nodes_to_exclude=exclude)
+    os.remove(prepped)
+    print(f"INT8 model ditulis ke {args.out} ({len(exclude)} node head tetap float)")
+
+
+def load_labels(path):
+    """CSV frame,x1,y1,x2,y2 -> {frame: (K,4) array}."""
+    labels = {}
+    with open(path, newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            box = [float(row[k]) for k in ("x1", "y1", "x2", "y2")]
+            labels.setdefault(int(row["frame"]), []).append(box)
+    return {k: np.array(v, dtype=float) for k, v in labels.items()}
+
+
+def average_precision(preds, gts, iou_thresh=0.5):
+    """
+    Single-class AP (all-point interpolation).
+    preds: {frame: (N,5)} detections, gts: {frame: (K,4)} ground truth
+    """
+    n_gt = sum(len(g) for g in gts.values())
+    if n_gt == 0:
+        return float("nan")
+    records = [(det[4], frame, det[:4]) for frame, dets in preds.items() for det in dets]
+    records.sort(key=lambda r: -r[0])
+    used = {frame: np.zeros(len(g), dtype=bool) for frame, g in gts.items()}
+    tp = np.zeros(len(records))
+    for i, (_, frame, box) in enumerate(records):
+        gt = gts.get(frame)
+        if gt is None or len(gt) == 0:
+            continue
+        ious = iou_matrix(box[None, :], gt)[0]
+        ious[used[frame]] = -1
+        j = int(ious.argmax())
+        if ious[j] >= iou_thresh:
+            used[frame][j] = True
+            tp[i] = 1
+    if len(records) == 0:
+        return 0.0
+    cum_tp = np.cumsum(tp)
+    recall = cum_tp / n_gt
+    precision = cum_tp / np.arange(1, len(records) + 1)
+    mrec = np.concatenate([[0.0], recall, [1.0]])
+    mpre = np.concatenate([[1.0], precision, [0.0]])
+    mpre = np.maximum.accumulate(mpre[::-1])[::-1]
+    idx = np.flatnonzero(mrec[1:] != mrec[:-1])
+    return float(np.sum((mrec[idx + 1] - mrec[idx]) * mpre[idx + 1]))
+
+
+def run_model(backend, frames):
+    """Detect on every frame at backend.conf_thresh; returns ({frame: dets}, per-frame latency ms array)."""
+    preds, lat = {}, []
+    backend.predict_batch([frames[0][1]])  # warm-up
+    for idx, frame in frames:
+        t0 = time.perf_counter()
+        preds[idx] = backend.predict_batch([frame])[0]
+        lat.append((time.perf_counter() - t0) * 1000.0)
+    return preds, np.array(lat)
+
+
+def summarize(name, preds, lat, gts):
+    ap50 = average_precision(preds, gts, 0.5)
+    ap = np.nanmean([average_precision(preds, gts, t) for t in np.arange(0.5, 0.96, 0.05)])
+    return {
+        "model": name,
+        "mAP50": round(ap50, 4),
+        "mAP50_95": round(float(ap), 4),
+        "latency_ms": {p: round(float(np.percentile(lat, int(p[1:]))), 2) for p in ("p50", "p90", "p95", "p99")},
+        "mean_ms": round(float(lat.mean()), 2),
+        "frames": int(len(lat)),
+    }
+
+
+def compare(args):
+    frames = list(read_frames(args.video, max_frames=args.frames))
+    if not frames:
+        raise RuntimeError(f"Video {args.video} tidak berisi frame")
+    fp32 = OnnxBackend(args.fp32, threads=args.threads, precision="fp32")
+    int8 = OnnxBackend(args.int8, threads=args.threads, precision="int8")
+
+    # latency at the deployed threshold
+    deployed32, lat32 = run_model(fp32, frames)
+    _, lat8 = run_model(int8, frames)
+
+    # accuracy: full precision-recall curve from a low-threshold pass
+    fp32.conf_thresh = int8.conf_thresh = args.eval_conf
+    preds32, _ = run_model(fp32, frames)
+    preds8, _ = run_model(int8, frames)
+
+    if args.labels:
+        gts = load_labels(args.labels)
+        reference = "labels"
+    else:
+        # pseudo ground truth: what the FP32 model reports in production
+        gts = {k: v[:, :4] for k, v in deployed32.items()}
+        reference = "fp32"
+    report = {
+        "video": args.video,
+        "reference": reference,
+        "eval_conf": args.eval_conf,
+        "results": [summarize("fp32", preds32, lat32, gts), summarize("int8", preds8, lat8, gts)],
+    }
+    r32, r8 = report["results"]
+    report["delta_mAP50"] = round(r8["mAP50"] - r32["mAP50"], 4)
+    report["speedup_p50"] = round(r32["latency_ms"]["p50"] / max(r8["latency_ms"]["p50"], 1e-6), 2)
+
+    print(json.dumps(report, indent=2))
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+def main():
+    ap = argparse.ArgumentParser(description="INT8 quantization tools for the ONNX detector")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+
+    c = sub.add_parser("calibrate", help="static INT8 quantization calibrated on a local video")
+    c.add_argument("--video", required=True)
+    c.add_argument("--fp32", default=ONNX_MODEL_PATH)
+    c.add_argument("--out", default=ONNX_INT8_MODEL_PATH)
+    c.add_argument("--frames", type=int, default=200, help="calibration frames, sampled evenly")
+    c.add_argument("--quantize-head", action="store_true", help="also quantize the box decode ops")
+    c.set_defaults(func=calibrate)
+
+    m = sub.add_parser("compare", help="mAP and latency percentiles, FP32 vs INT8")
+    m.add_argument("--video", required=True)
+    m.add_argument("--labels", help="CSV frame,x1,y1,x2,y2 (default: FP32 output as reference)")
+    m.add_argument("--fp32", default=ONNX_MODEL_PATH)
+    m.add_argument("--int8", default=ONNX_INT8_MODEL_PATH)
+    m.add_argument("--frames", type=int, default=None, help="limit number of frames")
+    m.add_argument("--threads", type=int, default=ONNX_INTRA_OP_THREADS)
+    m.add_argument("--eval-conf", type=float, default=0.001,
+                   help="score threshold of the accuracy pass (latency uses CONF_THRESH)")
+    m.add_argument("--out", help="also write the JSON report here")
+    m.set_defaults(func=compare)
+
+    args = ap.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
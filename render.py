@@ -0,0 +1,122 @@
+# render.py
+import threading
+import cv2
+import numpy as np
+
+from config import RENDER_LABEL_CACHE
+
+FONT = cv2.FONT_HERSHEY_SIMPLEX
+
+
+class BoxRenderer:
+    """
+    Track box renderer for whole arrays of boxes.
+    - all rectangles of a frame are one cv2.polylines call: `thickness` nested 1-px
+      outlines built from the (N,4) box array (thick-line rasterization per box is
+      what made cv2.rectangle slow)
+    - "ID n" labels are rasterized once per track id into a small colour patch + mask
+      (FIFO cache of cache_size ids; ids only grow, so old ones fall out) and stamped
+      with cv2.copyTo (a few us each instead of cv2.putText re-rasterizing the glyphs)
+    - draw() annotates a frame in place; overlay() draws into a separate BGRA layer,
+      composite() puts such a layer onto a frame
+    """
+    def __init__(self, color=(0, 255, 0), thickness=2, font_scale=0.6, cache_size=RENDER_LABEL_CACHE):
+        self.color = tuple(int(c) for c in color)
+        self.thickness = int(thickness)
+        self.font_scale = font_scale
+        self.cache_size = max(1, int(cache_size))
+        # corner offsets of the nested outlines: ring k is inset by k pixels
+        self._insets = np.array([[[k, k], [-k, k], [-k, -k], [k, -k]] for k in range(self.thickness)],
+                                dtype=np.int32)
+        self._labels = {}         # (track id, channels) -> (patch, mask, dx, dy) relative to the text origin
+        self._lock = threading.Lock()
+
+    def label(self, track_id, channels=3):
+        """Cached (patch, mask, dx, dy) of a track id label; channels 4 = BGRA for overlays."""
+        key = (track_id, channels)
+        cached = self._labels.get(key)
+        if cached is not None:
+            return cached
+        text = f"ID {track_id}"
+        (w, h), base = cv2.getTextSize(text, FONT, self.font_scale, self.thickness)
+        pad = self.thickness
+        mask = np.zeros((h + base + 2 * pad, w + 2 * pad), dtype=np.uint8)
+        cv2.putText(mask, text, (pad, h + pad), FONT, self.font_scale, 255, self.thickness)
+        color = self.color + (255,) if channels == 4 else self.color
+        patch = np.zeros(mask.shape + (channels,), dtype=np.uint8)
+        patch[mask > 0] = color
+        cached = (patch, mask, -pad, -(h + pad))
+        with self._lock:
+            if len(self._labels) >= self.cache_size:
+                del self._labels[next(iter(self._labels))]
+            self._labels[key] = cached
+        return cached
+
+    def _draw(self, img, boxes, ids, color):
+        boxes = np.asarray(boxes)
+        if len(boxes) == 0:
+            return img
+        b = boxes[:, :4].astype(np.int32)
+        # (N,4,2) corners tl, tr, br, bl -> (thickness*N,4,2) outlines
+        corners = b[:, [0, 1, 2, 1, 2, 3, 0, 3]].reshape(-1, 4, 2)
+        rings = (corners[None] + self._insets[:, None]).reshape(-1, 4, 2)
+        cv2.polylines(img, rings, True, color, 1, cv2.LINE_4)
+        if ids is None:
+            return img
+
+        x1, y1 = b[:, 0], b[:, 1]
+        h, w = img.shape[:2]
+        channels = img.shape[2]
+        cached = self._labels.get
+        copy = cv2.copyTo
+        # text origin above the box, like putText(..., (x1, max(15, y1 - 10)))
+        oys = np.maximum(15, y1 - 10)
+        for tid, ox, oy in zip(np.asarray(ids).tolist(), x1.tolist(), oys.tolist()):
+            entry = cached((tid, channels)) or self.label(tid, channels)
+            patch, mask, dx, dy = entry
+            top, left = oy + dy, ox + dx
+            mh, mw = mask.shape
+            if top >= 0 and left >= 0 and top + mh <= h and left + mw <= w:
+                copy(patch, mask, img[top:top + mh, left:left + mw])
+                continue
+            # label crosses the frame border: clip it
+            t0, l0 = max(0, -top), max(0, -left)
+            t1, l1 = min(mh, h - top), min(mw, w - left)
+            if t1 > t0 and l1 > l0:
+                copy(patch[t0:t1, l0:l1], mask[t0:t1, l0:l1],
+                     img[top + t0:top + t1, left + l0:left + l1])
+        return img
+
+    def draw(self, frame, boxes, ids=None):
+        """Draw (N,4+) boxes and their id labels onto frame (in place); returns frame."""
+        return self._draw(frame, boxes, ids, self.color)
+
+    def overlay(self, shape, boxes, ids=None, out=None):
+        """
+        Boxes and labels on a transparent BGRA layer of frame shape (alpha 255 where drawn),
+        leaving the frame itself untouched. out: reusable (H,W,4) buffer.
+        """
+        h, w = shape[:2]
+        if out is None or out.shape != (h, w, 4):
+            out = np.zeros((h, w, 4), dtype=np.uint8)
+        else:
+            out.fill(0)
+        return self._draw(out, boxes, ids, self.color + (255,))
+
+
+def composite(frame, overlay, out=None):
+    """frame with the drawn pixels of a BGRA overlay on top (out=None: in place)."""
+    if out is None:
+        out = frame
+    else:
+        np.copyto(out, frame)
+    cv2.copyTo(overlay[..., :3], overlay[..., 3], out)
+    return out
+
+
+RENDERER = BoxRenderer()
+
+
+def draw_tracks(frame, tracker, renderer=RENDERER):
+    """Draw every live track of a Tracker straight from its box/id arrays (in place)."""
+    return renderer.draw(frame, tracker.boxes, tracker.ids)
@@ -132,108 +132,385 @@
 #         logging.info(f"[RTSPStream] stopped {self.url}")
 
 # rtsp_handler.py
-import cv2
+import numpy as np
+import random
 import threading
 import time
 import logging
+import weakref
+from contextlib import contextmanager
 
-from config import RTSP_MAX_RETRIES, RTSP_RETRY_INTERVAL
+from config import (RTSP_MAX_RETRIES, RTSP_RETRY_INTERVAL, RTSP_FRAME_RING,
+                    RTSP_BACKPRESSURE_POLICY, RTSP_BACKPRESSURE_DEPTH, RTSP_RETRY_BACKOFF_MAX,
+                    RTSP_RETRY_JITTER, RTSP_DEAD_RETRY_INTERVAL, RTSP_READ_TIMEOUT)
+from capture_backends import open_capture
+from metrics import REGISTRY
 
 logging.getLogger().setLevel(logging.INFO)
 
+BACKPRESSURE_POLICIES = ("latest", "fifo", "keyframe")
+HEALTH_STATES = ("connecting", "live", "degraded", "dead")   # stream_state gauge = index
+
+
+def backoff_delay(failures, dead=False):
+    """Jittered exponential delay before the next connect attempt (long probe interval when dead)."""
+    if dead:
+        base = RTSP_DEAD_RETRY_INTERVAL
+    else:
+        base = min(RTSP_RETRY_BACKOFF_MAX, RTSP_RETRY_INTERVAL * 2 ** max(0, failures - 1))
+    return base * random.uniform(1.0 - RTSP_RETRY_JITTER, 1.0 + RTSP_RETRY_JITTER)
+
+
+# stall watchdog: the reader thread of a stalled stream sits in a blocked read, so one
+# shared thread checks every running stream once per second
+_watched = weakref.WeakSet()
+_watch_lock = threading.Lock()
+_watchdog = None
+
+
+def _watch(stream):
+    global _watchdog
+    with _watch_lock:
+        _watched.add(stream)
+        if _watchdog is None:
+            _watchdog = threading.Thread(target=_watchdog_loop, daemon=True, name="rtsp-watchdog")
+            _watchdog.start()
+
+
+def _watchdog_loop():
+    while True:
+        time.sleep(1.0)
+        with _watch_lock:
+            streams = list(_watched)
+        for stream in streams:
+            try:
+                stream.check_stall()
+            except Exception as e:
+                logging.warning(f"[RTSPStream] stall check failed: {e}")
+        del streams
+
+
 class RTSPStream:
     """
     Background RTSP reader with auto-reconnect and non-blocking read().
-    - connect() tries to open VideoCapture with retry/backoff.
-    - background thread reads frames continuously.
-    - read() returns latest frame (copy) or None.
+    - the constructor never blocks: the reader thread opens the capture (backend from
+      config) and reconnects with jittered exponential backoff; opens and reads are
+      bounded by RTSP_OPEN_TIMEOUT / RTSP_READ_TIMEOUT.
+    - health(): connecting -> live -> degraded (read failed / stalled) -> dead after
+      RTSP_MAX_RETRIES failed opens in a row (circuit breaker: one probe every
+      RTSP_DEAD_RETRY_INTERVAL); a watchdog thread degrades live streams without a
+      frame for RTSP_READ_TIMEOUT while the read is still blocked. The stream_state
+      gauge follows it.
+    - background thread decodes straight into a ring of preallocated frame buffers;
+      every frame gets a sequence number.
+    - read() / read_latest() return a read-only view of the newest buffer (no copy).
+      An unpinned view stays valid until ring_size - 1 newer frames were decoded;
+      use borrow() to pin the buffer while working on it.
+    - consumers block in wait_new() / read_latest(timeout=) / borrow(timeout=) and are
+      woken by the reader as soon as a frame is stored (no polling).
+    - policy decides which frame a consumer gets and which one the reader overwrites
+      when the consumer is slower than the stream:
+      "latest" hands out the newest frame; "fifo" hands out frames in order from a ring
+      of `depth` frames and overwrites the oldest unconsumed one; "keyframe" is fifo that
+      overwrites non-key frames first. Frames never handed out are counted as
+      dropped_capture.
     """
-    def __init__(self, url, name="rtsp"):
+    def __init__(self, url, name="rtsp", ring_size=RTSP_FRAME_RING, policy=RTSP_BACKPRESSURE_POLICY,
+                 depth=RTSP_BACKPRESSURE_DEPTH):
+        if policy not in BACKPRESSURE_POLICIES:
+            raise ValueError(f"Policy backpressure tidak dikenal: {policy} (pilihan: {', '.join(BACKPRESSURE_POLICIES)})")
         self.url = url
         self.name = name
+        self.policy = policy
         self.cap = None
-        self.frame = None
+        self.ring_size = max(2, int(ring_size))
+        if policy != "latest":
+            # depth unconsumed frames + the one being processed
+            self.ring_size = max(self.ring_size, int(depth) + 1)
+        self._ring = []          # preallocated BGR buffers
+        self._slot_seq = []      # sequence number stored in each slot
+        self._slot_time = []     # time.monotonic() when each slot was captured
+        self._slot_key = []      # codec keyframe flag per slot (only known for pyav)
+        self._pins = []          # borrow count per slot
+        self._latest = None      # slot holding the newest frame
+        self.seq = 0             # sequence number of the newest frame (0 = none yet)
+        self._handed = 0         # sequence number of the last frame handed to a consumer
+        self.dropped = 0         # frames overwritten before any consumer saw them
         self._running = False
         self._thread = None
         self._lock = threading.Lock()
-        self._connect_lock = threading.Lock()
+        self._new_frame = threading.Condition(self._lock)
+        self._wake = threading.Event()
+        self.state = "connecting"
+        self.state_since = time.monotonic()
+        self.failures = 0        # consecutive failed opens/reads
+        self._last_frame = 0.0   # time.monotonic() of the newest frame
+        REGISTRY.set_gauge(self.name, "stream_state", HEALTH_STATES.index(self.state))
         self.connect()
+        _watch(self)
 
     def connect(self):
-        with self._connect_lock:
-            retries = 0
-            interval = RTSP_RETRY_INTERVAL
-            if self.cap:
-                try:
-                    self.cap.release()
-                except Exception:
-                    pass
-            self.cap = cv2.VideoCapture(self.url)
-            while not self.cap.isOpened() and retries < RTSP_MAX_RETRIES:
-                logging.info(f"[RTSPStream] connect(): failed to open {self.url}, retry {retries+1}/{RTSP_MAX_RETRIES}")
-                time.sleep(interval)
-                retries += 1
-                interval *= 1.5
-                try:
-                    self.cap.release()
-                except Exception:
-                    pass
-                self.cap = cv2.VideoCapture(self.url)
-            if self.cap.isOpened():
-                logging.info(f"[RTSPStream] connect(): opened {self.url}")
-            else:
-                logging.warning(f"[RTSPStream] connect(): unable to open {self.url} after {retries} retries")
+        """Start the reader thread, or make it retry now if it waits in backoff; never blocks."""
+        if not self._running:
+            self._running = True
+            self._thread = threading.Thread(target=self._reader, daemon=True, name=f"rtsp-{self.name}")
+            self._thread.start()
+        else:
+            self._wake.set()
 
-            if not self._running:
-                self._running = True
-                self._thread = threading.Thread(target=self._reader, daemon=True)
-                self._thread.start()
+    # ---- connection health ----
+    def _set_state(self, state):
+        if state == self.state:
+            return
+        level = logging.WARNING if state in ("degraded", "dead") else logging.INFO
+        logging.log(level, f"[RTSPStream] {self.name}: {self.state} -> {state} ({self.url})")
+        self.state = state
+        self.state_since = time.monotonic()
+        REGISTRY.set_gauge(self.name, "stream_state", HEALTH_STATES.index(state))
 
-    def _reader(self):
-        while self._running:
+    def check_stall(self):
+        """Degrade a live stream without a new frame for RTSP_READ_TIMEOUT (read still blocked)."""
+        if (self._running and self.state == "live" and self._last_frame
+                and time.monotonic() - self._last_frame > RTSP_READ_TIMEOUT):
+            self._set_state("degraded")
+
+    def health(self):
+        """{"state", "since_s", "failures", "last_frame_age_s"}."""
+        self.check_stall()
+        now = time.monotonic()
+        age = now - self._last_frame if self._last_frame else None
+        return {"state": self.state, "since_s": round(now - self.state_since, 1), "failures": self.failures,
+                "last_frame_age_s": None if age is None else round(age, 2)}
+
+    def _backoff(self):
+        return backoff_delay(self.failures, dead=self.state == "dead")
+
+    def _sleep(self, seconds):
+        # woken early by stop() or connect()
+        self._wake.wait(seconds)
+        self._wake.clear()
+
+    def _open(self):
+        """One open attempt (bounded by RTSP_OPEN_TIMEOUT); True when the capture is open."""
+        if self.state != "dead":
+            self._set_state("connecting")
+        cap = open_capture(self.url)
+        if cap.isOpened() and self._running:
+            self.cap = cap
+            logging.info(f"[RTSPStream] {self.name}: opened {self.url}")
+            return True
+        try:
+            cap.release()
+        except Exception:
+            pass
+        self.failures += 1
+        if self.failures >= RTSP_MAX_RETRIES:
+            # circuit open: stop hammering the camera, probe it every RTSP_DEAD_RETRY_INTERVAL
+            self._set_state("dead")
+        return False
+
+    def _release(self):
+        if self.cap is not None:
             try:
-                if not self.cap or not self.cap.isOpened():
-                    logging.info(f"[RTSPStream] reader: cap not opened, trying to connect {self.url}")
-                    self.connect()
-                    time.sleep(1.0)
-                    continue
-
-                ret, frame = self.cap.read()
-                if not ret or frame is None:
-                    logging.warning(f"[RTSPStream] reader: read failed, attempting reconnect...")
-                    try:
-                        self.cap.release()
-                    except Exception:
-                        pass
-                    self.cap = None
-                    time.sleep(1.0)
-                    continue
+                self.cap.release()
+            except Exception:
+                pass
+        self.cap = None
 
-                with self._lock:
-                    # store latest frame (copy to be safe)
-                    self.frame = frame.copy()
+    def _reader(self):
+        try:
+            while self._running:
+                try:
+                    if self.cap is None:
+                        if not self._open():
+                            delay = self._backoff()
+                            logging.info(f"[RTSPStream] {self.name}: open failed ({self.failures}x), "
+                                         f"retry in {delay:.1f}s")
+                            self._sleep(delay)
+                        continue
 
-                # small sleep to avoid tight loop; capture pacing persists
-                time.sleep(0.005)
-            except Exception as e:
-                logging.exception("[RTSPStream] reader exception: %s", e)
-                time.sleep(0.5)
+                    slot = self._write_slot()
+                    buf = self._ring[slot] if slot is not None else None
+                    t0 = time.perf_counter()
+                    ret, frame = self.cap.read(buf) if buf is not None else self.cap.read()
+                    if not ret or frame is None:
+                        # end of stream, socket error or read timeout (stalled camera)
+                        self._release()
+                        if not self._running:
+                            break
+                        self.failures += 1
+                        REGISTRY.inc(self.name, "reconnects")
+                        self._set_state("degraded")
+                        delay = self._backoff()
+                        logging.warning(f"[RTSPStream] {self.name}: read failed, reconnect in {delay:.1f}s")
+                        self._sleep(delay)
+                        continue
 
-    def read(self):
-        """Return latest frame copy or None (non-blocking)."""
+                    if frame is not buf:
+                        # first frame, resolution change or every slot busy
+                        slot = self._store_new_buffer(frame, slot)
+                    now = time.monotonic()
+                    with self._lock:
+                        self.seq += 1
+                        self._slot_seq[slot] = self.seq
+                        self._slot_time[slot] = now
+                        self._slot_key[slot] = getattr(self.cap, "last_keyframe", False)
+                        self._latest = slot
+                        self._new_frame.notify_all()
+                    self._last_frame = now
+                    if self.state != "live":
+                        self.failures = 0
+                        self._set_state("live")
+                    REGISTRY.observe(self.name, "capture", time.perf_counter() - t0)
+                    REGISTRY.inc(self.name, "frames_captured")
+                except Exception as e:
+                    logging.exception("[RTSPStream] reader exception: %s", e)
+                    self._sleep(0.5)
+        finally:
+            # only this thread touches the capture
+            self._release()
+
+    def _write_slot(self):
+        """
+        Slot the reader decodes into next: never the newest frame or a borrowed one.
+        latest: the oldest slot. fifo/keyframe: an already consumed slot if any, else the
+        oldest unconsumed one (a drop); keyframe prefers overwriting non-key frames.
+        The claimed slot is invalidated (seq 0), so no consumer is handed it mid-decode.
+        """
         with self._lock:
-            if self.frame is None:
+            free = [i for i in range(len(self._ring))
+                    if i != self._latest and self._pins[i] == 0]
+            if not free:
                 return None
-            return self.frame.copy()
+            if self.policy != "latest":
+                consumed = [i for i in free if self._slot_seq[i] <= self._handed]
+                if consumed:
+                    free = consumed
+                elif self.policy == "keyframe":
+                    free = [i for i in free if not self._slot_key[i]] or free
+            slot = min(free, key=lambda i: self._slot_seq[i])
+            if self.policy != "latest" and self._slot_seq[slot] > self._handed:
+                # an unconsumed frame is overwritten before any consumer saw it
+                self.dropped += 1
+                REGISTRY.inc(self.name, "dropped_capture")
+            self._slot_seq[slot] = 0
+            self._slot_key[slot] = False
+            return slot
+
+    def _store_new_buffer(self, frame, slot):
+        """Adopt a freshly allocated frame as a ring buffer; returns its slot."""
+        with self._lock:
+            if not self._ring or self._ring[0].shape != frame.shape:
+                # (re)build the ring for this resolution; old buffers stay valid for holders
+                self._ring = [frame] + [np.empty_like(frame) for _ in range(self.ring_size - 1)]
+                self._slot_seq = [0] * self.ring_size
+                self._slot_time = [0.0] * self.ring_size
+                self._slot_key = [False] * self.ring_size
+                self._pins = [0] * self.ring_size
+                self._latest = None
+                return 0
+            if slot is None:
+                # all slots busy: grow the ring instead of blocking the reader
+                self._ring.append(frame)
+                self._slot_seq.append(0)
+                self._slot_time.append(0.0)
+                self._slot_key.append(False)
+                self._pins.append(0)
+                return len(self._ring) - 1
+            self._ring[slot] = frame
+            return slot
+
+    def _view(self, slot):
+        view = self._ring[slot].view()
+        view.flags.writeable = False
+        return view
+
+    def _wait_locked(self, after, timeout):
+        # caller holds self._lock; timeout 0 = do not wait, None = until a frame or stop()
+        if timeout != 0 and self.seq <= after:
+            self._new_frame.wait_for(lambda: self.seq > after or not self._running, timeout)
+        return self._latest is not None and self.seq > after
+
+    def _take_locked(self, after):
+        """Slot handed out next (policy order) and the drop accounting; caller holds self._lock."""
+        slot = self._latest
+        if self.policy != "latest":
+            # seq 0 = empty or being decoded
+            newer = [i for i in range(len(self._ring)) if self._slot_seq[i] > max(after, 0)]
+            slot = min(newer, key=lambda i: self._slot_seq[i])
+        seq = self._slot_seq[slot]
+        # latest skips frames here; fifo/keyframe count their drops when a slot is overwritten
+        skipped = seq - max(after, self._handed) - 1 if self.policy == "latest" else 0
+        if skipped > 0 and self._handed:
+            self.dropped += skipped
+            REGISTRY.inc(self.name, "dropped_capture", skipped)
+        self._handed = max(self._handed, seq)
+        return slot, seq
+
+    def wait_new(self, after, timeout=None):
+        """
+        Block until a frame newer than `after` exists (True) or timeout/stop (False).
+        timeout None waits until then, like threading.Event.wait.
+        """
+        with self._lock:
+            return self._wait_locked(after, timeout)
+
+    def read_latest(self, after=-1, timeout=0):
+        """
+        Return (seq, frame) for the next frame after `after` (the newest one with policy
+        "latest", the oldest one still in the ring otherwise), else (after, None).
+        frame is a read-only view into the ring (no copy).
+        timeout: seconds to wait for a new frame (0 = do not wait, None = until a frame or stop).
+        """
+        with self._lock:
+            if not self._wait_locked(after, timeout):
+                return after, None
+            slot, seq = self._take_locked(after)
+            return seq, self._view(slot)
+
+    def has_new(self, after):
+        """True if a frame newer than sequence number `after` is available."""
+        return self.seq > after
+
+    @contextmanager
+    def borrow(self, after=-1, timeout=0):
+        """
+        Like read_latest(), but the buffer is pinned (never overwritten) inside the block.
+            with rtsp.borrow(last_seq, timeout=0.5) as (seq, frame): ...
+        """
+        with self._lock:
+            if not self._wait_locked(after, timeout):
+                slot, seq, frame = None, after, None
+            else:
+                slot, seq = self._take_locked(after)
+                self._pins[slot] += 1
+                frame = self._view(slot)
+        try:
+            yield seq, frame
+        finally:
+            if slot is not None:
+                with self._lock:
+                    if slot < len(self._pins):
+                        self._pins[slot] = max(0, self._pins[slot] - 1)
+
+    def read(self):
+        """Return a read-only view of the latest frame or None (non-blocking, no copy)."""
+        return self.read_latest()[1]
+
+    def captured_at(self, seq):
+        """time.monotonic() at which frame seq was captured, None once it left the ring."""
+        with self._lock:
+            for slot, s in enumerate(self._slot_seq):
+                if s == seq:
+                    return self._slot_time[slot]
+        return None
 
     def stop(self):
-        """Stop reader thread and release resources."""
+        """Stop the reader thread; it releases the capture itself (after a pending open/read returns)."""
         self._running = False
+        self._wake.set()
+        with self._lock:
+            self._new_frame.notify_all()
         if self._thread and self._thread.is_alive():
             self._thread.join(timeout=1.0)
-        if self.cap:
-            try:
-                self.cap.release()
-            except Exception:
-                pass
         logging.info(f"[RTSPStream] stopped {self.url}")
@@ -0,0 +1,146 @@
+# scheduler.py
+import threading
+import time
+import weakref
+import numpy as np
+
+from config import (SCHED_ENABLED, SCHED_MIN_INTERVAL, SCHED_MAX_INTERVAL,
+                    SCHED_CAMERA_BUDGET, SCHED_TOTAL_BUDGET,
+                    SCHED_BUSY_SPEED, SCHED_BUSY_TRACKS)
+
+
+class SchedulerPool:
+    """
+    Shares a total inference budget (in CPU cores) between stream schedulers.
+    Busier streams get a larger share; each share is capped at SCHED_CAMERA_BUDGET.
+    """
+    def __init__(self, total_budget=SCHED_TOTAL_BUDGET, camera_budget=SCHED_CAMERA_BUDGET):
+        self.total_budget = float(total_budget)
+        self.camera_budget = float(camera_budget)
+        self._members = weakref.WeakSet()
+        self._lock = threading.Lock()
+
+    def register(self, sched):
+        with self._lock:
+            self._members.add(sched)
+        self.rebalance()
+
+    def unregister(self, sched):
+        with self._lock:
+            self._members.discard(sched)
+        self.rebalance()
+
+    def rebalance(self):
+        """Split total_budget proportionally to (0.2 + busy) of every member."""
+        with self._lock:
+            members = list(self._members)
+            if not members:
+                return
+            weights = np.array([0.2 + m.busy for m in members])
+            shares = self.total_budget * weights / weights.sum()
+            for m, share in zip(members, shares):
+                m.budget = min(self.camera_budget, float(share))
+
+
+default_pool = SchedulerPool()
+
+
+class DetectionScheduler:
+    """
+    Per-stream adaptive detection interval (replaces frame_count % detect_every).
+    - should_detect(): call once per frame, True when a detection is due.
+    - report(latency, tracker, motion): call after each detection + tracker update.
+    The interval shrinks toward min_interval when the scene is busy (fast tracks,
+    many tracks, unconfirmed/lost tracks, motion) and grows toward max_interval when
+    static. It never drops below the floor that keeps latency / (interval * frame_period)
+    within this stream's CPU budget.
+    adaptive=False keeps a fixed base_interval (latency is still measured).
+    """
+    def __init__(self, base_interval, min_interval=SCHED_MIN_INTERVAL,
+                 max_interval=SCHED_MAX_INTERVAL, pool=default_pool, name="stream",
+                 adaptive=SCHED_ENABLED):
+        self.name = name
+        self.adaptive = adaptive
+        if not adaptive:
+            min_interval = max_interval = base_interval
+            pool = None
+        self.min_interval = max(1, int(min_interval))
+        self.max_interval = max(self.min_interval, int(max_interval))
+        self.interval = float(np.clip(base_interval, self.min_interval, self.max_interval))
+        self.busy = 0.5
+        self.budget = SCHED_CAMERA_BUDGET
+        self.latency = None          # EWMA of detect latency (s)
+        self.frame_period = None     # EWMA of time between frames (s)
+        self._since_detect = None
+        self._last_frame_t = None
+        self._reports = 0
+        self.pool = pool
+        if pool is not None:
+            pool.register(self)
+
+    def should_detect(self):
+        now = time.monotonic()
+        if self._last_frame_t is not None:
+            dt = now - self._last_frame_t
+            self.frame_period = dt if self.frame_period is None else 0.9 * self.frame_period + 0.1 * dt
+        self._last_frame_t = now
+
+        if self._since_detect is None or self._since_detect + 1 >= round(self.interval):
+            self._since_detect = 0
+            return True
+        self._since_detect += 1
+        return False
+
+    def _busy_score(self, tracker, motion):
+        scores = [0.0]
+        if motion is not None:
+            scores.append(float(motion))
+        if tracker is not None and len(tracker.table):
+            table = tracker.table
+            n = table.n
+            h = np.maximum(tracker.boxes[:, 3] - tracker.boxes[:, 1], 1.0)
+            speed = np.hypot(table.vel[:n, 0], table.vel[:n, 1]) / h
+            scores.append(float(speed.mean()) / SCHED_BUSY_SPEED)
+            scores.append(n / SCHED_BUSY_TRACKS)
+            uncertain = (table.miss[:n] > 0) | (table.hits[:n] < 3)
+            scores.append(float(uncertain.mean()))
+        return float(np.clip(max(scores), 0.0, 1.0))
+
+    def budget_floor(self):
+        """Smallest interval that keeps this stream within its CPU budget."""
+        if not self.latency or not self.frame_period:
+            return self.min_interval
+        return self.latency / (max(self.budget, 1e-3) * self.frame_period)
+
+    def report(self, latency=None, tracker=None, motion=None):
+        """
+        latency: seconds spent in detect (None if unknown)
+        tracker: Tracker after update (speed / count / uncertain tracks)
+        motion: optional scene motion score in [0,1]
+        """
+        if latency is not None:
+            self.latency = latency if self.latency is None else 0.8 * self.latency + 0.2 * latency
+        self.busy = self._busy_score(tracker, motion)
+
+        desired = self.max_interval - (self.max_interval - self.min_interval) * self.busy
+        desired = max(desired, self.budget_floor())
+        self.interval = float(np.clip(0.5 * self.interval + 0.5 * desired,
+                                      self.min_interval, self.max_interval))
+
+        self._reports += 1
+        if self.pool is not None and self._reports % 10 == 0:
+            self.pool.rebalance()
+
+    def stats(self):
+        return {
+            "name": self.name,
+            "interval": round(self.interval, 2),
+            "busy": round(self.busy, 2),
+            "budget": round(self.budget, 3),
+            "latency_ms": None if self.latency is None else round(self.latency * 1000, 1),
+        }
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.unregister(self)
+            self.pool = None
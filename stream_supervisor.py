@@ -0,0 +1,314 @@
+# stream_supervisor.py
+import time
+import asyncio
+import logging
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from camera_worker import (CameraPipeline, OverloadMonitor, publish_frame, is_watched, camera_policy,
+                           init_log_file, write_log_csv)
+from capture_backends import open_capture
+from rtsp_handler import HEALTH_STATES, BACKPRESSURE_POLICIES, backoff_delay
+from render import draw_tracks
+from utils import redact_url
+from metrics import REGISTRY
+from config import (RTSP_FRAME_WIDTH, RTSP_FRAME_HEIGHT, RTSP_DETECT_EVERY, RTSP_MAX_RETRIES,
+                    RTSP_READ_TIMEOUT, RTSP_BACKPRESSURE_DEPTH, CAMERA_ASYNC_OPEN_WORKERS,
+                    CAMERA_ASYNC_DECODE_WORKERS, CAMERA_ASYNC_RECOVERY_WORKERS, CAMERA_ASYNC_PROCESS_WORKERS)
+
+
+def _release_cap(cap):
+    try:
+        cap.release()
+    except Exception:
+        pass
+
+
+def _close_built(future):
+    """Done-callback: close a pipeline nobody is waiting for (skip cancelled/failed builds)."""
+    if not future.cancelled() and future.exception() is None:
+        future.result().close()
+
+
+class _Camera:
+    """Supervisor-side state of one camera; it owns no thread."""
+    def __init__(self, cam_id, url, log_path, width, height, detect_every, frame_queue, frame_ready, policy):
+        self.cam_id = cam_id
+        self.url = url
+        self.log_path = log_path
+        self.width = width
+        self.height = height
+        self.detect_every = detect_every
+        self.frame_queue = frame_queue
+        self.frame_ready = frame_ready
+        self.policy = policy
+        self.label = f"cam{cam_id}"
+        self.depth = 1 if policy == "latest" else max(1, RTSP_BACKPRESSURE_DEPTH)
+        self.pending = deque()       # (seq, capture time, keyframe, frame) waiting for the process stage
+        self.wakeup = asyncio.Event()
+        self.pipeline = None
+        self.monitor = OverloadMonitor(self.label, log_path)
+        self.cap = None
+        self.read_future = None      # cap.read() running in the decode pool
+        self.process_future = None   # pipeline.process() running in the process pool
+        self.task = None
+        self.state = "connecting"
+        self.state_since = time.monotonic()
+        self.failures = 0
+        self.last_frame = 0.0
+        self.seq = 0
+        self.dropped = 0
+        self._dropped_seen = 0
+
+
+class StreamSupervisor:
+    """
+    Runs every camera as coroutines on one asyncio event loop (one thread) instead of an
+    RTSPStream reader thread plus an rtsp_worker thread per camera.
+    - per camera one task: connect with jittered backoff and circuit breaker (same
+      health states as RTSPStream), read frames, hand them to the process stage
+    - blocking calls go to fixed-size pools shared by all cameras: open (bounded by
+      RTSP_OPEN_TIMEOUT), decode (cap.read) and process (detect + track + draw);
+      detection itself is batched across cameras by the shared InferenceServer
+    - one read in flight per camera; only live cameras read on the decode pool, cameras
+      that are connecting/degraded/dead (reads likely to block for RTSP_READ_TIMEOUT)
+      read and release on the recovery pool, so stalled cameras never take decode
+      threads away from healthy ones (a live camera that stalls holds one decode
+      thread for at most RTSP_READ_TIMEOUT, then moves over)
+    - capture -> process backpressure follows the camera policy (latest / fifo /
+      keyframe); frames dropped there count as dropped_capture
+    - a health task reports live cameras without frames for RTSP_READ_TIMEOUT as degraded
+    Threads: 1 + the four pool sizes, independent of the number of cameras.
+    """
+    def __init__(self, open_workers=CAMERA_ASYNC_OPEN_WORKERS, decode_workers=CAMERA_ASYNC_DECODE_WORKERS,
+                 process_workers=CAMERA_ASYNC_PROCESS_WORKERS, recovery_workers=CAMERA_ASYNC_RECOVERY_WORKERS):
+        self._open_pool = ThreadPoolExecutor(max(1, int(open_workers)), thread_name_prefix="sv-open")
+        self._decode_pool = ThreadPoolExecutor(max(1, int(decode_workers)), thread_name_prefix="sv-decode")
+        self._recovery_pool = ThreadPoolExecutor(max(1, int(recovery_workers)), thread_name_prefix="sv-recovery")
+        self._process_pool = ThreadPoolExecutor(max(1, int(process_workers)), thread_name_prefix="sv-process")
+        self._cams = {}      # cam_id -> _Camera, only touched on the loop thread
+        self._health_task = None
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._run, name="stream-supervisor", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        asyncio.set_event_loop(self._loop)
+        self._health_task = self._loop.create_task(self._health())
+        self._loop.run_forever()
+
+    # ---- public API (any thread) ----
+    def add_camera(self, cam_id, url, log_path, frame_queue, frame_ready=None, width=RTSP_FRAME_WIDTH,
+                   height=RTSP_FRAME_HEIGHT, detect_every=RTSP_DETECT_EVERY, policy=None):
+        """Start (or restart) a camera; returns immediately, connecting happens in the background."""
+        policy = policy or camera_policy(cam_id)
+        if policy not in BACKPRESSURE_POLICIES:
+            raise ValueError(f"Policy backpressure tidak dikenal: {policy} (pilihan: {', '.join(BACKPRESSURE_POLICIES)})")
+        asyncio.run_coroutine_threadsafe(
+            self._add(cam_id, url, log_path, width, height, detect_every, frame_queue, frame_ready, policy),
+            self._loop)
+
+    def remove_camera(self, cam_id, timeout=10.0):
+        """Stop a camera and wait until its task has ended."""
+        asyncio.run_coroutine_threadsafe(self._remove(cam_id), self._loop).result(timeout)
+
+    def cameras(self):
+        """{cam_id: {"state", "since_s", "failures", "frames", "dropped", "policy"}}."""
+        now = time.monotonic()
+        return {cid: {"state": cam.state, "since_s": round(now - cam.state_since, 1), "failures": cam.failures,
+                      "frames": cam.seq, "dropped": cam.dropped, "policy": cam.policy}
+                for cid, cam in list(self._cams.items())}
+
+    def shutdown(self, timeout=10.0):
+        if not self._loop.is_running():
+            return
+        try:
+            asyncio.run_coroutine_threadsafe(self._stop_all(), self._loop).result(timeout)
+        except Exception as e:
+            logging.warning(f"[StreamSupervisor] shutdown: {e}")
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout=timeout)
+        for pool in (self._open_pool, self._decode_pool, self._recovery_pool, self._process_pool):
+            pool.shutdown(wait=False)
+        logging.info("[StreamSupervisor] shutdown")
+
+    # ---- loop side ----
+    async def _add(self, cam_id, url, log_path, width, height, detect_every, frame_queue, frame_ready, policy):
+        await self._remove(cam_id)
+        cam = _Camera(cam_id, url, log_path, width, height, detect_every, frame_queue, frame_ready, policy)
+        self._cams[cam_id] = cam
+        REGISTRY.set_gauge(cam.label, "stream_state", HEALTH_STATES.index(cam.state))
+        cam.task = asyncio.get_running_loop().create_task(self._camera_main(cam))
+
+    async def _remove(self, cam_id):
+        cam = self._cams.pop(cam_id, None)
+        if cam is None or cam.task is None:
+            return
+        cam.task.cancel()
+        try:
+            await cam.task
+        except (asyncio.CancelledError, Exception):
+            pass
+
+    async def _stop_all(self):
+        for cam_id in list(self._cams):
+            await self._remove(cam_id)
+        self._health_task.cancel()
+
+    def _make_pipeline(self, cam):
+        # pool thread: the first pipeline may have to load the model
+        init_log_file(cam.log_path)
+        return CameraPipeline(cam.cam_id, cam.width, cam.height, cam.detect_every, cam.log_path)
+
+    async def _camera_main(self, cam):
+        made = self._open_pool.submit(self._make_pipeline, cam)
+        try:
+            try:
+                cam.pipeline = await asyncio.wrap_future(made)
+            except asyncio.CancelledError:
+                # stopped while the pipeline was still being built
+                made.add_done_callback(_close_built)
+                raise
+            write_log_csv(cam.log_path, "INFO", f"Async worker started for cam{cam.cam_id}: {redact_url(cam.url)} "
+                                                f"(backpressure {cam.policy})")
+            if hasattr(cam.frame_queue, "qsize"):
+                REGISTRY.register_gauge(cam.label, "queue_depth", cam.frame_queue.qsize)
+            await asyncio.gather(self._capture(cam), self._process(cam))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logging.exception(f"[StreamSupervisor] cam{cam.cam_id}: {e}")
+            write_log_csv(cam.log_path, "ERROR", f"Async worker error: {e}")
+        finally:
+            self._release(cam)
+            REGISTRY.unregister(cam.label)
+            pipeline = cam.pipeline
+            if pipeline is not None:
+                # close after a frame still being processed in the pool
+                if cam.process_future is not None and not cam.process_future.done():
+                    cam.process_future.add_done_callback(lambda _: pipeline.close())
+                else:
+                    pipeline.close()
+                write_log_csv(cam.log_path, "INFO", f"Async worker stopped for cam{cam.cam_id}")
+
+    def _set_state(self, cam, state):
+        if state == cam.state:
+            return
+        level = logging.WARNING if state in ("degraded", "dead") else logging.INFO
+        logging.log(level, f"[StreamSupervisor] {cam.label}: {cam.state} -> {state} ({cam.url})")
+        cam.state = state
+        cam.state_since = time.monotonic()
+        REGISTRY.set_gauge(cam.label, "stream_state", HEALTH_STATES.index(state))
+
+    def _release(self, cam):
+        cap, fut = cam.cap, cam.read_future
+        cam.cap = None
+        if cap is None:
+            return
+        if fut is not None and not fut.done():
+            # never release under a read that is still running in the decode pool
+            fut.add_done_callback(lambda _: _release_cap(cap))
+        else:
+            # release of a broken stream can block as well
+            self._recovery_pool.submit(_release_cap, cap)
+
+    async def _connect(self, cam):
+        """One open attempt in the open pool; backs off (without a thread) on failure."""
+        if cam.state != "dead":
+            self._set_state(cam, "connecting")
+        cap = await asyncio.get_running_loop().run_in_executor(self._open_pool, open_capture, cam.url)
+        if cap.isOpened():
+            cam.cap = cap
+            logging.info(f"[StreamSupervisor] {cam.label}: opened {cam.url}")
+            return
+        self._recovery_pool.submit(_release_cap, cap)
+        cam.failures += 1
+        if cam.failures >= RTSP_MAX_RETRIES:
+            # circuit open: probe only every RTSP_DEAD_RETRY_INTERVAL
+            self._set_state(cam, "dead")
+        await asyncio.sleep(backoff_delay(cam.failures, dead=cam.state == "dead"))
+
+    async def _capture(self, cam):
+        while True:
+            try:
+                if cam.cap is None:
+                    await self._connect(cam)
+                    continue
+                t0 = time.perf_counter()
+                pool = self._decode_pool if cam.state == "live" else self._recovery_pool
+                cam.read_future = pool.submit(cam.cap.read)
+                ok, frame = await asyncio.wrap_future(cam.read_future)
+                if not ok or frame is None:
+                    # end of stream, socket error or read timeout
+                    self._release(cam)
+                    cam.failures += 1
+                    REGISTRY.inc(cam.label, "reconnects")
+                    self._set_state(cam, "degraded")
+                    await asyncio.sleep(backoff_delay(cam.failures))
+                    continue
+                now = time.monotonic()
+                cam.seq += 1
+                cam.last_frame = now
+                if cam.state != "live":
+                    cam.failures = 0
+                    self._set_state(cam, "live")
+                # includes the wait for a free decode thread
+                REGISTRY.observe(cam.label, "capture", time.perf_counter() - t0)
+                REGISTRY.inc(cam.label, "frames_captured")
+                self._push(cam, (cam.seq, now, getattr(cam.cap, "last_keyframe", False), frame))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.exception(f"[StreamSupervisor] {cam.label} capture: {e}")
+                self._release(cam)
+                await asyncio.sleep(0.5)
+
+    def _push(self, cam, item):
+        """Queue a frame for the process stage according to the camera policy."""
+        if len(cam.pending) >= cam.depth:
+            victim = 0
+            if cam.policy == "keyframe":
+                victim = next((i for i, it in enumerate(cam.pending) if not it[2]), 0)
+            del cam.pending[victim]
+            cam.dropped += 1
+            REGISTRY.inc(cam.label, "dropped_capture")
+        cam.pending.append(item)
+        cam.wakeup.set()
+
+    def _process_frame(self, cam, frame):
+        # process pool thread
+        proc, _, _ = cam.pipeline.process(frame)
+        if not is_watched(cam.frame_ready):
+            return proc
+        with REGISTRY.timer(cam.label, "draw"):
+            return draw_tracks(proc, cam.pipeline.tracker)
+
+    async def _process(self, cam):
+        while True:
+            await cam.wakeup.wait()
+            cam.wakeup.clear()
+            while cam.pending:
+                _, captured, _, frame = cam.pending.popleft()
+                cam.process_future = self._process_pool.submit(self._process_frame, cam, frame)
+                try:
+                    annotated = await asyncio.wrap_future(cam.process_future)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    write_log_csv(cam.log_path, "ERROR", f"Process error: {e}")
+                    continue
+                publish_frame(cam.frame_queue, annotated, cam.frame_ready, cam.label)
+                age = time.monotonic() - captured
+                REGISTRY.observe(cam.label, "frame_age", age)
+                dropped, cam._dropped_seen = cam.dropped - cam._dropped_seen, cam.dropped
+                cam.monitor.update(dropped, age)
+
+    async def _health(self):
+        """Stall check: live cameras whose reads stopped delivering are degraded."""
+        while True:
+            await asyncio.sleep(1.0)
+            now = time.monotonic()
+            for cam in list(self._cams.values()):
+                if cam.state == "live" and now - cam.last_frame > RTSP_READ_TIMEOUT:
+                    self._set_state(cam, "degraded")
@@ -49,8 +49,7 @@
 
 # tracker.py
 import numpy as np
-from collections import deque
-from utils import iou
+from utils import iou_matrix
 
 try:
     # try to use scipy for optimal assignment
@@ -59,109 +58,364 @@ try:
 except Exception:
     SCIPY_AVAILABLE = False
 
+from config import TRACKER_MOTION_MODEL
+
+# constant-velocity Kalman noise, as a fraction of box height (SORT/DeepSORT style)
+_STD_POS = 1.0 / 20
+_STD_VEL = 1.0 / 160
+# chi-square 0.95 quantile, 4 dof: gate for the motion-based second matching stage
+_GATE_CHI2 = 9.4877
+
+def xyxy_to_cxcywh(boxes):
+    boxes = np.asarray(boxes, dtype=float)
+    out = np.empty_like(boxes)
+    out[..., 0] = (boxes[..., 0] + boxes[..., 2]) / 2
+    out[..., 1] = (boxes[..., 1] + boxes[..., 3]) / 2
+    out[..., 2] = boxes[..., 2] - boxes[..., 0]
+    out[..., 3] = boxes[..., 3] - boxes[..., 1]
+    return out
+
+def cxcywh_to_xyxy(boxes):
+    boxes = np.asarray(boxes, dtype=float)
+    out = np.empty_like(boxes)
+    out[..., 0] = boxes[..., 0] - boxes[..., 2] / 2
+    out[..., 1] = boxes[..., 1] - boxes[..., 3] / 2
+    out[..., 2] = boxes[..., 0] + boxes[..., 2] / 2
+    out[..., 3] = boxes[..., 1] + boxes[..., 3] / 2
+    return out
+
+def greedy_match(ious, threshold):
+    """
+    Greedy IoU assignment: take pairs in descending IoU order, skipping rows/columns
+    already used. Ties keep (det, track) row-major order, like a stable sort.
+    Only pairs >= threshold are sorted, so cost is O(K log K) for K candidate pairs.
+    Returns (det_idx, track_idx) int arrays.
+    """
+    cand_d, cand_t = np.nonzero(ious >= threshold)
+    if len(cand_d) == 0:
+        return np.zeros(0, dtype=int), np.zeros(0, dtype=int)
+    order = np.argsort(-ious[cand_d, cand_t], kind="stable")
+    cand_d, cand_t = cand_d[order], cand_t[order]
+
+    # common case: no det or track competes for two partners -> all pairs accepted
+    if len(np.unique(cand_d)) == len(cand_d) and len(np.unique(cand_t)) == len(cand_t):
+        return cand_d, cand_t
+
+    used_d = np.zeros(ious.shape[0], dtype=bool)
+    used_t = np.zeros(ious.shape[1], dtype=bool)
+    keep = np.zeros(len(cand_d), dtype=bool)
+    for k, (d, t) in enumerate(zip(cand_d.tolist(), cand_t.tolist())):
+        if used_d[d] or used_t[t]:
+            continue
+        used_d[d] = True
+        used_t[t] = True
+        keep[k] = True
+    return cand_d[keep], cand_t[keep]
+
+class TrackTable:
+    """
+    Struct-of-arrays store for live tracks. Rows [0:n) are live, in creation order.
+    Columns are preallocated NumPy arrays that only grow (capacity doubles), so a
+    long-running camera does not allocate per track or per frame:
+    - bbox (cap,4) float [x1,y1,x2,y2], ids / hits / miss (cap,) int
+    - history (cap,H,4) ring buffer of matched boxes with hist_pos / hist_len
+    - mean / vel (cap,4) constant-velocity state in [cx,cy,w,h], with per-coordinate
+      2x2 covariance stored as p_pos / p_cov / p_vel (cap,4)
+    """
+    def __init__(self, capacity=64, max_history=30):
+        self.n = 0
+        self.max_history = int(max_history)
+        self._alloc(max(1, int(capacity)))
+
+    def _alloc(self, cap):
+        self.capacity = cap
+        self.bbox = np.zeros((cap, 4), dtype=float)
+        self.ids = np.zeros(cap, dtype=np.int64)
+        self.hits = np.zeros(cap, dtype=np.int64)
+        self.miss = np.zeros(cap, dtype=np.int64)
+        self.history = np.zeros((cap, self.max_history, 4), dtype=float)
+        self.hist_pos = np.zeros(cap, dtype=np.int64)
+        self.hist_len = np.zeros(cap, dtype=np.int64)
+        self.mean = np.zeros((cap, 4), dtype=float)
+        self.vel = np.zeros((cap, 4), dtype=float)
+        self.p_pos = np.zeros((cap, 4), dtype=float)
+        self.p_cov = np.zeros((cap, 4), dtype=float)
+        self.p_vel = np.zeros((cap, 4), dtype=float)
+
+    def _columns(self):
+        return ("bbox", "ids", "hits", "miss", "history", "hist_pos", "hist_len",
+                "mean", "vel", "p_pos", "p_cov", "p_vel")
+
+    def __len__(self):
+        return self.n
+
+    def reserve(self, need):
+        """Grow capacity (doubling) so at least `need` rows fit."""
+        if need <= self.capacity:
+            return
+        cap = self.capacity
+        while cap < need:
+            cap *= 2
+        old = {name: getattr(self, name) for name in self._columns()}
+        self._alloc(cap)
+        for name, arr in old.items():
+            getattr(self, name)[:self.n] = arr[:self.n]
+
+    def add(self, bboxes, first_id):
+        """Append new tracks (hits=1, empty history) with consecutive ids."""
+        k = len(bboxes)
+        if k == 0:
+            return
+        self.reserve(self.n + k)
+        rows = slice(self.n, self.n + k)
+        self.bbox[rows] = bboxes
+        self.ids[rows] = np.arange(first_id, first_id + k)
+        self.hits[rows] = 1
+        self.miss[rows] = 0
+        self.hist_pos[rows] = 0
+        self.hist_len[rows] = 0
+        self.mean[rows] = xyxy_to_cxcywh(bboxes)
+        self.vel[rows] = 0.0
+        h = np.maximum(self.mean[rows, 3:4], 1.0)
+        self.p_pos[rows] = (2 * _STD_POS * h) ** 2
+        self.p_cov[rows] = 0.0
+        self.p_vel[rows] = (10 * _STD_VEL * h) ** 2
+        self.n += k
+
+    def predict_motion(self):
+        """Advance every live track one frame with the constant-velocity model."""
+        n = self.n
+        if n == 0:
+            return
+        h = np.maximum(self.mean[:n, 3:4], 1.0)
+        mean, vel = self.mean[:n], self.vel[:n]
+        p_pos, p_cov, p_vel = self.p_pos[:n], self.p_cov[:n], self.p_vel[:n]
+        mean += vel
+        np.maximum(mean[:, 2:], 1.0, out=mean[:, 2:])
+        # P = F P F^T + Q with F = [[1,1],[0,1]] per coordinate
+        p_pos += 2 * p_cov + p_vel + (_STD_POS * h) ** 2
+        p_cov += p_vel
+        p_vel += (_STD_VEL * h) ** 2
+        self.bbox[:n] = cxcywh_to_xyxy(mean)
+
+    def correct_motion(self, rows, bboxes):
+        """Kalman update of matched rows with measured xyxy boxes; returns corrected xyxy."""
+        if len(rows) == 0:
+            return np.zeros((0, 4), dtype=float)
+        z = xyxy_to_cxcywh(bboxes)
+        h = np.maximum(self.mean[rows, 3:4], 1.0)
+        p_pos, p_cov, p_vel = self.p_pos[rows], self.p_cov[rows], self.p_vel[rows]
+        s = p_pos + (_STD_POS * h) ** 2
+        k_pos = p_pos / s
+        k_vel = p_cov / s
+        resid = z - self.mean[rows]
+        self.mean[rows] += k_pos * resid
+        self.vel[rows] += k_vel * resid
+        self.p_pos[rows] = (1 - k_pos) * p_pos
+        self.p_cov[rows] = (1 - k_pos) * p_cov
+        self.p_vel[rows] = p_vel - k_vel * p_cov
+        return cxcywh_to_xyxy(self.mean[rows])
+
+    def motion_distance(self, rows, bboxes):
+        """Squared Mahalanobis distance (k,len(rows)) of xyxy boxes from predicted states."""
+        z = xyxy_to_cxcywh(bboxes)
+        h = np.maximum(self.mean[rows, 3:4], 1.0)
+        var = self.p_pos[rows] + (_STD_POS * h) ** 2
+        resid = z[:, None, :] - self.mean[rows][None, :, :]
+        return (resid ** 2 / var[None, :, :]).sum(axis=2)
+
+    def update_rows(self, rows, bboxes):
+        """Matched tracks: set bbox, bump hits, reset miss, push bbox into history."""
+        if len(rows) == 0:
+            return
+        self.bbox[rows] = bboxes
+        self.hits[rows] += 1
+        self.miss[rows] = 0
+        self.history[rows, self.hist_pos[rows]] = bboxes
+        self.hist_pos[rows] = (self.hist_pos[rows] + 1) % self.max_history
+        self.hist_len[rows] = np.minimum(self.hist_len[rows] + 1, self.max_history)
+
+    def compact(self, keep):
+        """Drop rows where keep (bool, len n) is False, preserving order."""
+        idx = np.flatnonzero(keep)
+        if len(idx) == self.n:
+            return
+        k = len(idx)
+        for name in self._columns():
+            col = getattr(self, name)
+            col[:k] = col[idx]
+        self.n = k
+
+    def history_of(self, row):
+        """Chronological (L,4) copy of a row's history ring."""
+        length = int(self.hist_len[row])
+        if length == 0:
+            return np.zeros((0, 4), dtype=float)
+        start = (int(self.hist_pos[row]) - length) % self.max_history
+        order = (start + np.arange(length)) % self.max_history
+        return self.history[row, order]
+
 class Track:
-    def __init__(self, bbox, track_id):
-        self.bbox = np.array(bbox, dtype=float)  # [x1,y1,x2,y2]
-        self.track_id = int(track_id)
-        self.hits = 1
-        self.miss = 0
-        self.max_history = 30
-        self.history = deque(maxlen=self.max_history)
-
-    def update(self, bbox):
-        self.bbox = np.array(bbox, dtype=float)
-        self.hits += 1
-        self.miss = 0
-        self.history.append(self.bbox.copy())
-
-    def mark_missed(self):
-        self.miss += 1
+    """
+    Lightweight read view of one TrackTable row (bbox, track_id, hits, miss, history, velocity).
+    Views are bound to a row index, so they are valid until the next Tracker.update().
+    """
+    __slots__ = ("_table", "_row")
+
+    def __init__(self, table, row):
+        self._table = table
+        self._row = row
+
+    @property
+    def bbox(self):
+        return self._table.bbox[self._row]
+
+    @property
+    def track_id(self):
+        return int(self._table.ids[self._row])
+
+    @property
+    def hits(self):
+        return int(self._table.hits[self._row])
+
+    @property
+    def miss(self):
+        return int(self._table.miss[self._row])
+
+    @property
+    def history(self):
+        return self._table.history_of(self._row)
+
+    @property
+    def velocity(self):
+        """Per-frame [vcx,vcy,vw,vh] (zero unless the motion model is enabled)."""
+        return self._table.vel[self._row]
+
+    def __repr__(self):
+        return f"Track(id={self.track_id}, bbox={self.bbox.tolist()}, hits={self.hits}, miss={self.miss})"
 
 class Tracker:
-    def __init__(self, iou_threshold=0.3, max_lost=10):
-        self.tracks = []
+    """
+    IoU tracker over a TrackTable.
+    motion_model:
+    - "none": boxes stay where they were last detected
+    - "cv": constant-velocity Kalman filter; boxes are predicted every frame and
+      corrected when a detection matches. Call update(None) on frames without detection.
+    max_lost counts detection rounds, not frames.
+    """
+    def __init__(self, iou_threshold=0.3, max_lost=10, capacity=64, max_history=30,
+                 motion_model=TRACKER_MOTION_MODEL):
+        if motion_model not in ("none", "cv"):
+            raise ValueError(f"motion_model tidak dikenal: {motion_model}")
+        self.motion_model = motion_model
+        self.table = TrackTable(capacity, max_history)
+        self._views = []
         self.next_id = 0
         self.iou_threshold = iou_threshold
         self.max_lost = max_lost
 
-    def _associate(self, detections):
+    @property
+    def tracks(self):
         """
-        Return matches list of (det_idx, track_idx), unmatched_dets, unmatched_tracks
+        Views of the live tracks, in creation order (oldest first).
+        The Track objects are re-used views of table rows: they are only valid until the
+        next update(), which may compact rows under them. Copy .bbox / .track_id to keep them.
         """
-        if len(self.tracks) == 0:
-            return [], list(range(len(detections))), []
+        n = self.table.n
+        while len(self._views) < n:
+            self._views.append(Track(self.table, len(self._views)))
+        return self._views[:n]
 
-        if len(detections) == 0:
-            return [], [], list(range(len(self.tracks)))
+    @property
+    def boxes(self):
+        """(n,4) view of live track boxes."""
+        return self.table.bbox[:self.table.n]
 
-        iou_matrix = np.zeros((len(detections), len(self.tracks)), dtype=float)
-        for d, det in enumerate(detections):
-            for t, tr in enumerate(self.tracks):
-                iou_matrix[d, t] = iou(det[:4], tr.bbox)
+    @property
+    def ids(self):
+        """(n,) view of live track ids."""
+        return self.table.ids[:self.table.n]
 
-        # convert to cost (maximize IoU -> minimize -IoU)
-        cost = -iou_matrix
+    @property
+    def velocities(self):
+        """(n,4) view of live track velocities [vcx,vcy,vw,vh] per frame."""
+        return self.table.vel[:self.table.n]
+
+    def _associate(self, detections):
+        """
+        Return matches (det_idx, track_idx) int arrays, plus boolean masks
+        det_matched (N,) and track_matched (M,)
+        """
+        n_det, n_tr = len(detections), self.table.n
+        det_matched = np.zeros(n_det, dtype=bool)
+        tr_matched = np.zeros(n_tr, dtype=bool)
+        empty = np.zeros(0, dtype=int)
+        if n_det == 0 or n_tr == 0:
+            return empty, empty, det_matched, tr_matched
+
+        ious = iou_matrix(detections[:, :4], self.boxes)
 
-        matches = []
         if SCIPY_AVAILABLE:
-            det_idx, tr_idx = linear_sum_assignment(cost)
-            for d, t in zip(det_idx, tr_idx):
-                if iou_matrix[d, t] >= self.iou_threshold:
-                    matches.append((d, t))
+            # maximize IoU -> minimize -IoU
+            det_idx, tr_idx = linear_sum_assignment(-ious)
+            ok = ious[det_idx, tr_idx] >= self.iou_threshold
+            det_idx, tr_idx = det_idx[ok], tr_idx[ok]
         else:
-            # greedy fallback
-            used_d = set()
-            used_t = set()
-            sorted_pairs = []
-            for d in range(iou_matrix.shape[0]):
-                for t in range(iou_matrix.shape[1]):
-                    sorted_pairs.append((iou_matrix[d,t], d, t))
-            sorted_pairs.sort(reverse=True, key=lambda x: x[0])  # highest IoU first
-            for val, d, t in sorted_pairs:
-                if d in used_d or t in used_t:
-                    continue
-                if val >= self.iou_threshold:
-                    used_d.add(d); used_t.add(t)
-                    matches.append((d,t))
-
-        matched_dets = [m[0] for m in matches]
-        matched_trs = [m[1] for m in matches]
-
-        unmatched_dets = [d for d in range(len(detections)) if d not in matched_dets]
-        unmatched_trs = [t for t in range(len(self.tracks)) if t not in matched_trs]
-
-        return matches, unmatched_dets, unmatched_trs
+            det_idx, tr_idx = greedy_match(ious, self.iou_threshold)
+
+        det_matched[det_idx] = True
+        tr_matched[tr_idx] = True
+
+        if self.motion_model == "cv" and not det_matched.all() and not tr_matched.all():
+            # second stage: boxes that moved too far for IoU (e.g. young tracks whose
+            # velocity is not learned yet), gated by the Kalman position uncertainty
+            rest_d = np.flatnonzero(~det_matched)
+            rest_t = np.flatnonzero(~tr_matched)
+            dist = self.table.motion_distance(rest_t, detections[rest_d, :4])
+            d2, t2 = greedy_match(-dist, -_GATE_CHI2)
+            d2, t2 = rest_d[d2], rest_t[t2]
+            det_matched[d2] = True
+            tr_matched[t2] = True
+            det_idx = np.concatenate([det_idx, d2])
+            tr_idx = np.concatenate([tr_idx, t2])
+
+        return det_idx, tr_idx, det_matched, tr_matched
 
     def update(self, detections, frame_info=None):
         """
-        detections: numpy array (N,5) [x1,y1,x2,y2,conf]
+        detections: numpy array (N,5) [x1,y1,x2,y2,conf], or None when the detector
+        did not run on this frame (tracks are only predicted, nothing is aged)
+        returns self.tracks: Track views in creation order, valid until the next update()
         """
-        detections = list(detections) if len(detections) else []
-        matches, unmatched_dets, unmatched_trs = self._associate(detections)
+        if self.motion_model == "cv":
+            self.table.predict_motion()
+        if detections is None:
+            return self.tracks
+
+        detections = np.asarray(detections, dtype=float)
+        if detections.size == 0:
+            detections = np.zeros((0, 5), dtype=float)
+        det_idx, tr_idx, det_matched, tr_matched = self._associate(detections)
 
-        updated = []
+        table = self.table
+        n_old = table.n
 
         # update matched tracks
-        for d_idx, t_idx in matches:
-            bbox = detections[d_idx][:4]
-            tr = self.tracks[t_idx]
-            tr.update(bbox)
-            updated.append(tr)
+        matched_boxes = detections[det_idx, :4]
+        if self.motion_model == "cv":
+            matched_boxes = table.correct_motion(tr_idx, matched_boxes)
+        table.update_rows(tr_idx, matched_boxes)
+
+        # increase miss count for unmatched tracks; expired ones are dropped below
+        missed = np.flatnonzero(~tr_matched)
+        table.miss[missed] += 1
 
         # create new tracks for unmatched detections
-        for d in unmatched_dets:
-            bbox = detections[d][:4]
-            new_tr = Track(bbox, self.next_id)
-            self.next_id += 1
-            updated.append(new_tr)
-
-        # increase miss count for unmatched tracks and keep if not expired
-        for t in unmatched_trs:
-            tr = self.tracks[t]
-            tr.mark_missed()
-            if tr.miss < self.max_lost:
-                updated.append(tr)
-            # else drop track
-
-        self.tracks = updated
+        new_boxes = detections[~det_matched, :4]
+        table.add(new_boxes, self.next_id)
+        self.next_id += len(new_boxes)
+
+        keep = np.ones(table.n, dtype=bool)
+        keep[:n_old] = table.miss[:n_old] < self.max_lost
+        table.compact(keep)
         return self.tracks
@@ -35,16 +35,17 @@
 #     return interArea / float(boxAArea + boxBArea - interArea + 1e-5)
 
 # utils.py
+import re
 import cv2
+import numpy as np
 
 def draw_boxes(frame, tracks):
-    for track in tracks:
-        x1, y1, x2, y2 = map(int, track.bbox)
-        track_id = track.track_id
-        cv2.rectangle(frame, (x1, y1), (x2, y2), (0,255,0), 2)
-        cv2.putText(frame, f'ID {track_id}', (x1, max(15, y1 - 10)),
-                    cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0,255,0), 2)
-    return frame
+    """Draw a list of tracks (objects with .bbox / .track_id); prefer render.draw_tracks(frame, tracker)."""
+    from render import RENDERER
+    if len(tracks) == 0:
+        return frame
+    boxes = np.array([t.bbox for t in tracks], dtype=float)
+    return RENDERER.draw(frame, boxes, [t.track_id for t in tracks])
 
 def draw_boxes_from_detections(frame, detections):
     for det in detections:
@@ -67,3 +68,72 @@ def iou(boxA, boxB):
     boxAArea = max(1, (boxA[2] - boxA[0])) * max(1, (boxA[3] - boxA[1]))
     boxBArea = max(1, (boxB[2] - boxB[0])) * max(1, (boxB[3] - boxB[1]))
     return interArea / float(boxAArea + boxBArea - interArea + 1e-5)
+
+def iou_matrix(boxesA, boxesB):
+    """
+    Batched IoU: boxesA (N,4+), boxesB (M,4+) -> (N,M) float array.
+    Same formula as iou() (areas clamped to >= 1, +1e-5 in the denominator).
+    """
+    a = np.asarray(boxesA, dtype=float)
+    b = np.asarray(boxesB, dtype=float)
+    a = a.reshape(-1, a.shape[-1])[:, :4] if a.size else np.zeros((0, 4))
+    b = b.reshape(-1, b.shape[-1])[:, :4] if b.size else np.zeros((0, 4))
+    if len(a) == 0 or len(b) == 0:
+        return np.zeros((len(a), len(b)), dtype=float)
+    xA = np.maximum(a[:, None, 0], b[None, :, 0])
+    yA = np.maximum(a[:, None, 1], b[None, :, 1])
+    xB = np.minimum(a[:, None, 2], b[None, :, 2])
+    yB = np.minimum(a[:, None, 3], b[None, :, 3])
+    interArea = np.maximum(0, xB - xA) * np.maximum(0, yB - yA)
+    areaA = np.maximum(1, a[:, 2] - a[:, 0]) * np.maximum(1, a[:, 3] - a[:, 1])
+    areaB = np.maximum(1, b[:, 2] - b[:, 0]) * np.maximum(1, b[:, 3] - b[:, 1])
+    return interArea / (areaA[:, None] + areaB[None, :] - interArea + 1e-5)
+
+def nms(dets, iou_thresh=0.5, metric="iou", order=None, groups=None):
+    """
+    Greedy non-maximum suppression on (N,5+) [x1,y1,x2,y2,conf].
+    metric: "iou", or "ios" (intersection over the smaller box, merges partial boxes).
+    order: optional priority order of rows (default: confidence descending).
+    groups: optional (N,) labels; a box only suppresses boxes of another group
+    (e.g. tile index: duplicates across seams go, boxes of one tile stay as returned).
+    Returns indices of kept rows, in priority order.
+    """
+    dets = np.asarray(dets, dtype=float)
+    if len(dets) == 0:
+        return np.zeros(0, dtype=int)
+    if order is None:
+        order = np.argsort(-dets[:, 4], kind="stable")
+    x1, y1, x2, y2 = dets[:, 0], dets[:, 1], dets[:, 2], dets[:, 3]
+    areas = np.maximum(x2 - x1, 1e-6) * np.maximum(y2 - y1, 1e-6)
+    keep = []
+    while order.size:
+        i = order[0]
+        keep.append(i)
+        rest = order[1:]
+        w = np.maximum(0, np.minimum(x2[i], x2[rest]) - np.maximum(x1[i], x1[rest]))
+        h = np.maximum(0, np.minimum(y2[i], y2[rest]) - np.maximum(y1[i], y1[rest]))
+        inter = w * h
+        if metric == "ios":
+            overlap = inter / np.minimum(areas[i], areas[rest])
+        else:
+            overlap = inter / (areas[i] + areas[rest] - inter)
+        suppress = overlap > iou_thresh
+        if groups is not None:
+            suppress &= groups[rest] != groups[i]
+        order = rest[~suppress]
+    return np.array(keep, dtype=int)
+
+def scale_boxes(dets, src_shape, dst_shape):
+    """Rescale (N,5) detections from an image of src_shape (h,w,...) to dst_shape."""
+    dets = np.array(dets, dtype=float).reshape(-1, 5)
+    sx = dst_shape[1] / float(src_shape[1])
+    sy = dst_shape[0] / float(src_shape[0])
+    dets[:, [0, 2]] *= sx
+    dets[:, [1, 3]] *= sy
+    return dets
+
+_URL_CREDENTIALS = re.compile(r"^([a-z][a-z0-9+.-]*://)[^/@\s]*@", re.IGNORECASE)
+
+def redact_url(url):
+    """Stream URL with its user:password@ part masked, for the UI and downloadable logs."""
+    return _URL_CREDENTIALS.sub(r"\1***@", str(url))
@@ -8,9 +8,12 @@ from streamlit_webrtc import VideoProcessorBase
 from detector import Detector
 from tracker import Tracker
 from rtsp_handler import RTSPStream
-from utils import draw_boxes
+from render import draw_tracks
+from scheduler import DetectionScheduler
+from motion_gate import MotionGate
 from config import (RTSP_FRAME_WIDTH, RTSP_FRAME_HEIGHT, RTSP_DETECT_EVERY,
-                    FRAME_WIDTH, FRAME_HEIGHT, UPLOAD_DETECT_EVERY)
+                    FRAME_WIDTH, FRAME_HEIGHT, UPLOAD_DETECT_EVERY,
+                    MOTION_GATE_ENABLED)
 
 class VideoProcessor(VideoProcessorBase):
     """
@@ -24,14 +27,16 @@ class VideoProcessor(VideoProcessorBase):
         self.detector = Detector()
         self.tracker = Tracker()
         self.frame_count = 0
-        self.last_detections = []
         self.rtsp = None
+        self.gate = None
         self.running = True
 
         if self.mode == "rtsp":
             self.width = RTSP_FRAME_WIDTH
             self.height = RTSP_FRAME_HEIGHT
             self.detect_every = RTSP_DETECT_EVERY
+            if MOTION_GATE_ENABLED:
+                self.gate = MotionGate()
             if rtsp_url:
                 # instantiate background RTSP reader
                 self.rtsp = RTSPStream(rtsp_url)
@@ -39,6 +44,7 @@ class VideoProcessor(VideoProcessorBase):
             self.width = FRAME_WIDTH
             self.height = FRAME_HEIGHT
             self.detect_every = UPLOAD_DETECT_EVERY
+        self.scheduler = DetectionScheduler(self.detect_every, name=f"webrtc-{self.mode}")
 
     def _get_frame_from_source(self, input_frame):
         # 1) Try RTSP frame first
@@ -82,29 +88,41 @@ class VideoProcessor(VideoProcessorBase):
         try:
             proc = cv2.resize(src, (self.width, self.height))
         except Exception:
-            proc = src
+            # RTSP frames are read-only views into the reader's ring buffer
+            proc = src.copy()
 
         self.frame_count += 1
 
-        # Detection every N frames
-        if self.frame_count % self.detect_every == 0:
+        # Detection on frames chosen by the adaptive scheduler, unless nothing moved
+        detect_now = self.scheduler.should_detect()
+        gated = detect_now and self.gate is not None and not self.gate.should_infer(proc)
+        if gated:
+            detect_now = False
+        latency = None
+        if detect_now:
+            t0 = time.monotonic()
             try:
                 detections = self.detector.detect(proc)
             except Exception:
                 detections = []
-            self.last_detections = detections
+            latency = time.monotonic() - t0
         else:
-            detections = self.last_detections
+            # no detection on this frame: tracker predicts track motion
+            detections = None
 
         # Update tracker
         try:
-            tracks = self.tracker.update(detections, {"img_shape": proc.shape, "img_size": proc.shape[:2]})
+            self.tracker.update(detections, {"img_shape": proc.shape, "img_size": proc.shape[:2]})
         except Exception:
-            tracks = []
+            pass
+
+        if detect_now or gated:
+            self.scheduler.report(latency, self.tracker,
+                                  motion=self.gate.level if self.gate else None)
 
         # Draw boxes
         try:
-            annotated = draw_boxes(proc, tracks)
+            annotated = draw_tracks(proc, self.tracker)
         except Exception:
             annotated = proc
 
@@ -118,6 +136,7 @@ class VideoProcessor(VideoProcessorBase):
 
     def stop(self):
         self.running = False
+        self.scheduler.close()
         if self.rtsp:
             try:
                 self.rtsp.stop()